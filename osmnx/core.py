@@ -7,19 +7,31 @@
 ################################################################################
 
 import geopandas as gpd
+import json
 import logging as lg
 import math
 import networkx as nx
 import numpy as np
+import os
 import pandas as pd
+import re
+import sys
+import tempfile
 import time
+import xml.parsers.expat
 
+from array import array
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
 from itertools import groupby
 from shapely.geometry import LineString
 from shapely.geometry import MultiPolygon
 from shapely.geometry import Point
 from shapely.geometry import Polygon
 from shapely.ops import unary_union
+from shapely.prepared import prep
 
 from . import settings
 from .projection import project_geometry
@@ -31,11 +43,25 @@ from .utils import great_circle_vec
 from .geo_utils import get_nearest_node
 from .geo_utils import geocode
 from .geo_utils import count_streets_per_node
-from .geo_utils import overpass_json_from_file
+from .geo_utils import _open_osm_file
+from .geo_utils import bbox_to_poly
+from .downloader import osm_lookup_download
 from .downloader import osm_polygon_download
 from .downloader import get_osm_filter
-from .downloader import overpass_request
+from .downloader import overpass_requests_parallel
+from .downloader import osm_filter_matches
+from .downloader import parse_osm_filter
+from .downloader import ColumnarElements
 from .errors import *
+from .osm_pbf_reader import get_pbf_blocks
+from .osm_pbf_reader import read_pbf_block
+
+# shapely 2 tests points against a geometry vectorized, faster than testing them
+# one at a time against a prepared geometry
+try:
+    from shapely import intersects_xy
+except ImportError:
+    intersects_xy = None
 
 def gdf_from_place(query, gdf_name=None, which_result=1, buffer_dist=None):
     """
@@ -117,8 +143,7 @@ def gdf_from_places(queries, gdf_name='unnamed', buffer_dist=None, which_results
     Parameters
     ----------
     queries : list
-        list of query strings or structured query dicts to geocode/download, one
-        at a time
+        list of query strings or structured query dicts to geocode/download
     gdf_name : string
         name attribute metadata for GeoDataFrame (this is used to save shapefile
         later)
@@ -132,32 +157,153 @@ def gdf_from_places(queries, gdf_name='unnamed', buffer_dist=None, which_results
     -------
     GeoDataFrame
     """
-    # create an empty GeoDataFrame then append each result as a new row, checking for the presence of which_results
-    gdf = gpd.GeoDataFrame()
     if which_results is not None:
         assert len(queries) == len(which_results), 'which_results list length must be the same as queries list length'
-        for query, which_result in zip(queries, which_results):
-            gdf = gdf.append(gdf_from_place(query, buffer_dist=buffer_dist, which_result=which_result))
     else:
-        for query in queries:
-            gdf = gdf.append(gdf_from_place(query, buffer_dist=buffer_dist))
-
-    # reset the index, name the GeoDataFrame
-    gdf = gdf.reset_index().drop(labels='index', axis=1)
+        which_results = 1
+    gdf = geocode_to_gdf(queries, which_results=which_results, buffer_dist=buffer_dist)
+    gdf = gdf[['geometry', 'place_name', 'bbox_north', 'bbox_south', 'bbox_east', 'bbox_west']]
     gdf.gdf_name = gdf_name
+    return gdf
+
+
+def _normalize_query(query):
+    """
+    Normalize a place query so that trivially different spellings of it can
+    be recognized as the same place: collapse its whitespace, casefold it, and
+    sort the keys of a structured query dict.
+
+    Parameters
+    ----------
+    query : string or dict
+
+    Returns
+    -------
+    string or OrderedDict
+    """
+    if isinstance(query, str):
+        return ' '.join(query.split()).casefold()
+    elif isinstance(query, dict):
+        return OrderedDict((key, _normalize_query(query[key]) if isinstance(query[key], str) else query[key])
+                           for key in sorted(query))
+    else:
+        raise TypeError('query must be a dict or a string')
+
 
-    # set the original CRS of the GeoDataFrame to default_crs, and return it
-    gdf.crs = settings.default_crs
-    log('Finished creating GeoDataFrame with {} rows from {} queries'.format(len(gdf), len(queries)))
+def geocode_to_gdf(queries, which_results=1, by_osmid=False, buffer_dist=None, concurrent_requests=2):
+    """
+    Geocode a batch of place queries or OSM ids with the Nominatim API and
+    create a GeoDataFrame of their boundary geometries.
+
+    Queries are deduplicated by their normalized form, so each distinct place
+    is only requested once, spelled as it first appears in queries, and
+    requests already in the cache are served from there.
+    Place queries are then requested concurrently, as fast as
+    settings.rate_limits allows for the Nominatim host. OSM ids are looked up
+    in batches of 50 per request.
+
+    Parameters
+    ----------
+    queries : list
+        query strings or structured query dicts to geocode, or if by_osmid,
+        OSM ids prefixed by their type (e.g., 'R175905')
+    which_results : int or list
+        which result to use for each query (ignored if by_osmid), or a list of
+        one for each query
+    by_osmid : bool
+        if True, look up the queries as OSM ids instead of searching for them
+    buffer_dist : float
+        distance to buffer around the place geometries, in meters
+    concurrent_requests : int
+        max number of place queries to request concurrently
+
+    Returns
+    -------
+    GeoDataFrame
+        one row per query that returned a result, in the order of queries,
+        with its query, place_name, osm_type, osm_id, lat, lon, and bounding
+        box
+    """
+    if by_osmid:
+        results = osm_lookup_download(queries)
+    else:
+        if isinstance(which_results, int):
+            which_results = [which_results] * len(queries)
+        elif len(which_results) != len(queries):
+            raise ValueError('which_results must be an int or a list of the same length as queries')
+        normalized = [_normalize_query(query) for query in queries]
+
+        # request each distinct query (and number of results) only once, with
+        # its original spelling, so it shares its cache entry with other
+        # functions requesting the same place
+        distinct = OrderedDict()
+        for query, normalized_query, which_result in zip(queries, normalized, which_results):
+            distinct.setdefault((json.dumps(normalized_query), which_result), (query, which_result))
+        log('Geocoding {:,} distinct places of {:,} queries'.format(len(distinct), len(queries)))
+
+        def download(args):
+            query, which_result = args
+            return osm_polygon_download(query, limit=which_result)
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrent_requests)) as executor:
+            responses = dict(zip(distinct, executor.map(download, distinct.values())))
+
+        results = []
+        for query, which_result in zip(normalized, which_results):
+            data = responses[(json.dumps(query), which_result)]
+            results.append(data[which_result - 1] if len(data) >= which_result else None)
+
+    features = []
+    for query, result in zip(queries, results):
+        if result is None:
+            log('OSM returned no results (or fewer than which_result) for query "{}"'.format(query), level=lg.WARNING)
+            continue
+        bbox_south, bbox_north, bbox_west, bbox_east = [float(x) for x in result['boundingbox']]
+        geometry = result.get('geojson', {'type': 'Point',
+                                          'coordinates': [float(result['lon']), float(result['lat'])]})
+        if geometry['type'] not in ['Polygon', 'MultiPolygon']:
+            log('OSM returned a {} as the geometry for query "{}".'.format(geometry['type'], query), level=lg.WARNING)
+        features.append({'type': 'Feature',
+                         'geometry': geometry,
+                         'properties': {'query': query if isinstance(query, str) else json.dumps(query),
+                                        'place_name': result['display_name'],
+                                        'osm_type': result.get('osm_type'),
+                                        'osm_id': result.get('osm_id'),
+                                        'lat': float(result['lat']),
+                                        'lon': float(result['lon']),
+                                        'bbox_north': bbox_north,
+                                        'bbox_south': bbox_south,
+                                        'bbox_east': bbox_east,
+                                        'bbox_west': bbox_west}})
+
+    # create the GeoDataFrame and set its original CRS to default_crs
+    columns = ['geometry', 'query', 'place_name', 'osm_type', 'osm_id', 'lat', 'lon',
+               'bbox_north', 'bbox_south', 'bbox_east', 'bbox_west']
+    if features:
+        gdf = gpd.GeoDataFrame.from_features(features, crs=settings.default_crs)[columns]
+    else:
+        gdf = gpd.GeoDataFrame(columns=columns, geometry='geometry', crs=settings.default_crs)
+    gdf.gdf_name = 'unnamed'
+
+    # if buffer_dist was passed in, project the geometries to UTM, buffer them
+    # in meters, then project them back to lat-long
+    if buffer_dist is not None and len(gdf) > 0:
+        gdf_utm = project_gdf(gdf)
+        gdf_utm['geometry'] = gdf_utm['geometry'].buffer(buffer_dist)
+        gdf = project_gdf(gdf_utm, to_latlong=True)
+        log('Buffered the GeoDataFrame to {} meters'.format(buffer_dist))
+
+    log('Created GeoDataFrame with {:,} rows from {:,} queries'.format(len(gdf), len(queries)))
     return gdf
 
 
-def osm_net_download(polygon=None, north=None, south=None, east=None, west=None,
-                     network_type='all_private', timeout=180, memory=None,
-                     max_query_area_size=50*1000*50*1000, infrastructure='way["highway"]',
-                     custom_filter=None, custom_settings=None):
+def get_osm_net_queries(polygon=None, north=None, south=None, east=None, west=None,
+                        network_type='all_private', timeout=180, memory=None,
+                        max_query_area_size=50*1000*50*1000, infrastructure='way["highway"]',
+                        custom_filter=None, custom_settings=None):
     """
-    Download OSM ways and nodes within some bounding box from the Overpass API.
+    Build the Overpass API queries for the OSM ways and nodes within some
+    polygon or bounding box, as osm_net_download requests them.
 
     Parameters
     ----------
@@ -194,7 +340,8 @@ def osm_net_download(polygon=None, north=None, south=None, east=None, west=None,
 
     Returns
     -------
-    response_jsons : list
+    datas : list
+        dicts of key-value parameters to post to the API, one per query
     """
 
     # check if we're querying by polygon or by bounding box based on which
@@ -211,7 +358,6 @@ def osm_net_download(polygon=None, north=None, south=None, east=None, west=None,
         osm_filter = custom_filter
     else:
         osm_filter = get_osm_filter(network_type)
-    response_jsons = []
 
     # pass server memory allocation in bytes for the query to the API
     # if None, pass nothing so the server will use its default allocation size
@@ -232,7 +378,27 @@ def osm_net_download(polygon=None, north=None, south=None, east=None, west=None,
     # specifying way["highway"] means that all ways returned must have a highway
     # key. the {filters} then remove ways by key/value. the '>' makes it recurse
     # so we get ways and way nodes. maxsize is in bytes.
-    if by_bbox:
+    if settings.overpass_tile_size is not None:
+        # snap the query area onto the global tile grid and request each tile
+        # that intersects it by its bounding box, so that overlapping queries
+        # share their cached tiles. the graph_from_ functions truncate the
+        # merged tiles back to the query area afterwards
+        if by_bbox:
+            polygon = Polygon([(west, south), (east, south), (east, north), (west, north)])
+        tile_bboxes = get_tile_bboxes(polygon, tile_size=settings.overpass_tile_size)
+        log('Requesting network data within {:,} tile(s) from API'.format(len(tile_bboxes)))
+
+        datas = []
+        for west, south, east, north in tile_bboxes:
+            query_template = '{overpass_settings};({infrastructure}{filters}({south:.6f},{west:.6f},{north:.6f},{east:.6f});>;);out;'
+            query_str = query_template.format(north=north, south=south,
+                                              east=east, west=west,
+                                              infrastructure=infrastructure,
+                                              filters=osm_filter,
+                                              overpass_settings=overpass_settings)
+            datas.append({'data':query_str})
+
+    elif by_bbox:
         # turn bbox into a polygon and project to local UTM
         polygon = Polygon([(west, south), (east, south), (east, north), (west, north)])
         geometry_proj, crs_proj = project_geometry(polygon)
@@ -242,10 +408,11 @@ def osm_net_download(polygon=None, north=None, south=None, east=None, west=None,
         geometry_proj_consolidated_subdivided = consolidate_subdivide_geometry(geometry_proj, max_query_area_size=max_query_area_size)
         geometry, _ = project_geometry(geometry_proj_consolidated_subdivided, crs=crs_proj, to_latlong=True)
         log('Requesting network data within bounding box from API in {:,} request(s)'.format(len(geometry)))
-        start_time = time.time()
 
         # loop through each polygon rectangle in the geometry (there will only
-        # be one if original bbox didn't exceed max area size)
+        # be one if original bbox didn't exceed max area size) to build the
+        # queries, then request them all
+        datas = []
         for poly in geometry:
             # represent bbox as south,west,north,east and round lat-longs to 6
             # decimal places (ie, ~100 mm) so URL strings aren't different
@@ -257,9 +424,7 @@ def osm_net_download(polygon=None, north=None, south=None, east=None, west=None,
                                               infrastructure=infrastructure,
                                               filters=osm_filter,
                                               overpass_settings=overpass_settings)
-            response_json = overpass_request(data={'data':query_str}, timeout=timeout)
-            response_jsons.append(response_json)
-        log('Got all network data within bounding box from API in {:,} request(s) and {:,.2f} seconds'.format(len(geometry), time.time()-start_time))
+            datas.append({'data':query_str})
 
     elif by_poly:
         # project to utm, divide polygon up into sub-polygons if area exceeds a
@@ -270,20 +435,72 @@ def osm_net_download(polygon=None, north=None, south=None, east=None, west=None,
         geometry, _ = project_geometry(geometry_proj_consolidated_subdivided, crs=crs_proj, to_latlong=True)
         polygon_coord_strs = get_polygons_coordinates(geometry)
         log('Requesting network data within polygon from API in {:,} request(s)'.format(len(polygon_coord_strs)))
-        start_time = time.time()
 
-        # pass each polygon exterior coordinates in the list to the API, one at
-        # a time
+        # build a query for each polygon exterior coordinates in the list, then
+        # pass them all to the API
+        datas = []
         for polygon_coord_str in polygon_coord_strs:
             query_template = '{overpass_settings};({infrastructure}{filters}(poly:"{polygon}");>;);out;'
             query_str = query_template.format(polygon=polygon_coord_str,
                                               infrastructure=infrastructure,
                                               filters=osm_filter,
                                               overpass_settings=overpass_settings)
-            response_json = overpass_request(data={'data':query_str}, timeout=timeout)
-            response_jsons.append(response_json)
-        log('Got all network data within polygon from API in {:,} request(s) and {:,.2f} seconds'.format(len(polygon_coord_strs), time.time()-start_time))
+            datas.append({'data':query_str})
 
+    return datas
+
+
+def osm_net_download(polygon=None, north=None, south=None, east=None, west=None,
+                     network_type='all_private', timeout=180, memory=None,
+                     max_query_area_size=50*1000*50*1000, infrastructure='way["highway"]',
+                     custom_filter=None, custom_settings=None):
+    """
+    Download OSM ways and nodes within some bounding box from the Overpass API.
+
+    Parameters
+    ----------
+    polygon : shapely Polygon or MultiPolygon
+        geographic shape to fetch the street network within
+    north : float
+        northern latitude of bounding box
+    south : float
+        southern latitude of bounding box
+    east : float
+        eastern longitude of bounding box
+    west : float
+        western longitude of bounding box
+    network_type : string
+        {'walk', 'bike', 'drive', 'drive_service', 'all', 'all_private'} what
+        type of street network to get
+    timeout : int
+        the timeout interval for requests and to pass to API
+    memory : int
+        server memory allocation size for the query, in bytes. If none, server
+        will use its default allocation size
+    max_query_area_size : float
+        max area for any part of the geometry in meters: any polygon bigger
+        will get divided up for multiple queries to API (default 50km x 50km)
+    infrastructure : string
+        download infrastructure of given type. default is streets, ie,
+        'way["highway"]') but other infrastructures may be selected like power
+        grids, ie, 'way["power"~"line"]'
+    custom_filter : string
+        a custom network filter to be used instead of the network_type presets
+    custom_settings : string
+        custom settings to be used in the overpass query instead of the default
+        ones
+
+    Returns
+    -------
+    response_jsons : list
+    """
+    datas = get_osm_net_queries(polygon=polygon, north=north, south=south, east=east, west=west,
+                                network_type=network_type, timeout=timeout, memory=memory,
+                                max_query_area_size=max_query_area_size, infrastructure=infrastructure,
+                                custom_filter=custom_filter, custom_settings=custom_settings)
+    start_time = time.time()
+    response_jsons = overpass_requests_parallel(datas, timeout=timeout)
+    log('Got all network data from API in {:,} request(s) and {:,.2f} seconds'.format(len(datas), time.time()-start_time))
     return response_jsons
 
 
@@ -327,6 +544,54 @@ def consolidate_subdivide_geometry(geometry, max_query_area_size):
     return geometry
 
 
+def get_tile_bboxes(geometry, tile_size):
+    """
+    Get the bounding boxes of the tiles of a fixed global grid that intersect a
+    geometry.
+
+    The grid is anchored at (0, 0) and its tiles are tile_size degrees wide
+    and tall, so any two geometries that overlap share the tiles they overlap
+    in, with identical bounding boxes (and thus identical query strings for
+    caching).
+
+    Parameters
+    ----------
+    geometry : shapely Polygon or MultiPolygon
+        the geometry, in lat-long, to cover with tiles
+    tile_size : float
+        the width and height of the tiles, in degrees
+
+    Returns
+    -------
+    tile_bboxes : list
+        list of (west, south, east, north) tuples, ordered by row then column
+    """
+
+    if not isinstance(geometry, (Polygon, MultiPolygon)):
+        raise TypeError('Geometry must be a shapely Polygon or MultiPolygon')
+
+    west, south, east, north = geometry.bounds
+    x_min = math.floor(west / tile_size)
+    y_min = math.floor(south / tile_size)
+    x_max = max(x_min, math.ceil(east / tile_size) - 1)
+    y_max = max(y_min, math.ceil(north / tile_size) - 1)
+
+    # round the tile edges so float error cannot make the same tile's query
+    # string differ between calls
+    prepared_geometry = prep(geometry)
+    tile_bboxes = []
+    for y in range(y_min, y_max + 1):
+        for x in range(x_min, x_max + 1):
+            bbox = (round(x * tile_size, 6), round(y * tile_size, 6),
+                    round((x + 1) * tile_size, 6), round((y + 1) * tile_size, 6))
+            tile = bbox_to_poly(north=bbox[3], south=bbox[1], east=bbox[2], west=bbox[0])
+            # skip tiles that only touch the geometry along an edge
+            if prepared_geometry.intersects(tile) and not prepared_geometry.touches(tile):
+                tile_bboxes.append(bbox)
+
+    return tile_bboxes
+
+
 def get_polygons_coordinates(geometry):
     """
     Extract exterior coordinates from polygon(s) to pass to OSM in a query by
@@ -450,6 +715,772 @@ def parse_osm_nodes_paths(osm_data):
     return nodes, paths
 
 
+def parse_osm_arrays(osm_data):
+    """
+    Construct arrays of the nodes and paths of an Overpass API response.
+
+    Nodes are stored as columns of ids and coordinates, and paths as
+    compressed sparse rows: path i's nodes (with consecutive duplicates
+    removed) are path_nodes[path_offsets[i]:path_offsets[i + 1]]. The useful
+    tags in settings.useful_tags_node and settings.useful_tags_path are
+    stored as object array columns, with None where an element lacks the tag.
+    If the response's elements are ColumnarElements (e.g., from a msgpack
+    cache file), their arrays are used directly.
+
+    Parameters
+    ----------
+    osm_data : dict
+        JSON response from from the Overpass API
+
+    Returns
+    -------
+    dict
+        node_ids, node_y, node_x, node_tags, path_ids, path_offsets,
+        path_nodes, and path_tags, where the tags are dicts of tag name to
+        column
+    """
+    elements = osm_data['elements']
+    columnar = elements if isinstance(elements, ColumnarElements) else None
+    if columnar is not None:
+        elements = columnar.others
+
+    # collect the plain elements' columns in lists, then convert them to arrays
+    node_ids, node_y, node_x, node_tags = [], [], [], []
+    path_ids, path_nodes, path_lengths, path_tags = [], [], [], []
+    for element in elements:
+        if element['type'] == 'node':
+            node_ids.append(element['id'])
+            node_y.append(element['lat'])
+            node_x.append(element['lon'])
+            node_tags.append(element.get('tags'))
+        elif element['type'] == 'way': #osm calls network paths 'ways'
+            path_ids.append(element['id'])
+            path_nodes.extend(element['nodes'])
+            path_lengths.append(len(element['nodes']))
+            path_tags.append(element.get('tags'))
+
+    node_ids = np.array(node_ids, dtype=np.int64)
+    node_y = np.array(node_y, dtype=np.float64)
+    node_x = np.array(node_x, dtype=np.float64)
+    path_ids = np.array(path_ids, dtype=np.int64)
+    path_nodes = np.array(path_nodes, dtype=np.int64)
+    path_offsets = np.concatenate([[0], np.cumsum(path_lengths, dtype=np.int64)]).astype(np.int64)
+
+    # the columnar elements come first, as they are iterated first
+    if columnar is not None:
+        node_ids = np.concatenate([columnar.node_ids, node_ids])
+        node_y = np.concatenate([columnar.node_lats, node_y])
+        node_x = np.concatenate([columnar.node_lons, node_x])
+        node_tags = list(columnar.node_tags) + node_tags
+        path_ids = np.concatenate([columnar.way_ids, path_ids])
+        path_nodes = np.concatenate([columnar.way_refs, path_nodes])
+        path_offsets = np.concatenate([columnar.way_offsets, columnar.way_offsets[-1] + path_offsets[1:]])
+        path_tags = list(columnar.way_tags) + path_tags
+
+    # remove any consecutive duplicate nodes within each path
+    path_offsets, path_nodes = _remove_consecutive_duplicates(path_offsets, path_nodes)
+
+    return {'node_ids': node_ids,
+            'node_y': node_y,
+            'node_x': node_x,
+            'node_tags': _get_tag_columns(node_tags, settings.useful_tags_node),
+            'path_ids': path_ids,
+            'path_offsets': path_offsets,
+            'path_nodes': path_nodes,
+            'path_tags': _get_tag_columns(path_tags, settings.useful_tags_path)}
+
+
+def parse_osm_xml_arrays(filename, chunk_size=1048576, way_filter=None, polygon=None):
+    """
+    Read an OSM XML file (optionally bz2 compressed) into arrays of its nodes
+    and paths, as parse_osm_arrays returns them for an Overpass API response.
+
+    The file is parsed incrementally with expat, straight into compact
+    columns: no element dicts are built, and only the tags in
+    settings.useful_tags_node and settings.useful_tags_path are kept. Memory
+    use is therefore proportional to the nodes and ways in the file rather
+    than to the size of its XML. Ways not passing way_filter are dropped as
+    soon as they end.
+
+    If a polygon is passed, nodes outside it are dropped in batches as they
+    are parsed, and so are ways without any node inside it, so that memory
+    use is proportional to the clipped data. The retained ways keep their
+    refs to dropped nodes, to split them there with split_paths_at_missing_nodes.
+    This relies on the file listing its nodes before its ways, as OSM files do.
+
+    Parameters
+    ----------
+    filename : string
+        the name of a file containing OSM XML data
+    chunk_size : int
+        how many bytes of the file to read and parse at a time
+    way_filter : list
+        if not None, clauses as returned by parse_osm_filter that a way's tags
+        must pass to keep it
+    polygon : shapely Polygon or MultiPolygon
+        if not None, the unprojected geometry to keep the nodes within
+
+    Returns
+    -------
+    dict
+        node_ids, node_y, node_x, node_tags, path_ids, path_offsets,
+        path_nodes, and path_tags
+    """
+    useful_tags_node = set(settings.useful_tags_node)
+    useful_tags_path = set(settings.useful_tags_path)
+
+    # while a way is parsed, also keep the tags its filter needs
+    filter_tags_path = set(key for key, _, _ in way_filter or []) - useful_tags_path
+    parsed_tags_path = useful_tags_path | filter_tags_path
+
+    # collect the columns in typed arrays, which take 8 bytes per value rather
+    # than a python object each
+    node_ids, node_y, node_x, node_tags = array('q'), array('d'), array('d'), []
+    path_ids, path_nodes, path_starts, path_tags = array('q'), array('q'), array('q'), []
+
+    # the ids of the nodes kept inside the polygon so far
+    kept_node_ids = set()
+
+    # the tags list and useful tags of the element being parsed, if it is a
+    # node or a way, and how many of the nodes have been tested against the
+    # polygon
+    state = {'tags': None, 'useful_tags': None, 'clipped': 0}
+
+    def clip_nodes():
+        # test the nodes parsed since the last batch, and keep those inside
+        clipped = state['clipped']
+        ids = np.array(node_ids[clipped:], dtype=np.int64)
+        y = np.array(node_y[clipped:], dtype=np.float64)
+        x = np.array(node_x[clipped:], dtype=np.float64)
+        inside = get_points_in_polygon(x, y, polygon)
+        tags = [element_tags for element_tags, kept in zip(node_tags[clipped:], inside.tolist()) if kept]
+        for column, values in ((node_ids, ids), (node_y, y), (node_x, x)):
+            del column[clipped:]
+            column.frombytes(values[inside].tobytes())
+        del node_tags[clipped:]
+        node_tags.extend(tags)
+        kept_node_ids.update(ids[inside].tolist())
+        state['clipped'] = len(node_ids)
+
+    def start_element(name, attrs):
+        if name == 'nd':
+            path_nodes.append(int(attrs['ref']))
+        elif name == 'tag':
+            if state['useful_tags'] is not None and attrs['k'] in state['useful_tags']:
+                tags = state['tags']
+                if tags[-1] is None:
+                    tags[-1] = {}
+                tags[-1][attrs['k']] = attrs['v']
+        elif name == 'node':
+            # clip the batch before adding this node, whose tags are still to
+            # be parsed into the last entry of node_tags
+            if polygon is not None and len(node_ids) - state['clipped'] >= 65536:
+                clip_nodes()
+            node_ids.append(int(attrs['id']))
+            node_y.append(float(attrs['lat']))
+            node_x.append(float(attrs['lon']))
+            node_tags.append(None)
+            state['tags'], state['useful_tags'] = node_tags, useful_tags_node
+        elif name == 'way':
+            if polygon is not None and len(node_ids) > state['clipped']:
+                clip_nodes()
+            path_ids.append(int(attrs['id']))
+            path_starts.append(len(path_nodes))
+            path_tags.append(None)
+            state['tags'], state['useful_tags'] = path_tags, parsed_tags_path
+        elif name == 'relation':
+            state['tags'], state['useful_tags'] = None, None
+
+    def end_element(name):
+        if name == 'way':
+            tags = path_tags[-1]
+            if ((way_filter is not None and not osm_filter_matches(tags or {}, way_filter)) or
+                    (polygon is not None and not any(ref in kept_node_ids for ref in path_nodes[path_starts[-1]:]))):
+                del path_nodes[path_starts[-1]:]
+                path_ids.pop()
+                path_starts.pop()
+                path_tags.pop()
+            elif tags and filter_tags_path:
+                for key in filter_tags_path.intersection(tags):
+                    del tags[key]
+                if not tags:
+                    path_tags[-1] = None
+
+    parser = xml.parsers.expat.ParserCreate()
+    parser.StartElementHandler = start_element
+    if way_filter is not None or polygon is not None:
+        parser.EndElementHandler = end_element
+    with _open_osm_file(filename) as file:
+        while True:
+            chunk = file.read(chunk_size)
+            parser.Parse(chunk, not chunk)
+            if not chunk:
+                break
+    if polygon is not None and len(node_ids) > state['clipped']:
+        clip_nodes()
+
+    path_offsets = np.concatenate([np.array(path_starts, dtype=np.int64), [len(path_nodes)]]).astype(np.int64)
+    path_offsets, path_nodes = _remove_consecutive_duplicates(path_offsets, np.array(path_nodes, dtype=np.int64))
+
+    return {'node_ids': np.array(node_ids, dtype=np.int64),
+            'node_y': np.array(node_y, dtype=np.float64),
+            'node_x': np.array(node_x, dtype=np.float64),
+            'node_tags': _get_tag_columns(node_tags, settings.useful_tags_node),
+            'path_ids': np.array(path_ids, dtype=np.int64),
+            'path_offsets': path_offsets,
+            'path_nodes': path_nodes,
+            'path_tags': _get_tag_columns(path_tags, settings.useful_tags_path)}
+
+
+def get_points_in_polygon(x, y, polygon):
+    """
+    Find which points lie within (or on the boundary of) a polygon.
+
+    Points outside the polygon's bounding box are ruled out with vectorized
+    comparisons first, and the rest are tested against the prepared polygon,
+    unless it is a rectangle, whose bounds already decide.
+
+    Parameters
+    ----------
+    x : numpy.ndarray
+        the points' x coordinates
+    y : numpy.ndarray
+        the points' y coordinates
+    polygon : shapely Polygon or MultiPolygon
+
+    Returns
+    -------
+    numpy.ndarray
+        bool mask of the points within the polygon
+    """
+    west, south, east, north = polygon.bounds
+    inside = (x >= west) & (x <= east) & (y >= south) & (y <= north)
+    if polygon.equals(polygon.envelope):
+        return inside
+
+    candidates = np.flatnonzero(inside)
+    if intersects_xy is not None:
+        inside[candidates] = intersects_xy(polygon, x[candidates], y[candidates])
+    else:
+        prepared_polygon = prep(polygon)
+        inside[candidates] = [prepared_polygon.intersects(Point(point_x, point_y)) for point_x, point_y
+                              in zip(x[candidates].tolist(), y[candidates].tolist())]
+    return inside
+
+
+def parse_osm_pbf_arrays(filename, processes=None, way_filter=None, polygon=None):
+    """
+    Read an OSM PBF file into arrays of its nodes and paths, as
+    parse_osm_arrays returns them for an Overpass API response, one set of
+    arrays per data block of the file.
+
+    The file's blocks are decoded independently, in a pool of worker
+    processes if there are several, and only the tags in
+    settings.useful_tags_node and settings.useful_tags_path are kept.
+    Relations are skipped, and so are ways not passing way_filter, whose node
+    refs are never decoded.
+
+    If a polygon is passed, the blocks are decoded in two passes: first their
+    nodes, keeping those inside the polygon, then their ways, keeping those
+    with any node inside it. The retained ways keep their refs to dropped
+    nodes, to split them there with split_paths_at_missing_nodes.
+
+    Parameters
+    ----------
+    filename : string
+        the name of a file containing OSM PBF data
+    processes : int
+        how many worker processes to use, if None, use
+        settings.parse_processes. if 1, decode the blocks serially in this
+        process
+    way_filter : list
+        if not None, clauses as returned by parse_osm_filter that a way's tags
+        must pass to keep it
+    polygon : shapely Polygon or MultiPolygon
+        if not None, the unprojected geometry to keep the nodes within
+
+    Returns
+    -------
+    list
+        the arrays of each block, to merge with merge_osm_arrays
+    """
+    if processes is None:
+        processes = settings.parse_processes
+    if processes is None:
+        processes = os.cpu_count()
+
+    blocks = get_pbf_blocks(filename)
+    if len(blocks) < 1:
+        raise EmptyOverpassResponse('There are no data blocks in the PBF file')
+
+    def decode_blocks(**kwargs):
+        # the workers decode with this process's useful tags settings
+        kwargs.update(useful_tags_node=settings.useful_tags_node, useful_tags_path=settings.useful_tags_path,
+                      way_filter=way_filter)
+        args = [(filename, offset, size, kwargs) for offset, size in blocks]
+        if processes <= 1 or len(blocks) <= 1:
+            return [_parse_pbf_block_worker(block_args) for block_args in args]
+        with ProcessPoolExecutor(max_workers=min(processes, len(blocks))) as executor:
+            return list(executor.map(_parse_pbf_block_worker, args))
+
+    if polygon is None:
+        return decode_blocks()
+
+    nodes_arrays = decode_blocks(polygon=polygon, ways=False)
+
+    # share the sorted ids of the retained nodes with the workers through a
+    # temporary file they memory map, rather than pickling them for each block
+    handle, node_ids_filepath = tempfile.mkstemp(suffix='.npy')
+    try:
+        with os.fdopen(handle, 'wb') as file:
+            np.save(file, np.unique(np.concatenate([arrays['node_ids'] for arrays in nodes_arrays])))
+        paths_arrays = decode_blocks(node_ids_filepath=node_ids_filepath, nodes=False)
+    finally:
+        os.remove(node_ids_filepath)
+    return nodes_arrays + paths_arrays
+
+
+def _parse_pbf_block_worker(args):
+    """
+    Decode a data block of an OSM PBF file into arrays of its nodes and paths.
+
+    Parameters
+    ----------
+    args : tuple
+        the file name, the block's offset and size, and a dict of the useful
+        node and useful path tags to keep, the way filter, and optionally the
+        polygon to keep the nodes within, the path of a .npy file of the
+        sorted ids of the nodes to keep the ways of, and whether to decode
+        the nodes and the ways
+
+    Returns
+    -------
+    dict
+    """
+    filename, offset, size, kwargs = args
+    useful_tags_node = kwargs['useful_tags_node']
+    useful_tags_path = kwargs['useful_tags_path']
+    block = read_pbf_block(filename, offset, size, useful_tags_node, useful_tags_path,
+                           way_filter=kwargs['way_filter'], nodes=kwargs.get('nodes', True),
+                           ways=kwargs.get('ways', True))
+    path_offsets, path_nodes = _remove_consecutive_duplicates(block['way_offsets'], block['way_refs'])
+    osm_arrays = {'node_ids': block['node_ids'],
+                  'node_y': block['node_y'],
+                  'node_x': block['node_x'],
+                  'node_tags': _get_tag_columns(block['node_tags'], useful_tags_node),
+                  'path_ids': block['way_ids'],
+                  'path_offsets': path_offsets,
+                  'path_nodes': path_nodes,
+                  'path_tags': _get_tag_columns(block['way_tags'], useful_tags_path)}
+
+    if kwargs.get('polygon') is not None:
+        inside = get_points_in_polygon(osm_arrays['node_x'], osm_arrays['node_y'], kwargs['polygon'])
+        for key in ('node_ids', 'node_y', 'node_x'):
+            osm_arrays[key] = osm_arrays[key][inside]
+        osm_arrays['node_tags'] = {tag: column[inside] for tag, column in osm_arrays['node_tags'].items()}
+
+    if kwargs.get('node_ids_filepath') is not None:
+        # keep the ways with any node among the retained ones
+        node_ids = np.load(kwargs['node_ids_filepath'], mmap_mode='r')
+        if len(node_ids) > 0:
+            positions = np.minimum(np.searchsorted(node_ids, path_nodes), len(node_ids) - 1)
+            retained = np.asarray(node_ids[positions]) == path_nodes
+        else:
+            retained = np.zeros(len(path_nodes), dtype=bool)
+        retained_before = np.concatenate([[0], np.cumsum(retained)])
+        index = np.flatnonzero(retained_before[path_offsets[1:]] > retained_before[path_offsets[:-1]])
+        osm_arrays['path_ids'] = osm_arrays['path_ids'][index]
+        osm_arrays['path_offsets'], osm_arrays['path_nodes'] = _select_paths(path_offsets, path_nodes, index)
+        osm_arrays['path_tags'] = {tag: column[index] for tag, column in osm_arrays['path_tags'].items()}
+
+    return osm_arrays
+
+
+def split_paths_at_missing_nodes(osm_arrays):
+    """
+    Split the paths in some OSM arrays where they refer to nodes missing from
+    the arrays (e.g., nodes clipped away), so that no edge gets made to or
+    across a missing node. Each remaining run of two or more consecutive
+    present nodes becomes a path of its own, with the original path's osmid
+    and tags.
+
+    Parameters
+    ----------
+    osm_arrays : dict
+        as returned by merge_osm_arrays
+
+    Returns
+    -------
+    dict
+    """
+    path_offsets = osm_arrays['path_offsets']
+    path_nodes = osm_arrays['path_nodes']
+    present = np.isin(path_nodes, osm_arrays['node_ids'])
+    if present.all():
+        return osm_arrays
+
+    # a run starts at each present node that is the first of its path or
+    # follows a missing node
+    rows = np.repeat(np.arange(len(path_offsets) - 1), np.diff(path_offsets))
+    continues = np.zeros(len(path_nodes), dtype=bool)
+    continues[1:] = present[:-1] & (rows[1:] == rows[:-1])
+    starts = present & ~continues
+    runs = np.cumsum(starts)[present] - 1
+    run_lengths = np.bincount(runs, minlength=starts.sum())
+    run_rows = rows[starts]
+
+    kept_runs = run_lengths >= 2
+    osm_arrays = dict(osm_arrays)
+    osm_arrays['path_ids'] = osm_arrays['path_ids'][run_rows[kept_runs]]
+    osm_arrays['path_offsets'] = np.concatenate([[0], np.cumsum(run_lengths[kept_runs], dtype=np.int64)])
+    osm_arrays['path_nodes'] = path_nodes[present][kept_runs[runs]]
+    osm_arrays['path_tags'] = {tag: column[run_rows[kept_runs]] for tag, column in osm_arrays['path_tags'].items()}
+    return osm_arrays
+
+
+def get_way_filter(network_type='all_private', custom_filter=None, infrastructure='way["highway"]'):
+    """
+    Get the clauses that a way's tags must pass to be part of a network, for
+    the readers of local files to evaluate as the Overpass API would
+    evaluate the query osm_net_download sends.
+
+    Parameters
+    ----------
+    network_type : string
+        {'walk', 'bike', 'drive', 'drive_service', 'all', 'all_private', 'none'}
+        what type of street network to get
+    custom_filter : string
+        a custom network filter to be used instead of the network_type presets
+    infrastructure : string
+        which ways to get, e.g., 'way["highway"]'
+
+    Returns
+    -------
+    list
+        clauses as returned by parse_osm_filter
+    """
+    match = re.match(r'\s*way\b(.*)$', infrastructure, re.DOTALL)
+    if match is None:
+        raise ValueError('Only way infrastructures can be filtered locally, not "{}"'.format(infrastructure))
+    if custom_filter:
+        osm_filter = custom_filter
+    else:
+        osm_filter = get_osm_filter(network_type)
+    return parse_osm_filter(match.group(1)) + parse_osm_filter(osm_filter)
+
+
+def retain_path_nodes(osm_arrays):
+    """
+    Drop the nodes that no path refers to from some OSM arrays.
+
+    Parameters
+    ----------
+    osm_arrays : dict
+        as returned by parse_osm_arrays or merge_osm_arrays
+
+    Returns
+    -------
+    dict
+    """
+    keep = np.isin(osm_arrays['node_ids'], osm_arrays['path_nodes'])
+    osm_arrays = dict(osm_arrays)
+    for key in ('node_ids', 'node_y', 'node_x'):
+        osm_arrays[key] = osm_arrays[key][keep]
+    osm_arrays['node_tags'] = {tag: column[keep] for tag, column in osm_arrays['node_tags'].items()}
+    return osm_arrays
+
+
+def _remove_consecutive_duplicates(path_offsets, path_nodes):
+    """
+    Remove any consecutive duplicate nodes within each path of some paths
+    stored as compressed sparse rows.
+
+    Parameters
+    ----------
+    path_offsets : numpy.ndarray
+        where each path's nodes start in path_nodes, and where the last ends
+    path_nodes : numpy.ndarray
+        the nodes of all the paths
+
+    Returns
+    -------
+    path_offsets, path_nodes : tuple
+    """
+    keep = np.ones(len(path_nodes), dtype=bool)
+    keep[1:] = path_nodes[1:] != path_nodes[:-1]
+    starts = path_offsets[:-1][path_offsets[:-1] < path_offsets[1:]]
+    keep[starts] = True
+    if not keep.all():
+        path_offsets = np.concatenate([[0], np.cumsum(keep, dtype=np.int64)])[path_offsets]
+        path_nodes = path_nodes[keep]
+    return path_offsets, path_nodes
+
+
+def _get_tag_columns(tags, useful_tags):
+    """
+    Get object array columns of some useful tags' values.
+
+    Parameters
+    ----------
+    tags : list
+        tags dict of each element, or None if it has no tags
+    useful_tags : list
+        the tags to get columns of
+
+    Returns
+    -------
+    dict
+        tag name to column of its values, None where an element lacks it
+    """
+    columns = {useful_tag: [None] * len(tags) for useful_tag in useful_tags}
+    for i, element_tags in enumerate(tags):
+        if element_tags:
+            for tag, value in element_tags.items():
+                if tag in columns:
+                    columns[tag][i] = value
+    for useful_tag, values in columns.items():
+        column = np.empty(len(values), dtype=object)
+        column[:] = values
+        columns[useful_tag] = column
+    return columns
+
+
+def parse_osm_arrays_parallel(response_jsons, processes=None):
+    """
+    Parse several Overpass API responses into arrays, as parse_osm_arrays
+    does, in a pool of worker processes.
+
+    Each response is parsed in its own task, and only its compact arrays get
+    sent back, to merge with merge_osm_arrays. Streamed responses and
+    responses loaded from msgpack cache files pickle cheaply (as a file path
+    or as arrays), so parsing them scales with the number of cpus.
+
+    Parameters
+    ----------
+    response_jsons : list
+        list of dicts of JSON responses from from the Overpass API
+    processes : int
+        how many worker processes to use, if None, use
+        settings.parse_processes. if 1, or if there is only one response,
+        parse them serially in this process
+
+    Returns
+    -------
+    list
+        the arrays of each response
+    """
+    if processes is None:
+        processes = settings.parse_processes
+    if processes is None:
+        processes = os.cpu_count()
+    response_jsons = list(response_jsons)
+    if processes <= 1 or len(response_jsons) <= 1:
+        return [parse_osm_arrays(osm_data) for osm_data in response_jsons]
+
+    # the workers parse with this process's useful tags settings
+    args = [(osm_data, settings.useful_tags_node, settings.useful_tags_path) for osm_data in response_jsons]
+    with ProcessPoolExecutor(max_workers=min(processes, len(response_jsons))) as executor:
+        return list(executor.map(_parse_osm_arrays_worker, args))
+
+
+def _parse_osm_arrays_worker(args):
+    """
+    Parse an Overpass API response into arrays in a worker process.
+
+    Parameters
+    ----------
+    args : tuple
+        the response, and the useful node and the useful path tags to parse
+        with
+
+    Returns
+    -------
+    dict
+    """
+    osm_data, useful_tags_node, useful_tags_path = args
+    settings.useful_tags_node = useful_tags_node
+    settings.useful_tags_path = useful_tags_path
+    return parse_osm_arrays(osm_data)
+
+
+def merge_osm_arrays(osm_arrays):
+    """
+    Merge the arrays of several Overpass API responses, as returned by
+    parse_osm_arrays, deduplicating their nodes and paths.
+
+    As when updating a dict keyed by osmid, each node and path keeps the
+    position of its first occurrence and the attributes of its last.
+
+    Parameters
+    ----------
+    osm_arrays : list
+        the arrays of each response
+
+    Returns
+    -------
+    dict
+    """
+    # no responses merge into empty arrays, for create_graph to reject as an
+    # empty response
+    if len(osm_arrays) == 0:
+        return parse_osm_arrays({'elements': []})
+
+    node_ids = np.concatenate([arrays['node_ids'] for arrays in osm_arrays])
+    path_ids = np.concatenate([arrays['path_ids'] for arrays in osm_arrays])
+    path_lengths = np.concatenate([np.diff(arrays['path_offsets']) for arrays in osm_arrays])
+    path_nodes = np.concatenate([arrays['path_nodes'] for arrays in osm_arrays])
+    path_offsets = np.concatenate([[0], np.cumsum(path_lengths, dtype=np.int64)])
+
+    nodes_index = _get_dedupe_index(node_ids)
+    paths_index = _get_dedupe_index(path_ids)
+
+    # gather the nodes of each retained path from the concatenated rows
+    new_offsets, new_path_nodes = _select_paths(path_offsets, path_nodes, paths_index)
+
+    def merge_tags(key, index):
+        tags = {}
+        for tag in osm_arrays[0][key]:
+            tags[tag] = np.concatenate([arrays[key][tag] for arrays in osm_arrays])[index]
+        return tags
+
+    return {'node_ids': node_ids[nodes_index],
+            'node_y': np.concatenate([arrays['node_y'] for arrays in osm_arrays])[nodes_index],
+            'node_x': np.concatenate([arrays['node_x'] for arrays in osm_arrays])[nodes_index],
+            'node_tags': merge_tags('node_tags', nodes_index),
+            'path_ids': path_ids[paths_index],
+            'path_offsets': new_offsets,
+            'path_nodes': new_path_nodes,
+            'path_tags': merge_tags('path_tags', paths_index)}
+
+
+def _select_paths(path_offsets, path_nodes, index):
+    """
+    Select some rows of paths stored as compressed sparse rows.
+
+    Parameters
+    ----------
+    path_offsets : numpy.ndarray
+        where each path's nodes start in path_nodes, and where the last ends
+    path_nodes : numpy.ndarray
+        the nodes of all the paths
+    index : numpy.ndarray
+        the rows to select, in order
+
+    Returns
+    -------
+    path_offsets, path_nodes : tuple
+        of the selected rows
+    """
+    lengths = np.diff(path_offsets)[index]
+    new_offsets = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]).astype(np.int64)
+    positions = np.repeat(path_offsets[:-1][index] - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+    return new_offsets, path_nodes[positions.astype(np.int64)]
+
+
+def _get_dedupe_index(ids):
+    """
+    Get the index of the last occurrence of each distinct id, ordered by each
+    id's first occurrence.
+
+    Parameters
+    ----------
+    ids : numpy.ndarray
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+    _, first = np.unique(ids, return_index=True)
+    _, last_reversed = np.unique(ids[::-1], return_index=True)
+    last = len(ids) - 1 - last_reversed
+    return last[np.argsort(first, kind='stable')]
+
+
+def get_nodes_from_arrays(osm_arrays):
+    """
+    Get (osmid, attributes) tuples of the nodes in some OSM arrays, in the
+    format for networkx nodes, to add to a graph in bulk.
+
+    Parameters
+    ----------
+    osm_arrays : dict
+        as returned by parse_osm_arrays or merge_osm_arrays
+
+    Returns
+    -------
+    list
+    """
+    osmids = osm_arrays['node_ids'].tolist()
+    datas = [{'y': y, 'x': x, 'osmid': osmid} for y, x, osmid
+             in zip(osm_arrays['node_y'].tolist(), osm_arrays['node_x'].tolist(), osmids)]
+    _add_tags_from_columns(datas, osm_arrays['node_tags'])
+    return list(zip(osmids, datas))
+
+
+def get_paths_from_arrays(osm_arrays):
+    """
+    Get a dict of the paths in some OSM arrays with key=osmid and value=dict
+    of attributes, as parse_osm_nodes_paths returns them.
+
+    Parameters
+    ----------
+    osm_arrays : dict
+        as returned by parse_osm_arrays or merge_osm_arrays
+
+    Returns
+    -------
+    dict
+    """
+    path_nodes = osm_arrays['path_nodes'].tolist()
+    path_offsets = osm_arrays['path_offsets'].tolist()
+    paths = {}
+    for data, start, end in zip(get_path_datas_from_arrays(osm_arrays), path_offsets[:-1], path_offsets[1:]):
+        path = {'osmid': data.pop('osmid'), 'nodes': path_nodes[start:end]}
+        path.update(data)
+        paths[path['osmid']] = path
+    return paths
+
+
+def get_path_datas_from_arrays(osm_arrays):
+    """
+    Get the attribute dicts (osmid and useful tags, but not nodes) of the
+    paths in some OSM arrays.
+
+    Parameters
+    ----------
+    osm_arrays : dict
+        as returned by parse_osm_arrays or merge_osm_arrays
+
+    Returns
+    -------
+    list
+    """
+    datas = [{'osmid': osmid} for osmid in osm_arrays['path_ids'].tolist()]
+    _add_tags_from_columns(datas, osm_arrays['path_tags'])
+    return datas
+
+
+def _add_tags_from_columns(datas, tag_columns):
+    """
+    Add the values of some tag columns to the attribute dicts of their
+    elements, in the order of the columns, where they are not None.
+
+    Parameters
+    ----------
+    datas : list
+        the attribute dict of each element
+    tag_columns : dict
+        tag name to column of its values
+
+    Returns
+    -------
+    None
+    """
+    for tag, column in tag_columns.items():
+        for i in np.flatnonzero(np.not_equal(column, None)).tolist():
+            datas[i][tag] = column[i]
+
+
 def remove_isolated_nodes(G):
     """
     Remove from a graph all the nodes that have no incident edges (ie, node
@@ -808,7 +1839,208 @@ def add_edge_lengths(G):
     return G
 
 
-def add_path(G, data, one_way):
+# empty way attributes, for edges whose attributes were all copied to their
+# own dict
+_EMPTY_ATTRIBUTES = {}
+
+
+class EdgeAttributes(MutableMapping):
+    """
+    Compact attributes of an edge, which share the attribute mapping of its
+    OSM way with the way's other edges.
+
+    Reads fall through to the way's mapping, which never gets modified
+    through its edges. The edge's length is kept in a slot of its own, and
+    any other attribute set on the edge in a dict that is only created when
+    needed. Deleting one of the way's attributes first copies them all to the
+    edge's own dict.
+
+    Parameters
+    ----------
+    way : dict
+        the attributes of the edge's way, shared by all its edges
+    """
+
+    __slots__ = ('_way', '_length', '_own')
+
+    def __init__(self, way):
+        self._way = way
+        self._length = None
+        self._own = None
+
+    def __getitem__(self, key):
+        if key == 'length' and self._length is not None:
+            return self._length
+        own = self._own
+        if own is not None and key in own:
+            return own[key]
+        return self._way[key]
+
+    def __setitem__(self, key, value):
+        if key == 'length' and value is not None:
+            self._length = value
+            if self._own is not None:
+                self._own.pop(key, None)
+        else:
+            if key == 'length':
+                self._length = None
+            if self._own is None:
+                self._own = {}
+            self._own[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        if key in self._way:
+            own = dict(self)
+            if self._length is not None:
+                del own['length']
+            self._way = _EMPTY_ATTRIBUTES
+            self._own = own
+        if key == 'length' and self._length is not None:
+            self._length = None
+        else:
+            del self._own[key]
+
+    def __contains__(self, key):
+        if key == 'length' and self._length is not None:
+            return True
+        return (self._own is not None and key in self._own) or key in self._way
+
+    def __iter__(self):
+        own = self._own if self._own is not None else _EMPTY_ATTRIBUTES
+        has_length = self._length is not None
+        for key in self._way:
+            if key not in own and not (has_length and key == 'length'):
+                yield key
+        if has_length:
+            yield 'length'
+        for key in own:
+            yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def copy(self):
+        """
+        Copy the edge's attributes, still sharing its way's mapping.
+
+        Returns
+        -------
+        EdgeAttributes
+        """
+        attributes = EdgeAttributes(self._way)
+        attributes._length = self._length
+        if self._own is not None:
+            attributes._own = dict(self._own)
+        return attributes
+
+
+def _intern_attributes(data):
+    """
+    Copy a path's attributes, interning their string keys and values, so that
+    equal tag values of different paths are stored only once.
+
+    Parameters
+    ----------
+    data : dict
+        the attributes of the path
+
+    Returns
+    -------
+    dict
+    """
+    return {(sys.intern(key) if isinstance(key, str) else key): (sys.intern(value) if isinstance(value, str) else value)
+            for key, value in data.items()}
+
+
+def _add_shared_edges(G, us, vs, keys, ways):
+    """
+    Add edges to the graph with EdgeAttributes sharing their way's attributes.
+
+    networkx copies the attributes of every edge it adds into a new dict, so
+    this inserts the edges into the graph's adjacency dicts directly, the same
+    way MultiDiGraph.add_edge does.
+
+    Parameters
+    ----------
+    G : networkx multidigraph
+    us : list
+        the origin node of each edge
+    vs : list
+        the destination node of each edge
+    keys : list
+        the key of each edge, or None to pick the next free key
+    ways : iterable
+        the shared attributes of each edge's way
+
+    Returns
+    -------
+    None
+    """
+    G.add_nodes_from(node for node in set(us) | set(vs) if node not in G)
+    succ = G._succ
+    pred = G._pred
+    for u, v, key, way in zip(us, vs, keys, ways):
+        keydict = succ[u].get(v)
+        if keydict is None:
+            keydict = G.edge_key_dict_factory()
+            succ[u][v] = keydict
+            pred[v][u] = keydict
+        if key is None:
+            key = G.new_edge_key(u, v)
+        keydict[key] = EdgeAttributes(way)
+
+
+def get_edge_attributes_size(G):
+    """
+    Measure the memory taken up by the attributes of the graph's edges: the
+    attribute mappings and their keys and values (but not the objects inside
+    values such as geometries), counting shared objects only once.
+
+    Parameters
+    ----------
+    G : networkx multidigraph
+
+    Returns
+    -------
+    int
+        the total size in bytes
+    """
+    seen = set()
+    size = 0
+
+    def add(obj):
+        nonlocal size
+        if id(obj) not in seen:
+            seen.add(id(obj))
+            size += sys.getsizeof(obj)
+            return True
+        return False
+
+    def add_mapping(mapping):
+        if add(mapping):
+            for key, value in mapping.items():
+                add(key)
+                add(value)
+
+    for _, _, data in G.edges(data=True):
+        if isinstance(data, EdgeAttributes):
+            add(data)
+            add_mapping(data._way)
+            if data._length is not None:
+                add(data._length)
+            if data._own is not None:
+                add_mapping(data._own)
+        else:
+            add_mapping(data)
+    return size
+
+
+def add_path(G, data, one_way, compact=False):
     """
     Add a path to the graph.
 
@@ -819,6 +2051,9 @@ def add_path(G, data, one_way):
         the attributes of the path
     one_way : bool
         if this path is one-way or if it is bi-directional
+    compact : bool
+        if True, intern the path's attributes and share one mapping of them
+        across its edges, see EdgeAttributes
 
     Returns
     -------
@@ -840,17 +2075,21 @@ def add_path(G, data, one_way):
     # zip together the path nodes so you get tuples like (0,1), (1,2), (2,3)
     # and so on
     path_edges = list(zip(path_nodes[:-1], path_nodes[1:]))
-    G.add_edges_from(path_edges, **data)
 
-    # if the path is NOT one-way
+    # if the path is NOT one-way, reverse the direction of each edge and add
+    # this path going the opposite direction too
     if not one_way:
-        # reverse the direction of each edge and add this path going the
-        # opposite direction
-        path_edges_opposite_direction = [(v, u) for u, v in path_edges]
-        G.add_edges_from(path_edges_opposite_direction, **data)
+        path_edges = path_edges + [(v, u) for u, v in path_edges]
+
+    if compact:
+        way = _intern_attributes(data)
+        _add_shared_edges(G, [u for u, _ in path_edges], [v for _, v in path_edges],
+                          [None] * len(path_edges), [way] * len(path_edges))
+    else:
+        G.add_edges_from(path_edges, **data)
 
 
-def add_paths(G, paths, bidirectional=False):
+def add_paths(G, paths, bidirectional=False, compact=False):
     """
     Add a collection of paths to the graph.
 
@@ -861,6 +2100,9 @@ def add_paths(G, paths, bidirectional=False):
         the paths from OSM
     bidirectional : bool
         if True, create bidirectional edges for one-way streets
+    compact : bool
+        if True, intern each path's attributes and share one mapping of them
+        across its edges, see EdgeAttributes
 
 
     Returns
@@ -868,41 +2110,142 @@ def add_paths(G, paths, bidirectional=False):
     None
     """
 
+    # split the paths into their attributes and their nodes as compressed
+    # sparse rows, then add them all in bulk
+    datas = []
+    path_nodes = []
+    path_lengths = []
+    for data in paths.values():
+        datas.append({key: value for key, value in data.items() if key != 'nodes'})
+        path_nodes.extend(data['nodes'])
+        path_lengths.append(len(data['nodes']))
+    path_offsets = np.concatenate([[0], np.cumsum(path_lengths, dtype=np.int64)]).astype(np.int64)
+
+    return add_paths_from_arrays(G, datas, path_offsets, np.array(path_nodes, dtype=object),
+                                 bidirectional=bidirectional, compact=compact)
+
+
+def add_paths_from_arrays(G, datas, path_offsets, path_nodes, bidirectional=False, compact=False):
+    """
+    Add a collection of paths, given as arrays, to the graph in bulk.
+
+    Computes every edge of every path in one vectorized pass: each path's
+    consecutive node pairs, reversed for paths that are one-way against the
+    order of their nodes, followed by the same pairs in the opposite direction
+    for paths that are not one-way. Then inserts them all in one loop, in the
+    same order (and so with the same keys) as adding the paths one at a time
+    with add_path, sharing each path's attribute dict.
+
+    Parameters
+    ----------
+    G : networkx multidigraph
+    datas : list
+        the attributes of each path, except its nodes. each path's oneway
+        attribute gets set to whether it was added as one-way
+    path_offsets : numpy.ndarray
+        offsets of each path's nodes in path_nodes, plus the total
+    path_nodes : numpy.ndarray
+        the nodes of all the paths, concatenated
+    bidirectional : bool
+        if True, create bidirectional edges for one-way streets
+    compact : bool
+        if True, intern each path's attributes and share one mapping of them
+        across its edges, see EdgeAttributes
+
+    Returns
+    -------
+    G : networkx multidigraph
+    """
+
     # the list of values OSM uses in its 'oneway' tag to denote True
     # updated list of of values OSM uses based on https://www.geofabrik.de/de/data/geofabrik-osm-gis-standard-0.7.pdf 
     osm_oneway_values = ['yes', 'true', '1', '-1', 'T', 'F']
 
-    for data in paths.values():
+    # decide which paths are one-way, and which of those are one-way in the
+    # reverse direction of the nodes' order (a one-way value of -1 or T, see
+    # osm documentation). roundabouts are also oneway but not tagged as is.
+    # on a walking network, you can walk both directions on a one-way street
+    oneway_values = pd.Series([data.get('oneway') for data in datas], dtype=object)
+    if settings.all_oneway is True:
+        one_way = np.ones(len(datas), dtype=bool)
+        reverse = np.zeros(len(datas), dtype=bool)
+    elif bidirectional:
+        one_way = np.zeros(len(datas), dtype=bool)
+        reverse = np.zeros(len(datas), dtype=bool)
+    else:
+        roundabout = np.array([data.get('junction') == 'roundabout' for data in datas], dtype=bool)
+        one_way = oneway_values.isin(osm_oneway_values).values | roundabout
+        reverse = oneway_values.isin(['-1', 'T']).values
+
+    # set the oneway attribute to the one-way value each path is added with,
+    # to make it consistent True/False values, but only do this if you aren't
+    # forcing all edges to oneway with the all_oneway setting. With the
+    # all_oneway setting, you likely still want to preserve the original OSM
+    # oneway attribute.
+    if not settings.all_oneway:
+        for data, value in zip(datas, one_way.tolist()):
+            data['oneway'] = value
+
+    # lay out each path's nodes in the direction it is added, then pair up
+    # consecutive nodes within each path, so you get edges like (0,1), (1,2),
+    # (2,3) and so on
+    path_offsets = np.asarray(path_offsets, dtype=np.int64)
+    starts = path_offsets[:-1]
+    ends = path_offsets[1:]
+    path_index = np.repeat(np.arange(len(datas)), ends - starts)
+    positions = np.arange(len(path_nodes))
+    positions = np.where(reverse[path_index], starts[path_index] + ends[path_index] - 1 - positions, positions)
+    ordered_nodes = np.asarray(path_nodes)[positions]
+    is_edge = np.flatnonzero(np.arange(len(path_nodes)) < ends[path_index] - 1)
+    u = ordered_nodes[is_edge]
+    v = ordered_nodes[is_edge + 1]
+    edge_path = path_index[is_edge]
+
+    # add each path going the opposite direction too if it is NOT one-way,
+    # right after the path itself
+    two_way = ~one_way[edge_path]
+    us = np.concatenate([u, v[two_way]])
+    vs = np.concatenate([v, u[two_way]])
+    edge_paths = np.concatenate([edge_path, edge_path[two_way]])
+    directions = np.concatenate([np.zeros(len(u), dtype=np.int8), np.ones(two_way.sum(), dtype=np.int8)])
+    order = np.lexsort((directions, edge_paths))
+
+    us = us[order]
+    vs = vs[order]
+    edge_paths = edge_paths[order]
+
+    # if the graph has no edges yet, each edge's key is the number of edges
+    # between the same nodes before it, which saves looking for a free key
+    # edge by edge
+    if nx.is_empty(G) and us.dtype.kind in 'iu' and len(us) > 0:
+        pair_order = np.lexsort((vs, us))
+        sorted_us = us[pair_order]
+        sorted_vs = vs[pair_order]
+        new_pair = np.concatenate([[True], (sorted_us[1:] != sorted_us[:-1]) | (sorted_vs[1:] != sorted_vs[:-1])])
+        group_starts = np.flatnonzero(new_pair)
+        group_sizes = np.diff(np.concatenate([group_starts, [len(us)]]))
+        keys = np.empty(len(us), dtype=np.int64)
+        keys[pair_order] = np.arange(len(us)) - np.repeat(group_starts, group_sizes)
+        keys = keys.tolist()
+    else:
+        keys = [None] * len(us)
 
-        if settings.all_oneway is True:
-            add_path(G, data, one_way=True)
-        # if this path is tagged as one-way and if it is not a walking network,
-        # then we'll add the path in one direction only
-        elif ('oneway' in data and data['oneway'] in osm_oneway_values) and not bidirectional:
-            if data['oneway'] == '-1' or data['oneway'] == 'T':
-                # paths with a one-way value of -1 or T are one-way, but in the
-                # reverse direction of the nodes' order, see osm documentation 
-                data['nodes'] = list(reversed(data['nodes']))
-            # add this path (in only one direction) to the graph
-            add_path(G, data, one_way=True)
-
-        elif ('junction' in data and data['junction'] == 'roundabout') and not bidirectional:
-            # roundabout are also oneway but not tagged as is
-            add_path(G, data, one_way=True)
-
-        # else, this path is not tagged as one-way or it is a walking network
-        # (you can walk both directions on a one-way street)
-        else:
-            # add this path (in both directions) to the graph and set its
-            # 'oneway' attribute to False. if this is a walking network, this
-            # may very well be a one-way street (as cars/bikes go), but in a
-            # walking-only network it is a bi-directional edge
-            add_path(G, data, one_way=False)
+    # in compact mode, each edge gets a small mapping over its path's interned
+    # attributes instead of a copy of them
+    if compact:
+        ways = [_intern_attributes(data) for data in datas]
+        _add_shared_edges(G, us.tolist(), vs.tolist(), keys, (ways[i] for i in edge_paths.tolist()))
+        return G
 
+    # insert the edges with add_edge rather than add_edges_from, which looks
+    # each new edge up again through the graph's views to set its attributes
+    add_edge = G.add_edge
+    for u, v, key, i in zip(us.tolist(), vs.tolist(), keys, edge_paths.tolist()):
+        add_edge(u, v, key, **datas[i])
     return G
 
 
-def create_graph(response_jsons, name='unnamed', retain_all=False, bidirectional=False):
+def create_graph(response_jsons, name='unnamed', retain_all=False, bidirectional=False, compact=False):
     """
     Create a networkx graph from Overpass API HTTP response objects.
 
@@ -916,6 +2259,10 @@ def create_graph(response_jsons, name='unnamed', retain_all=False, bidirectional
         if True, return the entire graph even if it is not connected
     bidirectional : bool
         if True, create bidirectional edges for one-way streets
+    compact : bool
+        if True, intern each way's tags and share one mapping of them across
+        the way's edges, see EdgeAttributes. copies of the graph, such as the
+        ones simplify_graph and project_graph make, store plain dicts again
 
     Returns
     -------
@@ -925,37 +2272,65 @@ def create_graph(response_jsons, name='unnamed', retain_all=False, bidirectional
     log('Creating networkx graph from downloaded OSM data...')
     start_time = time.time()
 
+    # extract arrays of the nodes and paths from the downloaded osm data, in a
+    # single pass over each response's elements (which may be streamed), in
+    # parallel if settings.parse_processes allows, then merge them
+    osm_arrays = merge_osm_arrays(parse_osm_arrays_parallel(response_jsons))
+
+    return create_graph_from_arrays(osm_arrays, name=name, retain_all=retain_all,
+                                    bidirectional=bidirectional, compact=compact, start_time=start_time)
+
+
+def create_graph_from_arrays(osm_arrays, name='unnamed', retain_all=False, bidirectional=False,
+                             compact=False, start_time=None):
+    """
+    Create a networkx graph from arrays of OSM nodes and paths.
+
+    Parameters
+    ----------
+    osm_arrays : dict
+        as returned by parse_osm_arrays, parse_osm_xml_arrays, or
+        merge_osm_arrays
+    name : string
+        the name of the graph
+    retain_all : bool
+        if True, return the entire graph even if it is not connected
+    bidirectional : bool
+        if True, create bidirectional edges for one-way streets
+    compact : bool
+        if True, intern each way's tags and share one mapping of them across
+        the way's edges, see EdgeAttributes
+    start_time : float
+        when the graph's creation started, to log how long it took, if None,
+        now
+
+    Returns
+    -------
+    networkx multidigraph
+    """
+    if start_time is None:
+        start_time = time.time()
+
     # make sure we got data back from the server requests
-    elements = []
-    for response_json in response_jsons:
-        elements.extend(response_json['elements'])
-    if len(elements) < 1:
+    if len(osm_arrays['node_ids']) < 1 and len(osm_arrays['path_ids']) < 1:
         raise EmptyOverpassResponse('There are no data elements in the response JSON objects')
 
     # create the graph as a MultiDiGraph and set the original CRS to default_crs
     G = nx.MultiDiGraph(name=name, crs=settings.default_crs)
 
-    # extract nodes and paths from the downloaded osm data
-    nodes = {}
-    paths = {}
-    for osm_data in response_jsons:
-        nodes_temp, paths_temp = parse_osm_nodes_paths(osm_data)
-        for key, value in nodes_temp.items():
-            nodes[key] = value
-        for key, value in paths_temp.items():
-            paths[key] = value
-
-    # add each osm node to the graph
-    for node, data in nodes.items():
-        G.add_node(node, **data)
+    # add the osm nodes to the graph in bulk
+    G.add_nodes_from(get_nodes_from_arrays(osm_arrays))
 
     # add each osm way (aka, path) to the graph
-    G = add_paths(G, paths, bidirectional=bidirectional)
+    G = add_paths_from_arrays(G, get_path_datas_from_arrays(osm_arrays), osm_arrays['path_offsets'],
+                              osm_arrays['path_nodes'], bidirectional=bidirectional, compact=compact)
 
     # retain only the largest connected component, if caller did not
-    # set retain_all=True
+    # set retain_all=True. in compact mode, remove the other nodes in place,
+    # as copying the component into a new graph would copy the edges'
+    # attributes into plain dicts
     if not retain_all:
-        G = get_largest_component(G)
+        G = get_largest_component(G, in_place=compact)
 
     log('Created graph with {:,} nodes and {:,} edges in {:,.2f} seconds'.format(len(list(G.nodes())), len(list(G.edges())), time.time()-start_time))
 
@@ -964,6 +2339,9 @@ def create_graph(response_jsons, name='unnamed', retain_all=False, bidirectional
     if len(G.edges) > 0:
         G = add_edge_lengths(G)
 
+    if compact and len(G.edges) > 0:
+        log('Edge attributes take up {:,.1f} bytes per edge'.format(get_edge_attributes_size(G) / len(G.edges)))
+
     return G
 
 
@@ -1498,15 +2876,134 @@ def graph_from_place(query, network_type='all_private', simplify=True,
     return G
 
 
+def prewarm_cache(queries, network_type='all_private', timeout=180, memory=None,
+                  max_query_area_size=50*1000*50*1000, clean_periphery=True,
+                  infrastructure='way["highway"]', custom_filter=None,
+                  custom_settings=None, which_result=1, buffer_dist=None,
+                  concurrent_requests=None):
+    """
+    Download the street network data for some places, polygons, or bounding
+    boxes into the cache ahead of time, without creating any graphs.
+
+    The data are requested the same way graph_from_place, graph_from_polygon,
+    and graph_from_bbox request them with simplify=True and the same
+    clean_periphery, so that those functions (e.g., with settings.offline)
+    can then be served from the cache. Caching must be enabled.
+
+    Parameters
+    ----------
+    queries : list
+        the places (strings or dicts to geocode), shapely Polygons or
+        MultiPolygons, or (north, south, east, west) bounding box tuples to
+        get network data for
+    network_type : string
+        what type of street network to get
+    timeout : int
+        the timeout interval for requests and to pass to API
+    memory : int
+        server memory allocation size for the query, in bytes. If none, server
+        will use its default allocation size
+    max_query_area_size : float
+        max area for any part of the geometry in meters: any polygon bigger
+        will get divided up for multiple queries to API (default 50km x 50km)
+    clean_periphery : bool
+        if True, get the data within 0.5km around each query as well, as the
+        graph_from_ functions do to clean the periphery
+    infrastructure : string
+        download infrastructure of given type (default is streets (ie, 'way["highway"]') but other
+        infrastructures may be selected like power grids (ie, 'way["power"~"line"]'))
+    custom_filter : string
+        a custom network filter to be used instead of the network_type presets
+    custom_settings : string
+        custom settings to be used in the overpass query instead of the default
+        ones
+    which_result : int
+        max number of results to return and which to process upon receipt,
+        for place queries
+    buffer_dist : float
+        distance to buffer around the place geometries, in meters
+    concurrent_requests : int
+        max number of requests to have in flight at once, if None, use
+        settings.overpass_concurrent_requests. this is further capped by the
+        number of slots the server grants to this client
+
+    Returns
+    -------
+    None
+    """
+
+    if not settings.use_cache:
+        raise ValueError('Cannot prewarm the cache unless settings.use_cache is True')
+
+    # resolve each query to the keyword arguments osm_net_download gets for it
+    download_kwargs = []
+    for query in queries:
+        if isinstance(query, (str, dict)):
+            gdf_place = gdf_from_place(query, which_result=which_result, buffer_dist=buffer_dist)
+            query = gdf_place['geometry'].unary_union
+
+        if isinstance(query, (Polygon, MultiPolygon)):
+            if not query.is_valid:
+                raise TypeError('Shape does not have a valid geometry')
+            polygon = query
+            if clean_periphery:
+                polygon_utm, crs_utm = project_geometry(geometry=polygon)
+                polygon, _ = project_geometry(geometry=polygon_utm.buffer(500), crs=crs_utm, to_latlong=True)
+            download_kwargs.append({'polygon': polygon})
+
+        elif isinstance(query, (tuple, list)) and len(query) == 4:
+            north, south, east, west = query
+            if clean_periphery:
+                polygon = Polygon([(west, north), (west, south), (east, south), (east, north)])
+                polygon_utm, crs_utm = project_geometry(geometry=polygon)
+                polygon_buff, _ = project_geometry(geometry=polygon_utm.buffer(500), crs=crs_utm, to_latlong=True)
+                west, south, east, north = polygon_buff.bounds
+            download_kwargs.append({'north': north, 'south': south, 'east': east, 'west': west})
+
+        else:
+            raise TypeError('Each query must be a place string or dict, a shapely Polygon or '
+                            'MultiPolygon, or a (north, south, east, west) tuple')
+
+    # collect every query's overpass requests and make them all in one pool,
+    # so the number of concurrent requests stays capped by the server's slots
+    datas = []
+    for kwargs in download_kwargs:
+        datas.extend(get_osm_net_queries(network_type=network_type, timeout=timeout, memory=memory,
+                                         max_query_area_size=max_query_area_size, infrastructure=infrastructure,
+                                         custom_filter=custom_filter, custom_settings=custom_settings, **kwargs))
+    log('Prewarming cache for {:,} queries in {:,} request(s)'.format(len(download_kwargs), len(datas)))
+    start_time = time.time()
+
+    # download and discard the responses, which are now in the cache
+    overpass_requests_parallel(datas, timeout=timeout, concurrent_requests=concurrent_requests)
+
+    log('Prewarmed cache for {:,} queries in {:,.2f} seconds'.format(len(download_kwargs), time.time()-start_time))
+
+
 def graph_from_file(filename, bidirectional=False, simplify=True,
-                    retain_all=False, name='unnamed'):
+                    retain_all=False, name='unnamed', network_type=None,
+                    custom_filter=None, infrastructure='way["highway"]',
+                    polygon=None, north=None, south=None, east=None, west=None):
     """
-    Create a networkx graph from OSM data in an XML file.
+    Create a networkx graph from OSM data in an XML or PBF file.
+
+    By default, every way in the file becomes part of the graph. If a
+    network_type or custom_filter is passed, the ways are filtered while the
+    file is parsed, as osm_net_download filters them on the Overpass server,
+    and only the nodes of the retained ways are kept.
+
+    If a polygon or bounding box is passed, the nodes outside it are dropped
+    while the file is parsed, along with the ways without any node inside
+    it, and the remaining ways are split where their nodes were dropped. The
+    result is the same as truncating the whole file's graph with
+    truncate_graph_polygon or truncate_graph_bbox, but memory use is
+    proportional to the clipped data rather than to the file.
 
     Parameters
     ----------
     filename : string
-        the name of a file containing OSM XML data
+        the name of a file containing OSM XML data (optionally bz2
+        compressed), or OSM PBF data if its name ends with .pbf
     bidirectional : bool
         if True, create bidirectional edges for one-way streets
     simplify : bool
@@ -1515,17 +3012,68 @@ def graph_from_file(filename, bidirectional=False, simplify=True,
         if True, return the entire graph even if it is not connected
     name : string
         the name of the graph
+    network_type : string
+        {'walk', 'bike', 'drive', 'drive_service', 'all', 'all_private', 'none'}
+        what type of street network to get, if None, get every way. walk
+        networks are made bidirectional, as in graph_from_bbox
+    custom_filter : string
+        a custom network filter to be used instead of the network_type
+        presets, in the same Overpass QL tag filter syntax
+    infrastructure : string
+        which ways to get when filtering, in the same Overpass QL syntax as
+        osm_net_download takes, e.g., 'way["power"~"line"]'
+    polygon : shapely Polygon or MultiPolygon
+        if not None, the unprojected geometry to clip the graph to
+    north : float
+        if not None, the northern latitude of the bounding box to clip the
+        graph to
+    south : float
+        the southern latitude of the bounding box
+    east : float
+        the eastern longitude of the bounding box
+    west : float
+        the western longitude of the bounding box
 
     Returns
     -------
     networkx multidigraph
     """
-    # transmogrify file of OSM XML data into JSON
-    response_jsons = [overpass_json_from_file(filename)]
+    log('Creating networkx graph from OSM file "{}"...'.format(filename))
+    start_time = time.time()
+
+    way_filter = None
+    if network_type is not None or custom_filter is not None:
+        way_filter = get_way_filter(network_type=network_type, custom_filter=custom_filter,
+                                    infrastructure=infrastructure)
+        if network_type in settings.bidirectional_network_types:
+            bidirectional = True
+
+    if polygon is None and not (north is None and south is None and east is None and west is None):
+        if north is None or south is None or east is None or west is None:
+            raise InsufficientNetworkQueryArguments(
+                'You must pass a polygon or north, south, east, and west')
+        polygon = bbox_to_poly(north, south, east, west)
+
+    # decode the file's OSM PBF blocks, or stream its OSM XML data, straight
+    # into arrays of its nodes and paths, deduplicated as if they were
+    # Overpass API responses
+    if filename.endswith('.pbf'):
+        osm_arrays = merge_osm_arrays(parse_osm_pbf_arrays(filename, way_filter=way_filter, polygon=polygon))
+    else:
+        osm_arrays = merge_osm_arrays([parse_osm_xml_arrays(filename, way_filter=way_filter, polygon=polygon)])
+
+    # as overpass returns just the nodes of the ways passing the filter, drop
+    # the nodes that no retained way refers to
+    if way_filter is not None:
+        osm_arrays = retain_path_nodes(osm_arrays)
+
+    # split the ways at the nodes clipped away, so they get no edges
+    if polygon is not None:
+        osm_arrays = split_paths_at_missing_nodes(osm_arrays)
 
-    # create graph using this response JSON
-    G = create_graph(response_jsons, bidirectional=bidirectional,
-                     retain_all=retain_all, name=name)
+    # create graph using these arrays
+    G = create_graph_from_arrays(osm_arrays, bidirectional=bidirectional,
+                                 retain_all=retain_all, name=name, start_time=start_time)
 
     # simplify the graph topology as the last step.
     if simplify:
@@ -1,20 +1,90 @@
+import contextlib
+import gzip
 import io
 import json
 import hashlib
 import math
+import numpy as np
+import random
 import requests
+import shutil
+import sqlite3
+import threading
 import time
 import re
+import tempfile
+import weakref
+import zlib
 import datetime as dt
 import os
 import logging as lg
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from dateutil import parser as date_parser
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import parse_qs
+from urllib.parse import urlsplit
 from .errors import *
 from .utils import make_str, log
 
+# fcntl provides file locking on posix, msvcrt on windows
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# msgpack is an optional dependency for the binary cache format
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 from . import settings
 
+# the pooled HTTP session shared by all API requests, and the settings it was
+# created with, so it gets rebuilt if the user changes them with config()
+_session = None
+_session_config = None
+_session_lock = threading.Lock()
+
+# running total of the cache folder's size in bytes, measured on first save
+# to that folder
+_cache_size = None
+_cache_size_folder = None
+_cache_size_lock = threading.Lock()
+
+# in-memory least-recently-used tier in front of the cache folder, mapping url
+# to (response_json, size in bytes, time added), plus cache hit/miss counters
+_memory_cache = OrderedDict()
+_memory_cache_size = 0
+_memory_cache_lock = threading.Lock()
+_cache_stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+
+# each thread's connections to the sqlite cache database
+_cache_db_local = threading.local()
+
+# requests currently in flight, mapping prepared URL to an event that is set
+# when the request finishes, and its response json or exception
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+# health of each overpass endpoint: recent latency, consecutive failures, and
+# until when to avoid it
+_endpoint_health = {}
+_endpoint_health_lock = threading.Lock()
+
+# this process's token bucket state for each rate limited host, when the limits
+# are not shared with other processes through lock files
+_rate_limit_state = {}
+_rate_limit_lock = threading.Lock()
+
+# each overpass endpoint's most recently probed status, from which requests
+# claim slots until it runs out or gets stale
+_overpass_status = {}
+_overpass_status_lock = threading.Lock()
+
 
 def get_osm_filter(network_type):
     """
@@ -84,6 +154,125 @@ def get_osm_filter(network_type):
     return osm_filter
 
 
+# one clause of an overpass tag filter: ["key"], [!"key"], or ["key" op "value"]
+# with op one of =, !=, ~, !~ (and optionally ,i for case-insensitive regexes),
+# where keys and values are double-quoted strings or bare words
+_OSM_FILTER_STRING = r'(?:"((?:[^"\\]|\\.)*)"|([\w:.-]+))'
+_OSM_FILTER_CLAUSE = re.compile(r'\s*\[\s*(!?)\s*' + _OSM_FILTER_STRING +
+                                r'\s*(?:(!=|!~|=|~)\s*' + _OSM_FILTER_STRING + r'\s*(,\s*i)?\s*)?\]\s*')
+
+
+def parse_osm_filter(osm_filter):
+    """
+    Parse an Overpass QL tag filter, such as get_osm_filter returns, into
+    clauses to evaluate on elements' tags locally with osm_filter_matches.
+
+    Parameters
+    ----------
+    osm_filter : string
+        a sequence of tag filter clauses, e.g., '["highway"]["area"!~"yes"]'
+
+    Returns
+    -------
+    list
+        (key, operator, value) tuples, with operator one of 'exists',
+        'not_exists', '=', '!=', '~', or '!~', and value None, a string, or a
+        compiled regular expression accordingly
+    """
+    def unescape(quoted, bare):
+        return bare if quoted is None else re.sub(r'\\(["\'\\])', r'\1', quoted)
+
+    clauses = []
+    pos = 0
+    while pos < len(osm_filter.rstrip()):
+        match = _OSM_FILTER_CLAUSE.match(osm_filter, pos)
+        if match is None:
+            raise ValueError('Unsupported OSM filter "{}" at position {}'.format(osm_filter, pos))
+        negated, key_quoted, key_bare, operator, value_quoted, value_bare, ignore_case = match.groups()
+        key = unescape(key_quoted, key_bare)
+        if operator is None:
+            clauses.append((key, 'not_exists' if negated else 'exists', None))
+        elif negated:
+            raise ValueError('Unsupported OSM filter "{}" at position {}'.format(osm_filter, pos))
+        elif operator in ('~', '!~'):
+            flags = re.IGNORECASE if ignore_case else 0
+            clauses.append((key, operator, re.compile(unescape(value_quoted, value_bare), flags)))
+        else:
+            clauses.append((key, operator, unescape(value_quoted, value_bare)))
+        pos = match.end()
+    return clauses
+
+
+def osm_filter_matches(tags, clauses):
+    """
+    Check whether an element's tags pass all the clauses of a tag filter, as
+    Overpass would: negated clauses pass when the key is absent, and regexes
+    match anywhere in the value.
+
+    Parameters
+    ----------
+    tags : dict
+        the element's tags
+    clauses : list
+        as returned by parse_osm_filter
+
+    Returns
+    -------
+    bool
+    """
+    for key, operator, value in clauses:
+        tag_value = tags.get(key)
+        if operator == 'exists':
+            passed = tag_value is not None
+        elif operator == 'not_exists':
+            passed = tag_value is None
+        elif operator == '=':
+            passed = tag_value == value
+        elif operator == '!=':
+            passed = tag_value != value
+        elif operator == '~':
+            passed = tag_value is not None and value.search(tag_value) is not None
+        else:
+            passed = tag_value is None or value.search(tag_value) is None
+        if not passed:
+            return False
+    return True
+
+
+def get_cache_filepath(url, shard_depth=None, compression=None, cache_format='json'):
+    """
+    Get the path of the cache file for a URL's response.
+
+    The filename is the md5 hash of the URL. With a shard_depth of n, the file
+    is placed n subdirectories deep, named by successive 2-character prefixes
+    of the hash, so no single folder accumulates too many files.
+
+    Parameters
+    ----------
+    url : string
+        the url of the request
+    shard_depth : int
+        how many levels of hash-prefix subdirectories to use, if None, use
+        settings.cache_shard_depth
+    compression : string
+        {None, 'gzip'}, if 'gzip' the file is gzipped
+    cache_format : string
+        {'json', 'msgpack'}, how the file is serialized
+
+    Returns
+    -------
+    cache_filepath : string
+    """
+    if shard_depth is None:
+        shard_depth = settings.cache_shard_depth
+
+    # hash the url to make the filename succinct but unique
+    filename = hashlib.md5(url.encode('utf-8')).hexdigest()
+    shards = [filename[i * 2:i * 2 + 2] for i in range(shard_depth)]
+    extensions = [filename, cache_format, 'gz'] if compression == 'gzip' else [filename, cache_format]
+    return os.path.join(settings.cache_folder, *(shards + [os.extsep.join(extensions)]))
+
+
 def save_to_cache(url, response_json):
     """
     Save an HTTP response json object to the cache.
@@ -110,28 +299,53 @@ def save_to_cache(url, response_json):
     if settings.use_cache:
         if response_json is None:
             log('Did not save to cache because response_json is None')
+        elif settings.cache_backend == 'sqlite':
+            json_str = make_str(json.dumps(response_json))
+            _sqlite_cache_save(url, zlib.compress(json_str.encode('utf-8')))
+            _memory_cache_put(url, response_json, len(json_str))
         else:
             # create the folder on the disk if it doesn't already exist
-            if not os.path.exists(settings.cache_folder):
-                os.makedirs(settings.cache_folder)
-
-            # hash the url to make the filename succinct but unique
-            filename = hashlib.md5(url.encode('utf-8')).hexdigest()
-            cache_filepath = os.path.join(settings.cache_folder, os.extsep.join([filename, 'json']))
-
-            # dump to json, and save to file
-            json_str = make_str(json.dumps(response_json))
-            with io.open(cache_filepath, 'w', encoding='utf-8') as cache_file:
-                cache_file.write(json_str)
+            cache_filepath = get_cache_filepath(url, compression=settings.cache_compression,
+                                                cache_format=settings.cache_format)
+            cache_dir = os.path.dirname(cache_filepath)
+            if not os.path.exists(cache_dir):
+                os.makedirs(cache_dir, exist_ok=True)
+
+            # serialize the response, and save to a temp file that then
+            # replaces the cache file so that concurrent readers never see a
+            # partial file
+            if settings.cache_format == 'msgpack':
+                payload = pack_response(response_json)
+            else:
+                payload = make_str(json.dumps(response_json)).encode('utf-8')
+            temp_filepath = '{}.{}.{}.tmp'.format(cache_filepath, os.getpid(), threading.get_ident())
+            if settings.cache_compression == 'gzip':
+                with gzip.open(temp_filepath, 'wb') as cache_file:
+                    cache_file.write(payload)
+            else:
+                with io.open(temp_filepath, 'wb') as cache_file:
+                    cache_file.write(payload)
+            os.replace(temp_filepath, cache_filepath)
+            _memory_cache_put(url, response_json, len(payload))
 
             log('Saved response to cache file "{}"'.format(cache_filepath))
 
+            # keep track of the cache's total size and evict the least
+            # recently used responses if it has grown past the max size
+            if settings.cache_max_size is not None:
+                _update_cache_size(os.path.getsize(cache_filepath))
 
 
 def url_in_cache(url):
     """
     Determine if a URL's response exists in the cache.
 
+    Looks for the response in the current cache layout first, then falls back
+    to the other layouts (i.e., flat or sharded, compressed or not, json or
+    msgpack) so that responses cached under earlier settings are still found. Responses that
+    have not been used within settings.cache_ttl seconds are considered
+    expired.
+
     Parameters
     ----------
     url : string
@@ -140,24 +354,42 @@ def url_in_cache(url):
     Returns
     -------
     filepath : string
-        path to cached response for url if it exists in the cache,
-        otherwise None
+        path to cached response for url if it exists in the cache (with the
+        sqlite cache backend, path to the cache database), otherwise None
     """
 
-    # hash the url to generate the cache filename
-    filename = hashlib.md5(url.encode('utf-8')).hexdigest()
-    filepath = os.path.join(settings.cache_folder, os.extsep.join([filename, 'json']))
-    
-    # if this file exists in the cache, return its full path
-    if os.path.isfile(filepath):
-        return filepath
+    if settings.cache_backend == 'sqlite':
+        return _sqlite_cache_lookup(url)
+
+    layouts = [(settings.cache_shard_depth, settings.cache_compression),
+               (settings.cache_shard_depth, None if settings.cache_compression else 'gzip'),
+               (0, settings.cache_compression),
+               (0, None if settings.cache_compression else 'gzip')]
+    cache_formats = [settings.cache_format, 'json']
+    if msgpack is not None:
+        cache_formats.append('msgpack')
 
+    # if this file exists in the cache, return its full path
+    for cache_format, (shard_depth, compression) in OrderedDict.fromkeys(
+            (cache_format, layout) for cache_format in cache_formats for layout in layouts):
+        filepath = get_cache_filepath(url, shard_depth=shard_depth, compression=compression,
+                                      cache_format=cache_format)
+        if os.path.isfile(filepath):
+            if settings.cache_ttl is not None and time.time() - os.path.getmtime(filepath) > settings.cache_ttl:
+                log('Cache file "{}" has expired'.format(filepath))
+                return None
+            return filepath
 
 
 def get_from_cache(url):
     """
     Retrieve a HTTP response json object from the cache.
 
+    Responses are served from the in-memory tier if they are there, otherwise
+    they are read from the cache folder and added to the in-memory tier. The
+    in-memory tier returns the same object to every caller, so treat the
+    returned response as read-only.
+
     Parameters
     ----------
     url : string
@@ -171,305 +403,2287 @@ def get_from_cache(url):
 
     # if the tool is configured to use the cache
     if settings.use_cache:
-        
+
+        # first look in the in-memory tier, which skips disk i/o and json
+        # parsing entirely
+        response_json = _memory_cache_get(url)
+        if response_json is not None:
+            log('Retrieved response from memory cache for URL "{}"'.format(url))
+            return response_json
+
         # return cached response for this url if it exists, otherwise return None
-        cache_filepath = url_in_cache(url)
-        if cache_filepath is not None:
-            with io.open(cache_filepath, encoding='utf-8') as cache_file:
-                response_json = json.load(cache_file)
+        if settings.cache_backend == 'sqlite':
+            cache_filepath = _get_cache_db_filepath()
+            payload = _sqlite_cache_get(url)
+        else:
+            cache_filepath = url_in_cache(url)
+            payload = None if cache_filepath is None else _file_cache_get(cache_filepath)
+
+        if payload is None:
+            _count_cache_stat('misses')
+        else:
+            if isinstance(payload, bytes):
+                response_json = unpack_response(payload)
+            else:
+                response_json = json.loads(payload)
+            _count_cache_stat('disk_hits')
+            _memory_cache_put(url, response_json, len(payload))
             log('Retrieved response from cache file "{}" for URL "{}"'.format(cache_filepath, url))
             return response_json
 
 
-
-def get_http_headers(user_agent=None, referer=None, accept_language=None):
+def _file_cache_get(cache_filepath):
     """
-    Update the default requests HTTP headers with OSMnx info.
+    Read a response's json text or msgpack bytes from a file in the cache
+    folder.
 
     Parameters
     ----------
-    user_agent : str
-        the user agent string, if None will set with OSMnx default
-    referer : str
-        the referer string, if None will set with OSMnx default
-    accept_language : str
-        make accept-language explicit e.g. for consistent nominatim result sorting
+    cache_filepath : string
+        path to the cache file
 
     Returns
     -------
-    headers : dict
+    payload : string or bytes
+        the json text, or the msgpack bytes if it is a msgpack file
     """
+    if _is_msgpack_file(cache_filepath):
+        opener = gzip.open if cache_filepath.endswith('.gz') else io.open
+        with opener(cache_filepath, 'rb') as cache_file:
+            payload = cache_file.read()
+    elif cache_filepath.endswith('.gz'):
+        with gzip.open(cache_filepath, 'rt', encoding='utf-8') as cache_file:
+            payload = cache_file.read()
+    else:
+        with io.open(cache_filepath, encoding='utf-8') as cache_file:
+            payload = cache_file.read()
 
-    if user_agent is None:
-        user_agent = settings.default_user_agent
-    if referer is None:
-        referer = settings.default_referer
-    if accept_language is None:
-        accept_language = settings.default_accept_language
+    # touch the file so its modification time records when it was last used,
+    # for least-recently-used eviction and expiration
+    if settings.cache_max_size is not None or settings.cache_ttl is not None:
+        try:
+            os.utime(cache_filepath, None)
+        except OSError:
+            pass
 
-    headers = requests.utils.default_headers()
-    headers.update({'User-Agent': user_agent, 'referer': referer, 'Accept-Language': accept_language})
-    return headers
+    return payload
 
 
-def get_pause_duration(recursive_delay=5, default_duration=10):
+def _is_msgpack_file(cache_filepath):
     """
-    Check the Overpass API status endpoint to determine how long to wait until
-    next slot is available.
+    Determine if a cache file is in the msgpack format.
 
     Parameters
     ----------
-    recursive_delay : int
-        how long to wait between recursive calls if server is currently running
-        a query
-    default_duration : int
-        if fatal error, function falls back on returning this value
+    cache_filepath : string
 
     Returns
     -------
-    int
+    bool
     """
+    return cache_filepath.endswith(('.msgpack', '.msgpack.gz'))
 
-    try:
-        response = requests.get(settings.overpass_endpoint.rstrip('/') + '/status', headers=get_http_headers())
-        status = response.text.split('\n')[3]
-        status_first_token = status.split(' ')[0]
-    except Exception:
-        # if we cannot reach the status endpoint or parse its output, log an
-        # error and return default duration
-        log('Unable to query {}/status'.format(settings.overpass_endpoint.rstrip('/')), level=lg.ERROR)
-        return default_duration
-
-    try:
-        # if first token is numeric, it's how many slots you have available - no
-        # wait required
-        available_slots = int(status_first_token)
-        pause_duration = 0
-    except Exception:
-        # if first token is 'Slot', it tells you when your slot will be free
-        if status_first_token == 'Slot':
-            utc_time_str = status.split(' ')[3]
-            utc_time = date_parser.parse(utc_time_str).replace(tzinfo=None)
-            pause_duration = math.ceil((utc_time - dt.datetime.utcnow()).total_seconds())
-            pause_duration = max(pause_duration, 1)
-
-        # if first token is 'Currently', it is currently running a query so
-        # check back in recursive_delay seconds
-        elif status_first_token == 'Currently':
-            time.sleep(recursive_delay)
-            pause_duration = get_pause_duration()
 
-        else:
-            # any other status is unrecognized - log an error and return default
-            # duration
-            log('Unrecognized server status: "{}"'.format(status), level=lg.ERROR)
-            return default_duration
+def pack_response(response_json):
+    """
+    Serialize a response json object to msgpack bytes.
 
-    return pause_duration
+    The ids, coordinates, and node refs of an Overpass response's plain nodes
+    and ways (i.e., with no keys but type, id, lat/lon or nodes, and tags)
+    are stored as little-endian typed arrays, and their tags as lists. Any
+    other elements, and any other payload (such as a Nominatim response's
+    list of results), are stored as they are. If the elements are not already
+    ordered as nodes, then ways, then others, the kind of each element is
+    stored too, one byte each, to restore their original order.
 
+    Parameters
+    ----------
+    response_json : dict or list
 
-def osm_polygon_download(query, limit=1, polygon_geojson=1):
+    Returns
+    -------
+    bytes
     """
-    Geocode a place and download its boundary geometry from OSM's Nominatim API.
+    if msgpack is None:
+        raise ImportError('The msgpack package must be installed to use this optional feature.')
+
+    if not isinstance(response_json, dict):
+        return msgpack.packb(response_json, use_bin_type=True)
+
+    response = dict(response_json)
+    elements = response_json.get('elements')
+    if isinstance(elements, ColumnarElements):
+        response['elements'] = elements.to_dict()
+    elif isinstance(elements, list):
+        nodes = []
+        ways = []
+        others = []
+        kinds = []
+        for element in elements:
+            keys = set(element)
+            keys.discard('tags')
+            if element['type'] == 'node' and keys == {'type', 'id', 'lat', 'lon'}:
+                nodes.append(element)
+                kinds.append(_NODE)
+            elif element['type'] == 'way' and keys == {'type', 'id', 'nodes'}:
+                ways.append(element)
+                kinds.append(_WAY)
+            else:
+                others.append(element)
+                kinds.append(_OTHER)
+        kinds = np.array(kinds, dtype=np.int8)
+
+        way_refs = [ref for way in ways for ref in way['nodes']]
+        way_offsets = np.cumsum([0] + [len(way['nodes']) for way in ways])
+        response['elements'] = {'node_ids': np.array([node['id'] for node in nodes], dtype='<i8').tobytes(),
+                                'node_lats': np.array([node['lat'] for node in nodes], dtype='<f8').tobytes(),
+                                'node_lons': np.array([node['lon'] for node in nodes], dtype='<f8').tobytes(),
+                                'node_tags': [node.get('tags') for node in nodes],
+                                'way_ids': np.array([way['id'] for way in ways], dtype='<i8').tobytes(),
+                                'way_refs': np.array(way_refs, dtype='<i8').tobytes(),
+                                'way_offsets': np.array(way_offsets, dtype='<i8').tobytes(),
+                                'way_tags': [way.get('tags') for way in ways],
+                                'others': others,
+                                'kinds': _pack_kinds(kinds)}
+
+    return msgpack.packb(response, use_bin_type=True)
+
+
+def unpack_response(payload):
+    """
+    Deserialize a response json object from msgpack bytes.
+
+    The typed arrays of an Overpass response's elements are loaded as numpy
+    arrays viewing the payload, without creating an object per element, and
+    wrapped in a ColumnarElements sequence.
 
     Parameters
     ----------
-    query : string or dict
-        query string or structured query dict to geocode/download
-    limit : int
-        max number of results to return
-    polygon_geojson : int
-        request the boundary geometry polygon from the API, 0=no, 1=yes
+    payload : bytes
 
     Returns
     -------
-    dict
+    dict or list
     """
-    # define the parameters
-    params = OrderedDict()
-    params['format'] = 'json'
-    params['limit'] = limit
-    params['dedupe'] = 0  # prevent OSM from deduping results so we get precisely 'limit' # of results
-    params['polygon_geojson'] = polygon_geojson
-
-    # add the structured query dict (if provided) to params, otherwise query
-    # with place name string
-    if isinstance(query, str):
-        params['q'] = query
-    elif isinstance(query, dict):
-        # add the query keys in alphabetical order so the URL is the same string
-        # each time, for caching purposes
-        for key in sorted(list(query.keys())):
-            params[key] = query[key]
-    else:
-        raise TypeError('query must be a dict or a string')
+    if msgpack is None:
+        raise ImportError('The msgpack package must be installed to use this optional feature.')
 
-    # request the URL, return the JSON
-    response_json = nominatim_request(params=params, timeout=30)
+    response_json = msgpack.unpackb(payload, raw=False)
+    if not isinstance(response_json, dict):
+        return response_json
+    elements = response_json.get('elements')
+    if isinstance(elements, dict):
+        response_json['elements'] = ColumnarElements(
+            node_ids=np.frombuffer(elements['node_ids'], dtype='<i8'),
+            node_lats=np.frombuffer(elements['node_lats'], dtype='<f8'),
+            node_lons=np.frombuffer(elements['node_lons'], dtype='<f8'),
+            node_tags=elements['node_tags'],
+            way_ids=np.frombuffer(elements['way_ids'], dtype='<i8'),
+            way_refs=np.frombuffer(elements['way_refs'], dtype='<i8'),
+            way_offsets=np.frombuffer(elements['way_offsets'], dtype='<i8'),
+            way_tags=elements['way_tags'],
+            others=elements['others'],
+            kinds=None if elements.get('kinds') is None else np.frombuffer(elements['kinds'], dtype=np.int8))
     return response_json
 
 
-def nominatim_request(params, type="search", pause_duration=1, timeout=30, error_pause_duration=180):
+def _pack_kinds(kinds):
     """
-    Send a request to the Nominatim API via HTTP GET and return the JSON
-    response.
+    Get the kind of each element of a ColumnarElements sequence as bytes, or
+    None if they are in the default order of nodes, then ways, then others.
 
     Parameters
     ----------
-    params : dict or OrderedDict
-        key-value pairs of parameters
-    type : string
-        Type of Nominatim query. One of the following: search, reverse or lookup
-    pause_duration : int
-        how long to pause before requests, in seconds
-    timeout : int
-        the timeout interval for the requests library
-    error_pause_duration : int
-        how long to pause in seconds before re-trying requests if error
+    kinds : numpy.ndarray
+        int8 kind of each element, _NODE, _WAY, or _OTHER
 
     Returns
     -------
-    response_json : dict
+    bytes or None
     """
+    if np.all(kinds[1:] >= kinds[:-1]):
+        return None
+    return kinds.astype(np.int8).tobytes()
 
-    known_requests = {"search", "reverse", "lookup"}
-    if type not in known_requests:
-        raise ValueError(
-            "The type of Nominatim request is invalid. Please choose one of {{'search', 'reverse', 'lookup'}}")
 
-    # prepare the Nominatim API URL and see if request already exists in the
-    # cache
-    url = settings.nominatim_endpoint.rstrip('/') + '/{}'.format(type)
-    prepared_url = requests.Request('GET', url, params=params).prepare().url
-    cached_response_json = get_from_cache(prepared_url)
+# the kinds of elements of a ColumnarElements sequence
+_NODE, _WAY, _OTHER = 0, 1, 2
 
-    if settings.nominatim_key:
-        params['key'] = settings.nominatim_key
 
-    if cached_response_json is not None:
-        # found this request in the cache, just return it instead of making a
-        # new HTTP call
-        return cached_response_json
+class ColumnarElements(object):
+    """
+    Sequence of the elements of an Overpass response, stored as typed arrays.
 
-    else:
-        # if this URL is not already in the cache, pause, then request it
-        log('Pausing {:,.2f} seconds before making API GET request'.format(pause_duration))
-        time.sleep(pause_duration)
-        start_time = time.time()
-        log('Requesting {} with timeout={}'.format(prepared_url, timeout))
-        response = requests.get(url, params=params, timeout=timeout, headers=get_http_headers())
+    Iterating yields the elements, as the usual element dicts, in their
+    original order if kinds is given, otherwise each node, then each way,
+    then each other element. Bulk consumers can use the arrays directly:
+    way i's node refs are way_refs[way_offsets[i]:way_offsets[i + 1]].
 
-        # get the response size and the domain, log result
-        size_kb = len(response.content) / 1000.
-        domain = re.findall(r'(?s)//(.*?)/', url)[0]
-        log('Downloaded {:,.1f}KB from {} in {:,.2f} seconds'.format(size_kb, domain, time.time() - start_time))
+    Parameters
+    ----------
+    node_ids : numpy.ndarray
+        int64 ids of the nodes
+    node_lats : numpy.ndarray
+        float64 latitudes of the nodes
+    node_lons : numpy.ndarray
+        float64 longitudes of the nodes
+    node_tags : list
+        tags dict of each node, or None if it has no tags
+    way_ids : numpy.ndarray
+        int64 ids of the ways
+    way_refs : numpy.ndarray
+        int64 node refs of all the ways, concatenated
+    way_offsets : numpy.ndarray
+        int64 offsets of each way's node refs in way_refs, plus the total
+    way_tags : list
+        tags dict of each way, or None if it has no tags
+    others : list
+        any other elements, as dicts
+    kinds : numpy.ndarray
+        int8 kind of each element in its original order (_NODE, _WAY, or
+        _OTHER), or None if they are ordered as nodes, then ways, then others
+    """
 
-        try:
-            response_json = response.json()
-            save_to_cache(prepared_url, response_json)
-        except Exception:
-            # 429 is 'too many requests' and 504 is 'gateway timeout' from server
-            # overload - handle these errors by recursively calling
-            # nominatim_request until we get a valid response
-            if response.status_code in [429, 504]:
-                # pause for error_pause_duration seconds before re-trying request
-                log(
-                    'Server at {} returned status code {} and no JSON data. Re-trying request in {:.2f} seconds.'.format(
-                        domain,
-                        response.status_code,
-                        error_pause_duration),
-                    level=lg.WARNING)
-                time.sleep(error_pause_duration)
-                response_json = nominatim_request(params=params, pause_duration=pause_duration, timeout=timeout)
-
-            # else, this was an unhandled status_code, throw an exception
-            else:
-                log('Server at {} returned status code {} and no JSON data'.format(domain, response.status_code),
-                    level=lg.ERROR)
-                raise Exception(
-                    'Server returned no JSON data.\n{} {}\n{}'.format(response, response.reason, response.text))
+    def __init__(self, node_ids, node_lats, node_lons, node_tags, way_ids,
+                 way_refs, way_offsets, way_tags, others, kinds=None):
+        self.node_ids = node_ids
+        self.node_lats = node_lats
+        self.node_lons = node_lons
+        self.node_tags = node_tags
+        self.way_ids = way_ids
+        self.way_refs = way_refs
+        self.way_offsets = way_offsets
+        self.way_tags = way_tags
+        self.others = others
+        self.kinds = kinds
+
+    def __len__(self):
+        return len(self.node_ids) + len(self.way_ids) + len(self.others)
+
+    def __iter__(self):
+        if self.kinds is None:
+            for element in self._iter_nodes():
+                yield element
+            for element in self._iter_ways():
+                yield element
+            for element in self.others:
+                yield element
+        else:
+            elements = {_NODE: self._iter_nodes(), _WAY: self._iter_ways(), _OTHER: iter(self.others)}
+            for kind in self.kinds.tolist():
+                yield next(elements[kind])
+
+    def _iter_nodes(self):
+        for osmid, lat, lon, tags in zip(self.node_ids.tolist(), self.node_lats.tolist(),
+                                         self.node_lons.tolist(), self.node_tags):
+            node = {'type': 'node', 'id': osmid, 'lat': lat, 'lon': lon}
+            if tags is not None:
+                node['tags'] = tags
+            yield node
+
+    def _iter_ways(self):
+        refs = self.way_refs.tolist()
+        offsets = self.way_offsets.tolist()
+        for i, (osmid, tags) in enumerate(zip(self.way_ids.tolist(), self.way_tags)):
+            way = {'type': 'way', 'id': osmid, 'nodes': refs[offsets[i]:offsets[i + 1]]}
+            if tags is not None:
+                way['tags'] = tags
+            yield way
+
+    def to_dict(self):
+        """
+        Get the arrays as bytes, as stored by pack_response.
+
+        Returns
+        -------
+        dict
+        """
+        return {'node_ids': self.node_ids.astype('<i8').tobytes(),
+                'node_lats': self.node_lats.astype('<f8').tobytes(),
+                'node_lons': self.node_lons.astype('<f8').tobytes(),
+                'node_tags': self.node_tags,
+                'way_ids': self.way_ids.astype('<i8').tobytes(),
+                'way_refs': self.way_refs.astype('<i8').tobytes(),
+                'way_offsets': self.way_offsets.astype('<i8').tobytes(),
+                'way_tags': self.way_tags,
+                'others': self.others,
+                'kinds': None if self.kinds is None else _pack_kinds(self.kinds)}
+
+
+def _get_cache_db_filepath():
+    """
+    Get the path of the sqlite cache database in the cache folder.
 
-        return response_json
+    Returns
+    -------
+    string
+    """
+    return os.path.join(settings.cache_folder, os.extsep.join(['cache', 'sqlite']))
 
 
-def overpass_request(data, pause_duration=None, timeout=180, error_pause_duration=None):
+def _get_cache_db():
     """
-    Send a request to the Overpass API via HTTP POST and return the JSON
-    response.
+    Get this thread's connection to the sqlite cache database, creating the
+    database and its schema if they don't exist yet.
+
+    sqlite connections cannot be shared between threads, so each thread keeps
+    its own connection, one per database path.
+
+    Returns
+    -------
+    sqlite3.Connection
+    """
+    db_filepath = _get_cache_db_filepath()
+    connections = _cache_db_local.__dict__.setdefault('connections', {})
+    if db_filepath not in connections:
+        if not os.path.exists(settings.cache_folder):
+            os.makedirs(settings.cache_folder, exist_ok=True)
+        connection = sqlite3.connect(db_filepath, timeout=60)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('CREATE TABLE IF NOT EXISTS responses ('
+                           'url_hash TEXT PRIMARY KEY, url TEXT NOT NULL, '
+                           'endpoint TEXT, query_type TEXT, '
+                           'south REAL, west REAL, north REAL, east REAL, '
+                           'size INTEGER NOT NULL, created REAL NOT NULL, '
+                           'last_access REAL NOT NULL, payload BLOB NOT NULL)')
+        connection.execute('CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)')
+        connection.commit()
+        connections[db_filepath] = connection
+    return connections[db_filepath]
+
+
+def _get_cache_metadata(url):
+    """
+    Extract the endpoint, query type and bounding box of a request from its
+    URL, to store as indexed metadata alongside the cached response.
 
     Parameters
     ----------
-    data : dict or OrderedDict
-        key-value pairs of parameters to post to the API
-    pause_duration : int
-        how long to pause in seconds before requests, if None, will query API
-        status endpoint to find when next slot is available
-    timeout : int
-        the timeout interval for the requests library
-    error_pause_duration : int
-        how long to pause in seconds before re-trying requests if error
+    url : string
+        the url of the request
 
     Returns
     -------
-    dict
+    endpoint, query_type, bbox : tuple
+        bbox is a (south, west, north, east) tuple, or 4 Nones if the request
+        has no bounding box or polygon
     """
+    parts = urlsplit(url)
+    endpoint, _, query_type = parts.path.rpartition('/')
+    endpoint = '{}://{}{}'.format(parts.scheme, parts.netloc, endpoint)
+
+    # overpass queries define their area as (south,west,north,east) or as
+    # (poly:"lat lon lat lon ...")
+    bbox = (None, None, None, None)
+    query = ' '.join(parse_qs(parts.query).get('data', []))
+    coords = re.findall(r'\((-?[\d.]+),(-?[\d.]+),(-?[\d.]+),(-?[\d.]+)\)', query)
+    polys = re.findall(r'poly:"([-\d. ]+)"', query)
+    if coords:
+        coords = [[float(x) for x in c] for c in coords]
+        bbox = (min(c[0] for c in coords), min(c[1] for c in coords),
+                max(c[2] for c in coords), max(c[3] for c in coords))
+    elif polys:
+        values = [float(x) for poly in polys for x in poly.split()]
+        lats, lons = values[0::2], values[1::2]
+        bbox = (min(lats), min(lons), max(lats), max(lons))
+
+    return endpoint, query_type, bbox
+
+
+def _sqlite_cache_save(url, payload):
+    """
+    Save a response's zlib-compressed json text to the sqlite cache database.
 
-    # define the Overpass API URL, then construct a GET-style URL as a string to
-    # hash to look up/save to cache
-    url = settings.overpass_endpoint.rstrip('/') + '/interpreter'
-    prepared_url = requests.Request('GET', url, params=data).prepare().url
-    cached_response_json = get_from_cache(prepared_url)
+    Parameters
+    ----------
+    url : string
+        the url of the request
+    payload : bytes
+        the zlib-compressed json response text
 
-    if cached_response_json is not None:
-        # found this request in the cache, just return it instead of making a
-        # new HTTP call
-        return cached_response_json
+    Returns
+    -------
+    None
+    """
+    endpoint, query_type, (south, west, north, east) = _get_cache_metadata(url)
+    now = time.time()
 
-    else:
-        # if this URL is not already in the cache, pause, then request it
-        if pause_duration is None:
-            this_pause_duration = get_pause_duration()
-        log('Pausing {:,.2f} seconds before making API POST request'.format(this_pause_duration))
-        time.sleep(this_pause_duration)
-        start_time = time.time()
-        log('Posting to {} with timeout={}, "{}"'.format(url, timeout, data))
-        response = requests.post(url, data=data, timeout=timeout, headers=get_http_headers())
+    connection = _get_cache_db()
+    with connection:
+        connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                           (hashlib.md5(url.encode('utf-8')).hexdigest(), url, endpoint, query_type,
+                            south, west, north, east, len(payload), now, now, payload))
+    log('Saved response to cache database "{}"'.format(_get_cache_db_filepath()))
 
-        # get the response size and the domain, log result
-        size_kb = len(response.content) / 1000.
-        domain = re.findall(r'(?s)//(.*?)/', url)[0]
-        log('Downloaded {:,.1f}KB from {} in {:,.2f} seconds'.format(size_kb, domain, time.time() - start_time))
+    # evict the least recently used responses if the cache has grown past the
+    # max size: a single query, so no need to keep a running total
+    if settings.cache_max_size is not None:
+        total_size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total_size > settings.cache_max_size:
+            prune_cache()
 
-        try:
-            response_json = response.json()
-            if 'remark' in response_json:
-                log('Server remark: "{}"'.format(response_json['remark'], level=lg.WARNING))
-            save_to_cache(prepared_url, response_json)
-        except Exception:
-            # 429 is 'too many requests' and 504 is 'gateway timeout' from server
-            # overload - handle these errors by recursively calling
-            # overpass_request until we get a valid response
-            if response.status_code in [429, 504]:
-                # pause for error_pause_duration seconds before re-trying request
-                if error_pause_duration is None:
-                    error_pause_duration = get_pause_duration()
-                log(
-                    'Server at {} returned status code {} and no JSON data. Re-trying request in {:.2f} seconds.'.format(
-                        domain,
-                        response.status_code,
-                        error_pause_duration),
-                    level=lg.WARNING)
-                time.sleep(error_pause_duration)
-                response_json = overpass_request(data=data, pause_duration=pause_duration, timeout=timeout)
-
-            # else, this was an unhandled status_code, throw an exception
-            else:
-                log('Server at {} returned status code {} and no JSON data'.format(domain, response.status_code),
-                    level=lg.ERROR)
-                raise Exception(
-                    'Server returned no JSON data.\n{} {}\n{}'.format(response, response.reason, response.text))
 
-        return response_json
+def _sqlite_cache_lookup(url):
+    """
+    Determine if a URL's response exists, unexpired, in the sqlite cache
+    database.
+
+    Parameters
+    ----------
+    url : string
+        the url to look for in the cache
 
+    Returns
+    -------
+    string
+        path to the cache database if the response is in it, otherwise None
+    """
+    row = _get_cache_db().execute('SELECT last_access FROM responses WHERE url_hash = ?',
+                                  (hashlib.md5(url.encode('utf-8')).hexdigest(),)).fetchone()
+    if row is not None:
+        if settings.cache_ttl is not None and time.time() - row[0] > settings.cache_ttl:
+            return None
+        return _get_cache_db_filepath()
+
+
+def _sqlite_cache_get(url):
+    """
+    Read a response's json text from the sqlite cache database and record
+    when it was last used.
+
+    Parameters
+    ----------
+    url : string
+        the url of the request
+
+    Returns
+    -------
+    json_str : string
+        the json response text if it is in the cache, otherwise None
+    """
+    url_hash = hashlib.md5(url.encode('utf-8')).hexdigest()
+    connection = _get_cache_db()
+    row = connection.execute('SELECT payload, last_access FROM responses WHERE url_hash = ?', (url_hash,)).fetchone()
+    if row is None:
+        return None
 
+    payload, last_access = row
+    now = time.time()
+    if settings.cache_ttl is not None and now - last_access > settings.cache_ttl:
+        return None
 
+    with connection:
+        connection.execute('UPDATE responses SET last_access = ? WHERE url_hash = ?', (now, url_hash))
+    return zlib.decompress(payload).decode('utf-8')
+
+
+def _sqlite_cache_prune(max_size, ttl):
+    """
+    Evict expired and least recently used responses from the sqlite cache
+    database.
+
+    Parameters
+    ----------
+    max_size : int
+        max total size of the cache in bytes, or None
+    ttl : int
+        max seconds since a response was last used, or None
+
+    Returns
+    -------
+    removed, total_size : tuple
+        number of responses removed, and total size of those remaining
+    """
+    connection = _get_cache_db()
+    removed = 0
+    with connection:
+        if ttl is not None:
+            removed += connection.execute('DELETE FROM responses WHERE last_access < ?',
+                                          (time.time() - ttl,)).rowcount
+
+        total_size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if max_size is not None and total_size > max_size * 0.9:
+            evict = []
+            for url_hash, size in connection.execute('SELECT url_hash, size FROM responses ORDER BY last_access'):
+                if total_size <= max_size * 0.9:
+                    break
+                evict.append((url_hash,))
+                total_size -= size
+            connection.executemany('DELETE FROM responses WHERE url_hash = ?', evict)
+            removed += len(evict)
+
+    return removed, total_size
+
+
+def _count_cache_stat(stat):
+    """
+    Increment one of the cache hit/miss counters.
+
+    Parameters
+    ----------
+    stat : string
+        {'memory_hits', 'disk_hits', 'misses'}
+
+    Returns
+    -------
+    None
+    """
+    with _memory_cache_lock:
+        _cache_stats[stat] += 1
+
+
+def _memory_cache_get(url):
+    """
+    Retrieve a response from the in-memory cache tier and mark it as most
+    recently used.
+
+    Parameters
+    ----------
+    url : string
+        the url of the request
+
+    Returns
+    -------
+    response_json : dict
+        cached response for url if it is in memory, otherwise None
+    """
+    if settings.cache_memory_max_size <= 0:
+        return None
+
+    with _memory_cache_lock:
+        if url in _memory_cache:
+            response_json, size, added_time = _memory_cache[url]
+            if settings.cache_ttl is None or time.time() - added_time <= settings.cache_ttl:
+                _memory_cache.move_to_end(url)
+                _cache_stats['memory_hits'] += 1
+                return response_json
+            _memory_cache_remove(url)
+
+
+def _memory_cache_put(url, response_json, size):
+    """
+    Add a response to the in-memory cache tier, evicting the least recently
+    used responses while the tier exceeds settings.cache_memory_max_size.
+
+    Parameters
+    ----------
+    url : string
+        the url of the request
+    response_json : dict
+        the json response
+    size : int
+        the size of the response's json text in bytes
+
+    Returns
+    -------
+    None
+    """
+    global _memory_cache_size
+
+    if size > settings.cache_memory_max_size:
+        return
+
+    with _memory_cache_lock:
+        if url in _memory_cache:
+            _memory_cache_remove(url)
+        _memory_cache[url] = (response_json, size, time.time())
+        _memory_cache_size += size
+        while _memory_cache_size > settings.cache_memory_max_size:
+            _memory_cache_remove(next(iter(_memory_cache)))
+
+
+def _memory_cache_remove(url):
+    """
+    Remove a response from the in-memory cache tier. Caller must hold
+    _memory_cache_lock.
+
+    Parameters
+    ----------
+    url : string
+        the url of the request
+
+    Returns
+    -------
+    None
+    """
+    global _memory_cache_size
+
+    _, size, _ = _memory_cache.pop(url)
+    _memory_cache_size -= size
+
+
+def clear_memory_cache():
+    """
+    Empty the in-memory cache tier and reset the cache hit/miss counters.
+
+    Returns
+    -------
+    None
+    """
+    global _memory_cache_size
+
+    with _memory_cache_lock:
+        _memory_cache.clear()
+        _memory_cache_size = 0
+        for stat in _cache_stats:
+            _cache_stats[stat] = 0
+
+
+def get_cache_stats():
+    """
+    Get the cache hit/miss counters and the in-memory tier's current size.
+
+    Returns
+    -------
+    dict
+        memory_hits, disk_hits, and misses counts since the memory cache was
+        last cleared, plus memory_entries and memory_size (in bytes)
+    """
+    with _memory_cache_lock:
+        stats = dict(_cache_stats)
+        stats['memory_entries'] = len(_memory_cache)
+        stats['memory_size'] = _memory_cache_size
+    return stats
+
+
+def _update_cache_size(added_bytes):
+    """
+    Add to the running total of the cache folder's size and prune the cache if
+    the total exceeds settings.cache_max_size.
+
+    Parameters
+    ----------
+    added_bytes : int
+        size of the file just saved to the cache
+
+    Returns
+    -------
+    None
+    """
+    global _cache_size, _cache_size_folder
+
+    with _cache_size_lock:
+        if _cache_size is None or _cache_size_folder != settings.cache_folder:
+            # first save to this folder: measure it, which already includes
+            # the file just saved
+            _cache_size = sum(size for _, size, _ in _get_cache_files())
+            _cache_size_folder = settings.cache_folder
+        else:
+            _cache_size += added_bytes
+        exceeded = _cache_size > settings.cache_max_size
+
+    if exceeded:
+        prune_cache()
+
+
+def _get_cache_files():
+    """
+    List every response file in the cache folder.
+
+    Returns
+    -------
+    list
+        list of (last used time, size in bytes, filepath) tuples
+    """
+    cache_files = []
+    for dirpath, _, filenames in os.walk(settings.cache_folder):
+        for filename in filenames:
+            if filename.endswith(('.json', '.json.gz', '.msgpack', '.msgpack.gz')):
+                filepath = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(filepath)
+                except OSError:
+                    # another thread or process removed it in the meantime
+                    continue
+                cache_files.append((stat.st_mtime, stat.st_size, filepath))
+    return cache_files
+
+
+def prune_cache(max_size=None, ttl=None):
+    """
+    Evict expired and least recently used responses from the cache.
+
+    First removes every response not used within ttl seconds, then, if the
+    cache is still larger than max_size, removes the least recently used
+    responses until it has shrunk to 90% of max_size (so that a full cache
+    does not get pruned again on every save).
+
+    Parameters
+    ----------
+    max_size : int
+        max total size of the cache in bytes, if None, use
+        settings.cache_max_size (and do not enforce a size if that is None too)
+    ttl : int
+        max seconds since a response was last used, if None, use
+        settings.cache_ttl (and do not expire responses if that is None too)
+
+    Returns
+    -------
+    int
+        number of responses removed from the cache
+    """
+    global _cache_size, _cache_size_folder
+
+    if max_size is None:
+        max_size = settings.cache_max_size
+    if ttl is None:
+        ttl = settings.cache_ttl
+
+    start_time = time.time()
+    if settings.cache_backend == 'sqlite':
+        removed, total_size = _sqlite_cache_prune(max_size, ttl)
+        log('Removed {:,} responses from the cache in {:,.2f} seconds, {:,.1f}MB remain'.format(
+            removed, time.time() - start_time, total_size / 1e6))
+        return removed
+
+    cache_files = sorted(_get_cache_files())
+    total_size = sum(size for _, size, _ in cache_files)
+    target_size = None if max_size is None else max_size * 0.9
+
+    removed = 0
+    for mtime, size, filepath in cache_files:
+        expired = ttl is not None and start_time - mtime > ttl
+        oversized = target_size is not None and total_size > target_size
+        if not (expired or oversized):
+            # files are sorted by last use, and ttl only removes the oldest
+            # ones, so we can stop at the first one we keep
+            break
+        try:
+            os.remove(filepath)
+        except OSError:
+            continue
+        total_size -= size
+        removed += 1
+
+    with _cache_size_lock:
+        _cache_size = total_size
+        _cache_size_folder = settings.cache_folder
+
+    log('Removed {:,} responses from the cache in {:,.2f} seconds, {:,.1f}MB remain'.format(
+        removed, time.time() - start_time, total_size / 1e6))
+    return removed
+
+
+def get_http_headers(user_agent=None, referer=None, accept_language=None):
+    """
+    Update the default requests HTTP headers with OSMnx info.
+
+    Parameters
+    ----------
+    user_agent : str
+        the user agent string, if None will set with OSMnx default
+    referer : str
+        the referer string, if None will set with OSMnx default
+    accept_language : str
+        make accept-language explicit e.g. for consistent nominatim result sorting
+
+    Returns
+    -------
+    headers : dict
+    """
+
+    if user_agent is None:
+        user_agent = settings.default_user_agent
+    if referer is None:
+        referer = settings.default_referer
+    if accept_language is None:
+        accept_language = settings.default_accept_language
+
+    headers = requests.utils.default_headers()
+    headers.update({'User-Agent': user_agent, 'referer': referer, 'Accept-Language': accept_language})
+    return headers
+
+
+def get_http_session():
+    """
+    Get the pooled, keep-alive HTTP session shared by all API requests.
+
+    The session is created on first use with the connection pool size,
+    keep-alive, transport-level retry, and header settings, and is re-created
+    whenever any of those settings change. Transport-level retries only cover
+    connection and read errors: HTTP error status codes like 429 and 504 are
+    left to the request functions to handle.
+
+    Returns
+    -------
+    requests.Session
+    """
+    global _session, _session_config
+
+    session_config = (settings.http_pool_connections,
+                      settings.http_pool_maxsize,
+                      settings.http_keep_alive,
+                      settings.http_max_retries,
+                      settings.default_user_agent,
+                      settings.default_referer,
+                      settings.default_accept_language)
+
+    with _session_lock:
+        if _session is None or _session_config != session_config:
+            retries = Retry(total=settings.http_max_retries,
+                            connect=settings.http_max_retries,
+                            read=settings.http_max_retries,
+                            status=0,
+                            backoff_factor=0.5,
+                            raise_on_status=False)
+            adapter = HTTPAdapter(pool_connections=settings.http_pool_connections,
+                                  pool_maxsize=settings.http_pool_maxsize,
+                                  max_retries=retries)
+
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers = get_http_headers()
+            if not settings.http_keep_alive:
+                session.headers['Connection'] = 'close'
+
+            if _session is not None:
+                _session.close()
+            _session = session
+            _session_config = session_config
+            log('Created HTTP session with pool size {}'.format(settings.http_pool_maxsize))
+
+        return _session
+
+
+class RetryPolicy(object):
+    """
+    How to retry requests that an overloaded server rejected.
+
+    Retries are paced by exponential backoff with jitter: before the nth retry
+    the pause is drawn uniformly from the upper half of
+    min(backoff_max, backoff_base * 2 ** (n - 1)), so that several workers
+    rejected at the same moment do not all retry in lockstep. Retrying stops
+    after max_attempts attempts in total, or once the next pause would end
+    after the deadline, counted from when the policy was created (i.e., when
+    the request began). Every generator of pauses from the same policy shares
+    that one deadline.
+
+    Parameters
+    ----------
+    max_attempts : int
+        max number of attempts, including the first one, if None, use
+        settings.retry_max_attempts
+    backoff_base : float
+        cap on the pause before the first retry in seconds, doubled for each
+        further retry, if None, use settings.retry_backoff_base
+    backoff_max : float
+        cap on any pause in seconds, if None, use settings.retry_backoff_max
+    deadline : float
+        max seconds from the first attempt to the last one, if None, use
+        settings.retry_deadline (and have no deadline if that is None too)
+    start_time : float
+        when the request began, as a unix timestamp, if None, now
+    """
+
+    def __init__(self, max_attempts=None, backoff_base=None, backoff_max=None, deadline=None, start_time=None):
+        self.max_attempts = settings.retry_max_attempts if max_attempts is None else max_attempts
+        self.backoff_base = settings.retry_backoff_base if backoff_base is None else backoff_base
+        self.backoff_max = settings.retry_backoff_max if backoff_max is None else backoff_max
+        self.deadline = settings.retry_deadline if deadline is None else deadline
+        self.start_time = time.time() if start_time is None else start_time
+
+    def pauses(self):
+        """
+        Generate the pause before each retry, until attempts or time run out.
+
+        Returns
+        -------
+        generator
+            yields the pause in seconds before each retry
+        """
+        for retry in range(1, self.max_attempts):
+            cap = min(self.backoff_max, self.backoff_base * 2 ** (retry - 1))
+            pause = random.uniform(cap / 2., cap)
+            if self.deadline is not None and time.time() + pause - self.start_time > self.deadline:
+                return
+            yield pause
+
+
+def wait_for_rate_limit(url):
+    """
+    Wait until a request to this URL's host is allowed by its client-side
+    rate limit.
+
+    Each host listed in settings.rate_limits gets a token bucket refilled at
+    its max requests per second, holding at most one token, so requests are
+    spaced exactly 1/rate seconds apart but do not wait at all if that much
+    time has already passed since the last one. Callers reserve their turn
+    before sleeping, so concurrent callers queue up without holding a lock.
+    If settings.rate_limit_folder is set, the bucket lives in a lock file
+    there, so the limit is shared by every process using that folder.
+
+    Parameters
+    ----------
+    url : string
+        the url about to be requested
+
+    Returns
+    -------
+    float
+        how many seconds we waited
+    """
+    host = urlsplit(url).netloc
+    rate = settings.rate_limits.get(host)
+    if not rate:
+        return 0
+
+    with _rate_limit_lock:
+        if settings.rate_limit_folder is None:
+            tokens, last_time = _rate_limit_state.get(host, (1., 0.))
+            wait, state = _take_rate_limit_token(tokens, last_time, rate)
+            _rate_limit_state[host] = state
+        else:
+            if not os.path.exists(settings.rate_limit_folder):
+                os.makedirs(settings.rate_limit_folder, exist_ok=True)
+            filepath = os.path.join(settings.rate_limit_folder, os.extsep.join([host.replace(':', '_'), 'lock']))
+            with _locked_file(filepath) as state_file:
+                state_file.seek(0)
+                try:
+                    tokens, last_time = [float(x) for x in state_file.read().split()]
+                except ValueError:
+                    # new or unreadable state file: start with a full bucket
+                    tokens, last_time = 1., 0.
+                wait, state = _take_rate_limit_token(tokens, last_time, rate)
+                state_file.seek(0)
+                state_file.truncate()
+                state_file.write('{!r} {!r}'.format(*state))
+                state_file.flush()
+
+    if wait > 0:
+        log('Pausing {:,.2f} seconds for {} rate limit'.format(wait, host))
+        time.sleep(wait)
+    return wait
+
+
+def _take_rate_limit_token(tokens, last_time, rate):
+    """
+    Take a token from a token bucket, going into debt if it is empty.
+
+    Parameters
+    ----------
+    tokens : float
+        tokens in the bucket as of last_time (negative if already reserved
+        by callers that are still waiting)
+    last_time : float
+        when the bucket was last updated
+    rate : float
+        tokens added per second
+
+    Returns
+    -------
+    wait, state : tuple
+        seconds to wait until the token is available, and the bucket's new
+        (tokens, last_time) state
+    """
+    now = time.time()
+    tokens = min(1., tokens + (now - last_time) * rate) - 1
+    wait = max(0., -tokens / rate)
+    return wait, (tokens, now)
+
+
+@contextlib.contextmanager
+def _locked_file(filepath):
+    """
+    Open a file for reading and writing while holding an exclusive lock on it
+    that is respected by other processes.
+
+    Parameters
+    ----------
+    filepath : string
+        path to the file, created if it does not exist
+
+    Returns
+    -------
+    file object
+    """
+    with io.open(filepath, 'a+', encoding='utf-8') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield f
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def get_overpass_endpoints():
+    """
+    Get the list of Overpass API endpoints to spread queries across.
+
+    settings.overpass_endpoint may be a single endpoint URL or a list of
+    mirrors. The first one is the primary endpoint: cached responses are
+    keyed by its URL, no matter which mirror actually served them.
+
+    Returns
+    -------
+    list
+    """
+    if isinstance(settings.overpass_endpoint, str):
+        return [settings.overpass_endpoint.rstrip('/')]
+    return [endpoint.rstrip('/') for endpoint in settings.overpass_endpoint]
+
+
+def _get_endpoint_health(endpoint):
+    """
+    Get the health record of an Overpass API endpoint. Caller must hold
+    _endpoint_health_lock.
+
+    Parameters
+    ----------
+    endpoint : string
+        the Overpass API endpoint
+
+    Returns
+    -------
+    dict
+        latency (moving average of seconds per request, None if unknown),
+        failures (consecutive failed requests), and unhealthy_until (time
+        before which the endpoint should not be used)
+    """
+    return _endpoint_health.setdefault(endpoint, {'latency': None, 'failures': 0, 'unhealthy_until': 0})
+
+
+def _record_endpoint_result(endpoint, success, latency=None):
+    """
+    Record the outcome of a request to an Overpass API endpoint. A failure
+    marks the endpoint unhealthy for settings.overpass_endpoint_cooldown
+    seconds, doubled for each further consecutive failure.
+
+    Parameters
+    ----------
+    endpoint : string
+        the Overpass API endpoint
+    success : bool
+        whether the endpoint returned a valid response
+    latency : float
+        how long the request took in seconds, if it succeeded
+
+    Returns
+    -------
+    None
+    """
+    with _endpoint_health_lock:
+        health = _get_endpoint_health(endpoint)
+        if success:
+            health['failures'] = 0
+            health['unhealthy_until'] = 0
+            if latency is not None:
+                if health['latency'] is None:
+                    health['latency'] = latency
+                else:
+                    health['latency'] = 0.7 * health['latency'] + 0.3 * latency
+        else:
+            health['failures'] += 1
+            cooldown = min(settings.overpass_endpoint_cooldown * 2 ** (health['failures'] - 1), 3600)
+            health['unhealthy_until'] = time.time() + cooldown
+            if len(get_overpass_endpoints()) > 1:
+                log('Marked {} unhealthy for {:,.0f} seconds'.format(endpoint, cooldown), level=lg.WARNING)
+
+
+def choose_overpass_endpoint(probe_status=True, retry_policy=None):
+    """
+    Choose the Overpass API endpoint to send the next query to.
+
+    Among the healthy endpoints (or, if none is healthy, the one that will
+    recover soonest), pick the one with the shortest expected wait: the pause
+    until it has a free slot, per its status endpoint, plus its recent
+    average latency. Endpoints running queries in all of this client's slots
+    come last. The candidates are checked without waiting on them or claiming
+    their slots, and only the chosen one's slot is then claimed and waited
+    for if it is busy.
+
+    Parameters
+    ----------
+    probe_status : bool
+        if True, check the candidates' status endpoints for free slots,
+        otherwise choose by health and latency alone and return a pause of 0
+    retry_policy : RetryPolicy
+        passed to get_pause_duration when claiming the chosen endpoint's slot
+
+    Returns
+    -------
+    endpoint, pause_duration : tuple
+    """
+    endpoints = get_overpass_endpoints()
+    if len(endpoints) == 1:
+        pause_duration = get_pause_duration(retry_policy=retry_policy, endpoint=endpoints[0]) if probe_status else 0
+        return endpoints[0], pause_duration
+
+    now = time.time()
+    with _endpoint_health_lock:
+        health = {endpoint: dict(_get_endpoint_health(endpoint)) for endpoint in endpoints}
+    candidates = [endpoint for endpoint in endpoints if health[endpoint]['unhealthy_until'] <= now]
+    if not candidates:
+        candidates = [min(endpoints, key=lambda endpoint: health[endpoint]['unhealthy_until'])]
+
+    best = None
+    for endpoint in candidates:
+        pause_duration = 0
+        if probe_status:
+            try:
+                pause_duration = _check_overpass_slot(endpoint)
+            except Exception as e:
+                log('Unable to query {}/status: {}'.format(endpoint, e), level=lg.ERROR)
+                pause_duration = 10
+        busy = pause_duration is None
+        expected_wait = (pause_duration or 0) + (health[endpoint]['latency'] or 0)
+        if best is None or (busy, expected_wait) < best[:2]:
+            best = (busy, expected_wait, endpoint)
+    busy, expected_wait, endpoint = best
+
+    log('Chose Overpass endpoint {} with expected wait {:,.2f} seconds{}'.format(
+        endpoint, expected_wait, ' (busy)' if busy else ''))
+    pause_duration = get_pause_duration(retry_policy=retry_policy, endpoint=endpoint) if probe_status else 0
+    return endpoint, pause_duration
+
+
+def _probe_overpass_status(endpoint):
+    """
+    Query and parse an Overpass API endpoint's status.
+
+    Parameters
+    ----------
+    endpoint : string
+        the Overpass API endpoint
+
+    Returns
+    -------
+    dict
+        rate_limit (number of slots granted to this client, 0 if unlimited),
+        available_slots (number of slots free now), slot_times (list of UTC
+        datetimes when the other slots become free), and busy (True if all
+        slots are taken by currently running queries)
+    """
+    response = get_http_session().get(endpoint + '/status')
+    lines = response.text.split('\n')
+
+    # the third line of the status looks like "Rate limit: 2", the fourth
+    # like "2 slots available now.", "Slot available after: <time>, in <n>
+    # seconds." or "Currently running queries ..."
+    rate_limit = int(lines[2].split(' ')[-1])
+    status_first_token = lines[3].split(' ')[0]
+    if status_first_token not in ('Slot', 'Currently'):
+        try:
+            int(status_first_token)
+        except ValueError:
+            raise ValueError('Unrecognized server status: "{}"'.format(lines[3]))
+
+    available_slots = int(status_first_token) if status_first_token.isdigit() else 0
+    slot_times = []
+    for line in lines[3:]:
+        tokens = line.split(' ')
+        if tokens[0] == 'Slot':
+            slot_times.append(date_parser.parse(tokens[3].rstrip(',')).replace(tzinfo=None))
+
+    return {'rate_limit': rate_limit,
+            'available_slots': available_slots,
+            'slot_times': sorted(slot_times),
+            'busy': status_first_token == 'Currently'}
+
+
+def get_pause_duration(recursive_delay=5, default_duration=10, retry_policy=None, endpoint=None):
+    """
+    Check the Overpass API status endpoint to determine how long to wait until
+    next slot is available.
+
+    Parameters
+    ----------
+    recursive_delay : int
+        minimum time to wait before checking the status again if server is
+        currently running a query
+    default_duration : int
+        if fatal error, or the server is still busy once the retry policy is
+        exhausted, function falls back on returning this value
+    retry_policy : RetryPolicy
+        how often to check the status again while the server is busy, if
+        None, use a RetryPolicy with the default settings
+    endpoint : string
+        the Overpass API endpoint to check, if None, use the primary endpoint
+
+    Returns
+    -------
+    int
+    """
+
+    if endpoint is None:
+        endpoint = get_overpass_endpoints()[0]
+    if retry_policy is None:
+        retry_policy = RetryPolicy()
+    retry_pauses = retry_policy.pauses()
+
+    while True:
+        try:
+            pause_duration = _claim_overpass_slot(endpoint)
+        except Exception as e:
+            # if we cannot reach the status endpoint or parse its output, log an
+            # error and return default duration
+            log('Unable to query {}/status: {}'.format(endpoint, e), level=lg.ERROR)
+            return default_duration
+
+        if pause_duration is not None:
+            return pause_duration
+
+        # if the server is currently running your queries in every slot, back
+        # off, then check again
+        retry_pause = next(retry_pauses, None)
+        if retry_pause is None:
+            log('Server is still busy, giving up checking its status', level=lg.WARNING)
+            return default_duration
+        time.sleep(max(recursive_delay, retry_pause))
+
+
+def _get_overpass_status(endpoint, refresh=False):
+    """
+    Get an Overpass API endpoint's parsed status, from the status cache if it
+    was probed within the last settings.overpass_status_cache_duration
+    seconds, otherwise by probing its status endpoint. The probe runs without
+    holding _overpass_status_lock, so other threads do not wait on it.
+
+    Parameters
+    ----------
+    endpoint : string
+        the Overpass API endpoint
+    refresh : bool
+        if True, probe the status endpoint even if the cached status is fresh
+
+    Returns
+    -------
+    dict
+        see _probe_overpass_status, plus probe_time
+    """
+    with _overpass_status_lock:
+        status = _overpass_status.get(endpoint)
+    if refresh or status is None or time.time() - status['probe_time'] > settings.overpass_status_cache_duration:
+        status = _probe_overpass_status(endpoint)
+        status['probe_time'] = time.time()
+        with _overpass_status_lock:
+            _overpass_status[endpoint] = status
+    return status
+
+
+def _get_slot_status(endpoint):
+    """
+    Get an Overpass API endpoint's status to check or claim a slot from,
+    probing it again if this client already used up the free slots and slot
+    expiry times it knew about.
+
+    Parameters
+    ----------
+    endpoint : string
+        the Overpass API endpoint
+
+    Returns
+    -------
+    dict
+        see _get_overpass_status
+    """
+    status = _get_overpass_status(endpoint)
+    with _overpass_status_lock:
+        used_up = status['available_slots'] < 1 and not status['slot_times'] and 'claimed' in status
+    if used_up:
+        # we used up what we knew about: see what the server says now
+        status = _get_overpass_status(endpoint, refresh=True)
+    return status
+
+
+def _next_slot_pause(status, claim):
+    """
+    Get the pause until this client's next slot per an Overpass API
+    endpoint's status, and optionally claim that slot. Caller must hold
+    _overpass_status_lock.
+
+    Parameters
+    ----------
+    status : dict
+        see _get_overpass_status
+    claim : bool
+        if True, consume the slot from the status
+
+    Returns
+    -------
+    int
+        seconds to pause until the slot is free, or None if the server is
+        running queries in all of this client's slots
+    """
+    if claim:
+        status['claimed'] = True
+
+    # if slots are available now, no wait required
+    if status['available_slots'] > 0:
+        if claim:
+            status['available_slots'] -= 1
+        return 0
+
+    # otherwise, the status tells you when your next slot will be free
+    elif status['slot_times']:
+        slot_time = status['slot_times'].pop(0) if claim else status['slot_times'][0]
+        pause_duration = math.ceil((slot_time - dt.datetime.utcnow()).total_seconds())
+        return max(pause_duration, 1)
+
+    elif status['busy']:
+        return None
+
+    else:
+        return 0
+
+
+def _check_overpass_slot(endpoint):
+    """
+    Check how long until this client's next slot at an Overpass API endpoint
+    is free, without claiming it.
+
+    Parameters
+    ----------
+    endpoint : string
+        the Overpass API endpoint
+
+    Returns
+    -------
+    int
+        seconds to pause until the next slot is free, or None if the server
+        is running queries in all of this client's slots
+    """
+    status = _get_slot_status(endpoint)
+    with _overpass_status_lock:
+        return _next_slot_pause(status, claim=False)
+
+
+def _claim_overpass_slot(endpoint):
+    """
+    Claim this client's next slot at an Overpass API endpoint.
+
+    Consecutive requests consume the free slots and the known slot expiry
+    times from the cached status, and only re-probe the status endpoint once
+    those run out or the cached status gets stale. Claims are never given
+    back, so the cached status can only underestimate the free slots.
+
+    Parameters
+    ----------
+    endpoint : string
+        the Overpass API endpoint
+
+    Returns
+    -------
+    int
+        seconds to pause until the claimed slot is free, or None if the
+        server is running queries in all of this client's slots
+    """
+    status = _get_slot_status(endpoint)
+    with _overpass_status_lock:
+        # claim from the latest cached status, in case another thread probed
+        # the endpoint again meanwhile
+        status = _overpass_status.get(endpoint, status)
+        return _next_slot_pause(status, claim=True)
+
+
+def _forget_overpass_status(endpoint):
+    """
+    Drop an Overpass API endpoint's cached status, e.g. after it rejected a
+    request, so that the next request probes it again.
+
+    Parameters
+    ----------
+    endpoint : string
+        the Overpass API endpoint
+
+    Returns
+    -------
+    None
+    """
+    with _overpass_status_lock:
+        _overpass_status.pop(endpoint, None)
+
+
+def get_overpass_slot_count(default_slots=1):
+    """
+    Check the Overpass API status endpoints to determine how many query slots
+    (ie, concurrent requests) the servers grant to this client, in total
+    across all the healthy endpoints.
+
+    Parameters
+    ----------
+    default_slots : int
+        if fatal error, function falls back on counting this value for an
+        endpoint
+
+    Returns
+    -------
+    int
+        number of slots, or 0 if a server does not rate limit this client
+    """
+
+    now = time.time()
+    with _endpoint_health_lock:
+        endpoints = [endpoint for endpoint in get_overpass_endpoints()
+                     if _get_endpoint_health(endpoint)['unhealthy_until'] <= now]
+
+    slot_count = 0
+    for endpoint in endpoints or get_overpass_endpoints()[:1]:
+        try:
+            rate_limit = _get_overpass_status(endpoint)['rate_limit']
+        except Exception:
+            # if we cannot reach the status endpoint or parse its output, log an
+            # error and use default slot count
+            log('Unable to query {}/status'.format(endpoint), level=lg.ERROR)
+            rate_limit = default_slots
+        if rate_limit == 0:
+            return 0
+        slot_count += rate_limit
+
+    return slot_count
+
+
+def osm_polygon_download(query, limit=1, polygon_geojson=1):
+    """
+    Geocode a place and download its boundary geometry from OSM's Nominatim API.
+
+    Parameters
+    ----------
+    query : string or dict
+        query string or structured query dict to geocode/download
+    limit : int
+        max number of results to return
+    polygon_geojson : int
+        request the boundary geometry polygon from the API, 0=no, 1=yes
+
+    Returns
+    -------
+    dict
+    """
+    # define the parameters
+    params = OrderedDict()
+    params['format'] = 'json'
+    params['limit'] = limit
+    params['dedupe'] = 0  # prevent OSM from deduping results so we get precisely 'limit' # of results
+    params['polygon_geojson'] = polygon_geojson
+
+    # add the structured query dict (if provided) to params, otherwise query
+    # with place name string
+    if isinstance(query, str):
+        params['q'] = query
+    elif isinstance(query, dict):
+        # add the query keys in alphabetical order so the URL is the same string
+        # each time, for caching purposes
+        for key in sorted(list(query.keys())):
+            params[key] = query[key]
+    else:
+        raise TypeError('query must be a dict or a string')
+
+    # request the URL, return the JSON
+    response_json = nominatim_request(params=params, timeout=30)
+    return response_json
+
+
+def osm_lookup_download(osm_ids, polygon_geojson=1, batch_size=50):
+    """
+    Look up places by their OSM ids and download their boundary geometries
+    from OSM's Nominatim API, in batches.
+
+    Each id's result is also cached under its own key (the URL of a lookup
+    of that id alone), so that later lookups of any batch containing it are
+    served from the cache, and only the remaining ids get requested.
+
+    Parameters
+    ----------
+    osm_ids : list
+        OSM ids prefixed by their type, e.g., 'R175905' for a relation, 'W123'
+        for a way, or 'N456' for a node
+    polygon_geojson : int
+        request the boundary geometry polygon from the API, 0=no, 1=yes
+    batch_size : int
+        max number of ids to look up per request (Nominatim allows 50)
+
+    Returns
+    -------
+    list
+        the result dict for each id, or None if it was not found
+    """
+    url = settings.nominatim_endpoint.rstrip('/') + '/lookup'
+
+    def make_params(ids):
+        params = OrderedDict()
+        params['format'] = 'json'
+        params['polygon_geojson'] = polygon_geojson
+        params['osm_ids'] = ','.join(ids)
+        return params
+
+    def id_key(osm_id):
+        return requests.Request('GET', url, params=make_params([osm_id])).prepare().url
+
+    # serve the ids found in the keyed cache, and request the rest in batches
+    results = {}
+    to_request = []
+    for osm_id in OrderedDict.fromkeys(osm_ids):
+        cached_response_json = get_from_cache(id_key(osm_id))
+        if cached_response_json is not None:
+            results[osm_id] = cached_response_json[0] if cached_response_json else None
+        else:
+            to_request.append(osm_id)
+
+    for i in range(0, len(to_request), batch_size):
+        batch = to_request[i:i + batch_size]
+        response_json = nominatim_request(params=make_params(batch), type='lookup', timeout=30)
+        batch_results = {'{}{}'.format(result['osm_type'][0].upper(), result['osm_id']): result
+                         for result in response_json}
+        for osm_id in batch:
+            result = batch_results.get(osm_id.upper())
+            results[osm_id] = result
+            save_to_cache(id_key(osm_id), [result] if result is not None else [])
+
+    log('Looked up {:,} OSM ids in {:,} request(s)'.format(len(results), int(math.ceil(len(to_request) / batch_size))))
+    return [results[osm_id] for osm_id in osm_ids]
+
+
+def nominatim_request(params, type="search", pause_duration=None, timeout=30, error_pause_duration=None):
+    """
+    Send a request to the Nominatim API via HTTP GET and return the JSON
+    response.
+
+    Concurrent identical requests (e.g., from several threads) are coalesced,
+    so that only one of them goes to the server and the others wait for and
+    share its response. If settings.offline is True, only serve the response
+    from the cache, and raise an OfflineCacheMiss error if it is not there.
+
+    Parameters
+    ----------
+    params : dict or OrderedDict
+        key-value pairs of parameters
+    type : string
+        Type of Nominatim query. One of the following: search, reverse or lookup
+    pause_duration : int
+        how long to pause before requests, in seconds, on top of waiting for
+        the host's rate limit in settings.rate_limits. if None, only wait for
+        the rate limit
+    timeout : int
+        the timeout interval for the requests library
+    error_pause_duration : int
+        minimum time to pause in seconds before re-trying requests if error,
+        on top of the retry policy's backoff
+
+    Returns
+    -------
+    response_json : dict
+    """
+
+    known_requests = {"search", "reverse", "lookup"}
+    if type not in known_requests:
+        raise ValueError(
+            "The type of Nominatim request is invalid. Please choose one of {{'search', 'reverse', 'lookup'}}")
+
+    # prepare the Nominatim API URL and see if request already exists in the
+    # cache
+    url = settings.nominatim_endpoint.rstrip('/') + '/{}'.format(type)
+    prepared_url = requests.Request('GET', url, params=params).prepare().url
+    cached_response_json = get_from_cache(prepared_url)
+
+    if settings.nominatim_key:
+        params['key'] = settings.nominatim_key
+
+    if cached_response_json is not None:
+        # found this request in the cache, just return it instead of making a
+        # new HTTP call
+        return cached_response_json
+
+    else:
+        # if this URL is not already in the cache, request it, unless another
+        # thread is already requesting it or we are offline
+        _check_offline(prepared_url)
+        return _single_flight(prepared_url, lambda: _nominatim_download(url, prepared_url, params, pause_duration,
+                                                                        timeout, error_pause_duration))
+
+
+def _nominatim_download(url, prepared_url, params, pause_duration, timeout, error_pause_duration):
+    """
+    Pause, then request a URL from the Nominatim API via HTTP GET, save the
+    JSON response to the cache, and return it.
+
+    Parameters
+    ----------
+    url : string
+        the Nominatim API URL
+    prepared_url : string
+        the GET-style URL with its parameters, to save to the cache
+    params : dict or OrderedDict
+        key-value pairs of parameters
+    pause_duration : int
+        how long to pause before requests, in seconds, on top of waiting for
+        the host's rate limit. if None, only wait for the rate limit
+    timeout : int
+        the timeout interval for the requests library
+    error_pause_duration : int
+        minimum time to pause in seconds before re-trying requests if error
+
+    Returns
+    -------
+    response_json : dict
+    """
+
+    retry_pauses = RetryPolicy().pauses()
+    while True:
+        if pause_duration is not None:
+            log('Pausing {:,.2f} seconds before making API GET request'.format(pause_duration))
+            time.sleep(pause_duration)
+        wait_for_rate_limit(url)
+        start_time = time.time()
+        log('Requesting {} with timeout={}'.format(prepared_url, timeout))
+        response = get_http_session().get(url, params=params, timeout=timeout)
+
+        # get the response size and the domain, log result
+        size_kb = len(response.content) / 1000.
+        domain = re.findall(r'(?s)//(.*?)/', url)[0]
+        log('Downloaded {:,.1f}KB from {} in {:,.2f} seconds'.format(size_kb, domain, time.time() - start_time))
+
+        try:
+            response_json = response.json()
+            save_to_cache(prepared_url, response_json)
+            return response_json
+        except Exception:
+            pass
+
+        # 429 is 'too many requests' and 504 is 'gateway timeout' from server
+        # overload - handle these errors by backing off and re-trying until we
+        # get a valid response or the retry policy is exhausted
+        if response.status_code in [429, 504]:
+            retry_pause = next(retry_pauses, None)
+            if retry_pause is None:
+                log('Server at {} returned status code {} and no JSON data. Giving up.'.format(
+                    domain, response.status_code), level=lg.ERROR)
+                raise RetriesExhausted('Server kept returning status code {}.\n{} {}'.format(
+                    response.status_code, response, response.reason))
+            if error_pause_duration is not None:
+                retry_pause = max(retry_pause, error_pause_duration)
+            log(
+                'Server at {} returned status code {} and no JSON data. Re-trying request in {:.2f} seconds.'.format(
+                    domain,
+                    response.status_code,
+                    retry_pause),
+                level=lg.WARNING)
+            time.sleep(retry_pause)
+
+        # else, this was an unhandled status_code, throw an exception
+        else:
+            log('Server at {} returned status code {} and no JSON data'.format(domain, response.status_code),
+                level=lg.ERROR)
+            raise Exception(
+                'Server returned no JSON data.\n{} {}\n{}'.format(response, response.reason, response.text))
+
+
+def overpass_request(data, pause_duration=None, timeout=180, error_pause_duration=None, stream=None):
+    """
+    Send a request to the Overpass API via HTTP POST and return the JSON
+    response.
+
+    Concurrent identical requests (e.g., from several threads) are coalesced,
+    so that only one of them goes to the server and the others wait for and
+    share its response. If settings.offline is True, only serve the response
+    from the cache, and raise an OfflineCacheMiss error if it is not there.
+
+    If streaming, the response body is written to the cache (or to a
+    temporary file if not caching) chunk by chunk as it downloads, and the
+    returned response's 'elements' is a re-iterable sequence that parses the
+    elements incrementally from that file each time it is iterated, instead of
+    a list. This keeps memory use flat for very large responses. Only the
+    'elements' of a streamed response are returned.
+
+    Parameters
+    ----------
+    data : dict or OrderedDict
+        key-value pairs of parameters to post to the API
+    pause_duration : int
+        how long to pause in seconds before requests, if None, will query API
+        status endpoint to find when next slot is available
+    timeout : int
+        the timeout interval for the requests library
+    error_pause_duration : int
+        minimum time to pause in seconds before re-trying requests if error,
+        on top of the retry policy's backoff. if None, will query API status
+        endpoint to find when next slot is available
+    stream : bool
+        if True, stream the response as described above, if None, use
+        settings.overpass_stream_responses
+
+    Returns
+    -------
+    dict
+    """
+
+    if stream is None:
+        stream = settings.overpass_stream_responses
+    get_cached = _get_streamed_from_cache if stream else get_from_cache
+
+    # define the Overpass API URL, then construct a GET-style URL as a string to
+    # hash to look up/save to cache
+    url = get_overpass_endpoints()[0] + '/interpreter'
+    prepared_url = requests.Request('GET', url, params=data).prepare().url
+    cached_response_json = get_cached(prepared_url)
+
+    if cached_response_json is not None:
+        # found this request in the cache, just return it instead of making a
+        # new HTTP call
+        return cached_response_json
+
+    else:
+        # if this URL is not already in the cache, request it, unless another
+        # thread is already requesting it or we are offline
+        _check_offline(prepared_url)
+        return _single_flight(prepared_url, lambda: _overpass_download(prepared_url, data, pause_duration,
+                                                                       timeout, error_pause_duration, stream),
+                              get_cached=get_cached)
+
+
+def _overpass_download(prepared_url, data, pause_duration, timeout, error_pause_duration, stream=False):
+    """
+    Choose an endpoint, pause, then post a query to the Overpass API, save the
+    JSON response to the cache, and return it.
+
+    Parameters
+    ----------
+    prepared_url : string
+        the GET-style URL with its parameters, to save to the cache
+    data : dict or OrderedDict
+        key-value pairs of parameters to post to the API
+    pause_duration : int
+        how long to pause in seconds before requests, if None, will query API
+        status endpoint to find when next slot is available
+    timeout : int
+        the timeout interval for the requests library
+    error_pause_duration : int
+        minimum time to pause in seconds before re-trying requests if error,
+        if None, will query API status endpoint to find when next slot is
+        available
+    stream : bool
+        if True, stream the response body to disk and return its elements as
+        a re-iterable sequence parsed incrementally from there
+
+    Returns
+    -------
+    dict
+    """
+
+    retry_policy = RetryPolicy()
+    retry_pauses = retry_policy.pauses()
+    while True:
+        endpoint, this_pause_duration = choose_overpass_endpoint(probe_status=pause_duration is None,
+                                                                 retry_policy=retry_policy)
+        if pause_duration is not None:
+            this_pause_duration = pause_duration
+        url = endpoint + '/interpreter'
+        log('Pausing {:,.2f} seconds before making API POST request'.format(this_pause_duration))
+        time.sleep(this_pause_duration)
+        wait_for_rate_limit(url)
+        start_time = time.time()
+        log('Posting to {} with timeout={}, "{}"'.format(url, timeout, data))
+        try:
+            response = get_http_session().post(url, data=data, timeout=timeout, stream=stream)
+            if stream and response.status_code == 200:
+                response_json = _save_streamed_response(prepared_url, response)
+                _record_endpoint_result(endpoint, success=True, latency=time.time() - start_time)
+                log('Streamed response from {} in {:,.2f} seconds'.format(url, time.time() - start_time))
+                return response_json
+        except requests.exceptions.RequestException:
+            # if there are mirrors to fall back on, mark this one unhealthy and
+            # retry elsewhere, otherwise let the connection error propagate
+            _record_endpoint_result(endpoint, success=False)
+            if len(get_overpass_endpoints()) > 1 and next(retry_pauses, None) is not None:
+                continue
+            raise
+
+        # get the response size and the domain, log result
+        size_kb = len(response.content) / 1000.
+        domain = re.findall(r'(?s)//(.*?)/', url)[0]
+        log('Downloaded {:,.1f}KB from {} in {:,.2f} seconds'.format(size_kb, domain, time.time() - start_time))
+
+        try:
+            response_json = response.json()
+            if 'remark' in response_json:
+                log('Server remark: "{}"'.format(response_json['remark'], level=lg.WARNING))
+            _record_endpoint_result(endpoint, success=True, latency=time.time() - start_time)
+            save_to_cache(prepared_url, response_json)
+            return response_json
+        except Exception:
+            pass
+
+        # 429 is 'too many requests' and 504 is 'gateway timeout' from server
+        # overload - handle these errors by backing off and re-trying until we
+        # get a valid response or the retry policy is exhausted
+        if response.status_code in [429, 504]:
+            _record_endpoint_result(endpoint, success=False)
+            _forget_overpass_status(endpoint)
+            retry_pause = next(retry_pauses, None)
+            if retry_pause is None:
+                log('Server at {} returned status code {} and no JSON data. Giving up.'.format(
+                    domain, response.status_code), level=lg.ERROR)
+                raise RetriesExhausted('Server kept returning status code {}.\n{} {}'.format(
+                    response.status_code, response, response.reason))
+            if len(get_overpass_endpoints()) > 1:
+                # another endpoint may be able to take the query right away:
+                # choosing it will wait for its next free slot
+                retry_pause = 0 if error_pause_duration is None else error_pause_duration
+            elif error_pause_duration is None:
+                # the next attempt claims its slot when it chooses the
+                # endpoint, so just back off here rather than claim a slot
+                # twice for the same retry. with a fixed pause_duration it
+                # doesn't check the status, so check (without claiming) here
+                if pause_duration is not None:
+                    try:
+                        retry_pause = max(retry_pause, _check_overpass_slot(endpoint) or 0)
+                    except Exception as e:
+                        log('Unable to query {}/status: {}'.format(endpoint, e), level=lg.ERROR)
+            else:
+                retry_pause = max(retry_pause, error_pause_duration)
+            log(
+                'Server at {} returned status code {} and no JSON data. Re-trying request in {:.2f} seconds.'.format(
+                    domain,
+                    response.status_code,
+                    retry_pause),
+                level=lg.WARNING)
+            time.sleep(retry_pause)
+
+        # else, this was an unhandled status_code, throw an exception
+        else:
+            log('Server at {} returned status code {} and no JSON data'.format(domain, response.status_code),
+                level=lg.ERROR)
+            raise Exception(
+                'Server returned no JSON data.\n{} {}\n{}'.format(response, response.reason, response.text))
+
+
+def _check_offline(url):
+    """
+    Raise an OfflineCacheMiss error if in offline mode, for a request that is
+    not in the cache. Any API key in the url is left out of the message.
+
+    Parameters
+    ----------
+    url : string
+        the url of the request
+
+    Returns
+    -------
+    None
+    """
+    if settings.offline:
+        url = re.sub(r'([?&]key=)[^&]*', r'\1...', url)
+        raise OfflineCacheMiss('Cannot request "{}" because settings.offline is True '
+                               'and it is not in the cache'.format(url))
+
+
+def _single_flight(key, request_func, get_cached=None):
+    """
+    Call request_func to make a request, unless an identical request is
+    already in flight in another thread, in which case wait for that one to
+    finish and return its response (or raise its exception) instead.
+
+    Parameters
+    ----------
+    key : string
+        the prepared URL of the request, as used for caching
+    request_func : function
+        makes the request and returns its response json
+    get_cached : function
+        looks up the response in the cache, if None, use get_from_cache
+
+    Returns
+    -------
+    response_json : dict
+    """
+
+    with _inflight_lock:
+        call = _inflight.get(key)
+        is_leader = call is None
+        if is_leader:
+            call = {'done': threading.Event(), 'response_json': None, 'error': None}
+            _inflight[key] = call
+
+    if not is_leader:
+        log('Waiting for identical request already in flight for URL "{}"'.format(key))
+        call['done'].wait()
+        if call['error'] is not None:
+            raise call['error']
+        return call['response_json']
+
+    try:
+        # an identical request may have finished and been cached between our
+        # cache lookup and becoming the leader
+        if get_cached is None:
+            get_cached = get_from_cache
+        response_json = get_cached(key)
+        if response_json is None:
+            response_json = request_func()
+        call['response_json'] = response_json
+        return response_json
+    except Exception as e:
+        call['error'] = e
+        raise
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+        call['done'].set()
+
+
+def overpass_requests_parallel(datas, timeout=180, concurrent_requests=None, stream=None):
+    """
+    Send several requests to the Overpass API, concurrently if configured, and
+    return their JSON responses in the same order as the requests.
+
+    Parameters
+    ----------
+    datas : list
+        list of dicts or OrderedDicts of key-value parameters to post to the
+        API, one per request
+    timeout : int
+        the timeout interval for the requests library
+    concurrent_requests : int
+        max number of requests to have in flight at once, if None, use
+        settings.overpass_concurrent_requests. this is further capped by the
+        number of slots the server grants to this client
+    stream : bool
+        if True, stream the responses (see overpass_request), if None, use
+        settings.overpass_stream_responses
+
+    Returns
+    -------
+    response_jsons : list
+    """
+
+    if concurrent_requests is None:
+        concurrent_requests = settings.overpass_concurrent_requests
+    max_workers = min(concurrent_requests, len(datas))
+
+    # never run more requests at once than the server has slots for us,
+    # otherwise the surplus requests just get rejected with a 429
+    if max_workers > 1:
+        slot_count = get_overpass_slot_count()
+        if slot_count > 0:
+            max_workers = min(max_workers, slot_count)
+
+    if max_workers <= 1:
+        return [overpass_request(data=data, timeout=timeout, stream=stream) for data in datas]
+
+    # executor.map yields results in the order of datas, regardless of the
+    # order in which the requests complete
+    log('Requesting {:,} Overpass queries with {:,} concurrent workers'.format(len(datas), max_workers))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        response_jsons = list(executor.map(lambda data: overpass_request(data=data, timeout=timeout, stream=stream),
+                                           datas))
+
+    return response_jsons
+
+
+def iter_overpass_elements(text_stream, chunk_size=1048576):
+    """
+    Incrementally parse the elements of an Overpass API JSON response.
+
+    Reads the response text chunk by chunk and yields each element of its
+    'elements' array as soon as it has been read, so that only one chunk and
+    one element are held in memory at a time. Other top-level keys are
+    skipped, except that a server remark gets logged.
+
+    Parameters
+    ----------
+    text_stream : file-like object
+        text stream of the JSON response
+    chunk_size : int
+        how many characters to read at a time
+
+    Returns
+    -------
+    generator
+        yields each element dict
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+
+    def read_more():
+        # drop what has been parsed already and append the next chunk
+        nonlocal buffer, pos
+        chunk = text_stream.read(chunk_size)
+        if not chunk:
+            return False
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return True
+
+    def next_char():
+        # skip whitespace and return the next character, without consuming it
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buffer):
+                return buffer[pos]
+            if not read_more():
+                raise ValueError('Unexpected end of Overpass JSON response')
+
+    def consume(chars):
+        nonlocal pos
+        char = next_char()
+        if char not in chars:
+            raise ValueError('Expected one of {!r} in Overpass JSON response, got {!r}'.format(chars, char))
+        pos += 1
+        return char
+
+    def decode():
+        # decode the next value, reading more until it is complete. a number
+        # cut off by the end of the buffer (e.g., "1." of "1.5") decodes to
+        # its prefix, so read more and decode it again in that case
+        nonlocal pos
+        next_char()
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                if not read_more():
+                    raise
+                continue
+            if buffer[pos] in '-0123456789' and buffer[end:end + 1] in ('', '.', 'e', 'E', '+', '-') \
+                    and read_more():
+                continue
+            pos = end
+            return value
+
+    consume('{')
+    if next_char() == '}':
+        return
+    while True:
+        key = decode()
+        consume(':')
+        if key == 'elements':
+            consume('[')
+            if next_char() == ']':
+                pos += 1
+            else:
+                while True:
+                    yield decode()
+                    if consume(',]') == ']':
+                        break
+        else:
+            value = decode()
+            if key == 'remark':
+                log('Server remark: "{}"'.format(value), level=lg.WARNING)
+        if consume(',}') == '}':
+            return
+
+
+class _StreamedElements(object):
+    """
+    Re-iterable sequence of the elements of an Overpass API JSON response,
+    parsed incrementally from its text each time it is iterated.
+
+    It only holds the path of the file (or the text) of the response, so it
+    pickles cheaply, e.g., to parse it in a worker process.
+
+    Parameters
+    ----------
+    filepath : string
+        path of the (possibly gzipped) json file of the response
+    json_str : string
+        the json text of the response, if not reading it from a file
+    temp : bool
+        if True, filepath is a temporary file, to remove once this sequence
+        is garbage collected
+    compressed : bool
+        if True, the file is gzipped, if None, it is if filepath ends with .gz
+    """
+
+    def __init__(self, filepath=None, json_str=None, temp=False, compressed=None):
+        self.filepath = filepath
+        self.json_str = json_str
+        self.compressed = filepath is not None and filepath.endswith('.gz') if compressed is None else compressed
+        if temp:
+            weakref.finalize(self, _remove_file, filepath)
+
+    def __iter__(self):
+        if self.filepath is None:
+            text_stream = io.StringIO(self.json_str)
+        elif self.compressed:
+            text_stream = gzip.open(self.filepath, 'rt', encoding='utf-8')
+        else:
+            text_stream = io.open(self.filepath, encoding='utf-8')
+        with text_stream:
+            for element in iter_overpass_elements(text_stream):
+                yield element
+
+
+def _remove_file(filepath):
+    """
+    Remove a file, ignoring errors if it is already gone or still in use.
+
+    Parameters
+    ----------
+    filepath : string
+
+    Returns
+    -------
+    None
+    """
+    try:
+        os.remove(filepath)
+    except OSError:
+        pass
+
+
+def _snapshot_file(filepath):
+    """
+    Hard link a file (or copy it, if it cannot be linked) to a private
+    temporary file next to it, which stays readable as it is now even if the
+    file gets removed or replaced afterwards.
+
+    Parameters
+    ----------
+    filepath : string
+
+    Returns
+    -------
+    string
+        path of the temporary file, or None if the file is already gone
+    """
+    handle, snapshot_filepath = tempfile.mkstemp(suffix='.snapshot.tmp', dir=os.path.dirname(filepath))
+    os.close(handle)
+    os.remove(snapshot_filepath)
+    try:
+        os.link(filepath, snapshot_filepath)
+    except FileNotFoundError:
+        return None
+    except OSError:
+        try:
+            shutil.copyfile(filepath, snapshot_filepath)
+        except FileNotFoundError:
+            _remove_file(snapshot_filepath)
+            return None
+    return snapshot_filepath
+
+
+def _get_streamed_from_cache(url):
+    """
+    Retrieve a cached Overpass API response as a streamed response, whose
+    elements are parsed incrementally each time they are iterated.
+
+    A cache file is snapshotted when it is retrieved, so that evicting or
+    replacing it afterwards does not affect iterating the elements. With the
+    sqlite cache backend, the response text is decompressed into memory
+    first, but it is still not parsed all at once.
+
+    Parameters
+    ----------
+    url : string
+        the url of the request
+
+    Returns
+    -------
+    response_json : dict
+        streamed response for url if it exists in the cache, otherwise None
+    """
+    if not settings.use_cache:
+        return None
+
+    if settings.cache_backend == 'sqlite':
+        json_str = _sqlite_cache_get(url)
+        if json_str is None:
+            return None
+        elements = _StreamedElements(json_str=json_str)
+    else:
+        cache_filepath = url_in_cache(url)
+        if cache_filepath is None:
+            return None
+        if _is_msgpack_file(cache_filepath):
+            # msgpack responses already load their elements as compact arrays
+            return get_from_cache(url)
+        if settings.cache_max_size is not None or settings.cache_ttl is not None:
+            try:
+                os.utime(cache_filepath, None)
+            except OSError:
+                pass
+        snapshot_filepath = _snapshot_file(cache_filepath)
+        if snapshot_filepath is None:
+            # it was evicted in the meantime
+            return None
+        elements = _StreamedElements(filepath=snapshot_filepath, temp=True,
+                                     compressed=cache_filepath.endswith('.gz'))
+
+    log('Streaming response from cache for URL "{}"'.format(url))
+    return {'elements': elements}
+
+
+def _save_streamed_response(prepared_url, response):
+    """
+    Write a streamed HTTP response body to disk chunk by chunk, and return it
+    as a streamed response.
+
+    The body is checked to be valid Overpass JSON before it is cached, and
+    removed if it is not or if the download fails partway through. It goes
+    to the response's cache file if using the files cache backend. Otherwise it goes to a temporary file, which is compressed into
+    the sqlite cache database if using that backend, and which is removed
+    once the streamed response is garbage collected.
+
+    Parameters
+    ----------
+    prepared_url : string
+        the GET-style URL with its parameters, to save to the cache
+    response : requests.Response
+        the response, requested with stream=True
+
+    Returns
+    -------
+    response_json : dict
+    """
+    use_cache_file = settings.use_cache and settings.cache_backend != 'sqlite'
+    if use_cache_file:
+        # streamed responses are always cached as json, found by url_in_cache
+        # whatever the cache format
+        filepath = get_cache_filepath(prepared_url, compression=settings.cache_compression)
+        folder = os.path.dirname(filepath)
+    else:
+        filepath = None
+        folder = settings.cache_folder if settings.use_cache else None
+    if folder is not None and not os.path.exists(folder):
+        os.makedirs(folder, exist_ok=True)
+
+    handle, temp_filepath = tempfile.mkstemp(suffix='.json.tmp', dir=folder)
+    os.close(handle)
+    compress = use_cache_file and settings.cache_compression == 'gzip'
+    try:
+        with (gzip.open(temp_filepath, 'wb') if compress else io.open(temp_filepath, 'wb')) as f:
+            for chunk in response.iter_content(chunk_size=1048576):
+                f.write(chunk)
+
+        # parse the body once before caching it, so that a body that is not
+        # valid Overpass JSON does not get served from the cache forever
+        with (gzip.open(temp_filepath, 'rt', encoding='utf-8') if compress
+              else io.open(temp_filepath, encoding='utf-8')) as f:
+            for _ in iter_overpass_elements(f):
+                pass
+    except Exception as e:
+        # don't leave the partial or invalid body behind
+        _remove_file(temp_filepath)
+        if isinstance(e, (ValueError, UnicodeDecodeError)):
+            log('Server returned invalid JSON data: {}'.format(e), level=lg.ERROR)
+        raise
+
+    if use_cache_file:
+        # keep a snapshot of the response to iterate, which evicting or
+        # replacing the cache file does not affect
+        snapshot_filepath = _snapshot_file(temp_filepath)
+        os.replace(temp_filepath, filepath)
+        log('Saved response to cache file "{}"'.format(filepath))
+        if settings.cache_max_size is not None:
+            _update_cache_size(os.path.getsize(filepath))
+        return {'elements': _StreamedElements(filepath=snapshot_filepath, temp=True, compressed=compress)}
+
+    if settings.use_cache:
+        compressor = zlib.compressobj()
+        payload = []
+        with io.open(temp_filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(1048576), b''):
+                payload.append(compressor.compress(chunk))
+        payload.append(compressor.flush())
+        _sqlite_cache_save(prepared_url, b''.join(payload))
+
+    return {'elements': _StreamedElements(filepath=temp_filepath, temp=True)}
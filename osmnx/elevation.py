@@ -9,16 +9,18 @@
 import math
 import networkx as nx
 import pandas as pd
-import requests
 import time
 
+from .downloader import _check_offline
 from .downloader import get_from_cache
+from .downloader import get_http_session
 from .downloader import save_to_cache
+from .downloader import wait_for_rate_limit
 from .utils import log
 
 
 def add_node_elevations(G, api_key, max_locations_per_batch=350,
-                        pause_duration=0.02): # pragma: no cover
+                        pause_duration=None): # pragma: no cover
     """
     Get the elevation (meters) of each node in the network and add it to the
     node as an attribute.
@@ -33,7 +35,9 @@ def add_node_elevations(G, api_key, max_locations_per_batch=350,
         too high, the server will reject the request because its character
         limit exceeds the max)
     pause_duration : float
-        time to pause between API calls
+        time to pause between API calls, on top of waiting for the API host's
+        rate limit in settings.rate_limits. if None, only wait for the rate
+        limit
 
     Returns
     -------
@@ -62,11 +66,14 @@ def add_node_elevations(G, api_key, max_locations_per_batch=350,
         if cached_response_json is not None:
             response_json = cached_response_json
         else:
+            _check_offline(url)
             try:
                 # request the elevations from the API
                 log('Requesting node elevations: {}'.format(url))
-                time.sleep(pause_duration)
-                response = requests.get(url)
+                if pause_duration is not None:
+                    time.sleep(pause_duration)
+                wait_for_rate_limit(url)
+                response = get_http_session().get(url)
                 response_json = response.json()
                 save_to_cache(url, response_json)
             except Exception as e:
@@ -19,3 +19,11 @@ class InvalidDistanceType(ValueError):
         Exception.__init__(self,*args,**kwargs)
 
 
+class RetriesExhausted(Exception):
+    def __init__(self,*args,**kwargs):
+        Exception.__init__(self,*args,**kwargs)
+
+
+class OfflineCacheMiss(Exception):
+    def __init__(self,*args,**kwargs):
+        Exception.__init__(self,*args,**kwargs)
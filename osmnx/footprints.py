@@ -20,8 +20,10 @@ from .core import bbox_from_point
 from .core import consolidate_subdivide_geometry
 from .core import gdf_from_place
 from .core import get_polygons_coordinates
-from .downloader import overpass_request
+from .downloader import overpass_requests_parallel
 from .geo_utils import geocode
+from .geo_utils import overpass_json_from_file
+from .geo_utils import select_overpass_elements
 from .plot import save_and_show
 from .projection import project_geometry
 from .utils import log
@@ -103,7 +105,9 @@ def osm_footprints_download(polygon=None, north=None, south=None, east=None, wes
         start_time = time.time()
 
         # loop through each polygon rectangle in the geometry (there will only
-        # be one if original bbox didn't exceed max area size)
+        # be one if original bbox didn't exceed max area size) to build the
+        # queries, then request them all
+        datas = []
         for poly in geometry:
             # represent bbox as south,west,north,east and round lat-longs to 8
             # decimal places (ie, within 1 mm) so URL strings aren't different
@@ -116,8 +120,8 @@ def osm_footprints_download(polygon=None, north=None, south=None, east=None, wes
                               '(._;>;);););out;')
             query_str = query_template.format(north=north, south=south, east=east, west=west, timeout=timeout,
                                               maxsize=maxsize, footprint_type=footprint_type, overpass_settings=overpass_settings)
-            response_json = overpass_request(data={'data':query_str}, timeout=timeout)
-            response_jsons.append(response_json)
+            datas.append({'data':query_str})
+        response_jsons = overpass_requests_parallel(datas, timeout=timeout)
         msg = ('Got all footprint data within bounding box from '
                'API in {:,} request(s) and {:,.2f} seconds')
         log(msg.format(len(geometry), time.time()-start_time))
@@ -132,16 +136,17 @@ def osm_footprints_download(polygon=None, north=None, south=None, east=None, wes
         log('Requesting footprint data within polygon from API in {:,} request(s)'.format(len(polygon_coord_strs)))
         start_time = time.time()
 
-        # pass each polygon exterior coordinates in the list to the API, one at
-        # a time
+        # build a query for each polygon exterior coordinates in the list, then
+        # pass them all to the API
+        datas = []
         for polygon_coord_str in polygon_coord_strs:
             query_template = ('{overpass_settings};('
                               'way(poly:"{polygon}")["{footprint_type}"];(._;>;);'
                               'relation(poly:"{polygon}")["{footprint_type}"];(._;>;););out;')
             query_str = query_template.format(polygon=polygon_coord_str, timeout=timeout, maxsize=maxsize,
                                               footprint_type=footprint_type, overpass_settings=overpass_settings)
-            response_json = overpass_request(data={'data':query_str}, timeout=timeout)
-            response_jsons.append(response_json)
+            datas.append({'data':query_str})
+        response_jsons = overpass_requests_parallel(datas, timeout=timeout)
         msg = ('Got all footprint data within polygon from API in '
                '{:,} request(s) and {:,.2f} seconds')
         log(msg.format(len(polygon_coord_strs), time.time()-start_time))
@@ -591,6 +596,35 @@ def footprints_from_place(place, footprint_type='building', retain_invalid=False
                                  memory=memory, custom_settings=custom_settings)
 
 
+def footprints_from_file(filename, footprint_type='building', retain_invalid=False):
+    """
+    Get footprints from OSM data in an XML file, including footprints
+    made of multipolygon relations.
+
+    Parameters
+    ----------
+    filename : string
+        the name of a file containing OSM XML data (optionally bz2 compressed)
+    footprint_type : string
+        type of footprint to get. OSM tag key e.g. 'building', 'landuse', 'place', etc.
+    retain_invalid : bool
+        if False discard any footprints with an invalid geometry
+
+    Returns
+    -------
+    geopandas.GeoDataFrame
+    """
+
+    # select the ways and relations tagged with footprint_type, and what they
+    # are made of, as osm_footprints_download's query does
+    def is_footprint(element):
+        return element['type'] in ('way', 'relation') and footprint_type in element['tags']
+
+    response = select_overpass_elements(overpass_json_from_file(filename), is_footprint)
+    return create_footprints_gdf(footprint_type=footprint_type, retain_invalid=retain_invalid,
+                                 responses=[response])
+
+
 def plot_footprints(gdf, fig=None, ax=None, figsize=None, color='#333333', bgcolor='w',
                    set_bounds=True, bbox=None, save=False, show=True, close=False,
                    filename='image', file_format='png', dpi=600):
@@ -63,9 +63,10 @@ def induce_subgraph(G, node_subset):
 
     node_subset = set(node_subset)
 
-    # copy nodes into new graph
+    # copy nodes into new graph, in G's order so the subgraph lists its nodes
+    # and edges in the same order as G
     G2 = G.__class__()
-    G2.add_nodes_from((n, G.nodes[n]) for n in node_subset)
+    G2.add_nodes_from((n, data) for n, data in G.nodes(data=True) if n in node_subset)
 
     # copy edges to new graph, including parallel edges
     if G2.is_multigraph:
@@ -83,7 +84,7 @@ def induce_subgraph(G, node_subset):
     return G2
 
 
-def get_largest_component(G, strongly=False):
+def get_largest_component(G, strongly=False, in_place=False):
     """
     Return a subgraph of the largest weakly or strongly connected component
     from a directed graph.
@@ -94,6 +95,10 @@ def get_largest_component(G, strongly=False):
     strongly : bool
         if True, return the largest strongly instead of weakly connected
         component
+    in_place : bool
+        if True, remove the other nodes from G itself instead of copying the
+        largest component into a new graph, which keeps the edges' attribute
+        mappings as they are
 
     Returns
     -------
@@ -111,7 +116,10 @@ def get_largest_component(G, strongly=False):
             # get all the strongly connected components in graph then identify the largest
             sccs = nx.strongly_connected_components(G)
             largest_scc = max(sccs, key=len)
-            G = induce_subgraph(G, largest_scc)
+            if in_place:
+                G.remove_nodes_from([node for node in G.nodes() if node not in largest_scc])
+            else:
+                G = induce_subgraph(G, largest_scc)
 
             msg = ('Graph was not connected, retained only the largest strongly '
                    'connected component ({:,} of {:,} total nodes) in {:.2f} seconds')
@@ -123,7 +131,10 @@ def get_largest_component(G, strongly=False):
             # get all the weakly connected components in graph then identify the largest
             wccs = nx.weakly_connected_components(G)
             largest_wcc = max(wccs, key=len)
-            G = induce_subgraph(G, largest_wcc)
+            if in_place:
+                G.remove_nodes_from([node for node in G.nodes() if node not in largest_wcc])
+            else:
+                G = induce_subgraph(G, largest_wcc)
 
             msg = ('Graph was not connected, retained only the largest weakly '
                    'connected component ({:,} of {:,} total nodes) in {:.2f} seconds')
@@ -897,19 +908,81 @@ def overpass_json_from_file(filename):
     OSMContentHandler object
     """
 
+    with _open_osm_file(filename) as file:
+        handler = OSMContentHandler()
+        xml.sax.parse(file, handler)
+        return handler.object
+
+
+def select_overpass_elements(response_json, match):
+    """
+    Select the elements of an Overpass-like JSON object (e.g., of a local OSM
+    file) that a query would have returned: the elements passing some test,
+    plus the ways and nodes they are made of, as the Overpass query
+    statement (._;>;) recurses down to them.
+
+    Parameters
+    ----------
+    response_json : dict
+        Overpass-like JSON, e.g., as returned by overpass_json_from_file
+    match : function
+        takes an element dict and returns True if the query selects it
+
+    Returns
+    -------
+    dict
+        Overpass-like JSON of the selected elements, in their original order
+    """
+
+    elements = response_json['elements']
+    selected = [match(element) for element in elements]
+
+    # recurse down from the selected relations to their member ways and nodes,
+    # and from the selected and member ways to their nodes
+    way_ids = set()
+    node_ids = set()
+    for element, is_selected in zip(elements, selected):
+        if is_selected and element['type'] == 'relation':
+            for member in element['members']:
+                if member['type'] == 'way':
+                    way_ids.add(member['ref'])
+                elif member['type'] == 'node':
+                    node_ids.add(member['ref'])
+    for element, is_selected in zip(elements, selected):
+        if element['type'] == 'way' and (is_selected or element['id'] in way_ids):
+            node_ids.update(element['nodes'])
+
+    selected_json = {k: v for k, v in response_json.items() if k != 'elements'}
+    selected_json['elements'] = [element for element, is_selected in zip(elements, selected)
+                                 if is_selected
+                                 or (element['type'] == 'way' and element['id'] in way_ids)
+                                 or (element['type'] == 'node' and element['id'] in node_ids)]
+    return selected_json
+
+
+def _open_osm_file(filename):
+    """
+    Open a file of OSM data for reading in binary mode, decompressing it on
+    the fly if it is bz2 compressed.
+
+    Parameters
+    ----------
+    filename : string
+        name of file containing OSM data
+
+    Returns
+    -------
+    file object
+    """
+
     _, ext = os.path.splitext(filename)
 
     if ext == '.bz2':
         # Use Python 2/3 compatible BZ2File()
-        opener = lambda fn: bz2.BZ2File(fn)
+        return bz2.BZ2File(filename)
     else:
         # Assume an unrecognized file extension is just XML
-        opener = lambda fn: open(fn, mode='rb')
-
-    with opener(filename) as file:
-        handler = OSMContentHandler()
-        xml.sax.parse(file, handler)
-        return handler.object
+        return open(filename, mode='rb')
 
 
 def bbox_to_poly(north, south, east, west):
@@ -19,8 +19,12 @@ class OSMContentHandler(xml.sax.handler.ContentHandler):
             self.object.update({k: attrs[k] for k in attrs.keys()
                                 if k in ('version', 'generator')})
 
-        elif name in ('node', 'way'):
-            self._element = dict(type=name, tags={}, nodes=[], **attrs)
+        elif name in ('node', 'way', 'relation'):
+            self._element = dict(type=name, tags={}, **attrs)
+            if name == 'relation':
+                self._element['members'] = []
+            else:
+                self._element['nodes'] = []
             self._element.update({k: float(attrs[k]) for k in attrs.keys()
                                   if k in ('lat', 'lon')})
             self._element.update({k: int(attrs[k]) for k in attrs.keys()
@@ -32,11 +36,11 @@ class OSMContentHandler(xml.sax.handler.ContentHandler):
         elif name == 'nd':
             self._element['nodes'].append(int(attrs['ref']))
 
-        elif name == 'relation':
-            # Placeholder for future relation support.
-            # Look for nested members and tags.
-            pass
+        elif name == 'member':
+            self._element['members'].append({'type': attrs['type'],
+                                              'ref': int(attrs['ref']),
+                                              'role': attrs['role']})
 
     def endElement(self, name):
-        if name in ('node', 'way'):
+        if name in ('node', 'way', 'relation'):
             self.object['elements'].append(self._element)
@@ -0,0 +1,416 @@
+################################################################################
+# Module: osm_pbf_reader.py
+# Description: Decode OSM PBF files into arrays of their nodes and ways
+# License: MIT, see full license in LICENSE.txt
+# Web: https://github.com/gboeing/osmnx
+################################################################################
+
+import lzma
+import struct
+import zlib
+
+import numpy as np
+
+from .downloader import osm_filter_matches
+
+
+# the features a PBF file's header may require that this reader supports. for
+# format notes, see https://wiki.openstreetmap.org/wiki/PBF_Format
+SUPPORTED_FEATURES = {'OsmSchema-V0.6', 'DenseNodes'}
+
+# protobuf wire types
+_VARINT = 0
+_FIXED64 = 1
+_LENGTH_DELIMITED = 2
+_FIXED32 = 5
+
+
+def get_pbf_blocks(filename):
+    """
+    Scan the blob headers of an OSM PBF file to find its data blocks, and
+    check that its header block requires no unsupported features.
+
+    Parameters
+    ----------
+    filename : string
+        the name of a file containing OSM PBF data
+
+    Returns
+    -------
+    list
+        (offset, size) tuples of the file position and length of each
+        OSMData blob
+    """
+    blocks = []
+    with open(filename, 'rb') as file:
+        while True:
+            header_size = file.read(4)
+            if len(header_size) < 4:
+                break
+            header = dict(_iter_fields(file.read(struct.unpack('>i', header_size)[0])))
+            blob_type = bytes(header[1]).decode('utf-8')
+            offset = file.tell()
+            size = header[3]
+            if blob_type == 'OSMHeader':
+                features = [bytes(value).decode('utf-8') for field, value
+                            in _iter_fields(_read_blob(file.read(size))) if field == 4]
+                unsupported = set(features) - SUPPORTED_FEATURES
+                if unsupported:
+                    raise ValueError('Unsupported OSM PBF features: {}'.format(', '.join(sorted(unsupported))))
+            else:
+                if blob_type == 'OSMData':
+                    blocks.append((offset, size))
+                file.seek(offset + size)
+    return blocks
+
+
+def read_pbf_block(filename, offset, size, useful_tags_node, useful_tags_path, way_filter=None,
+                   nodes=True, ways=True):
+    """
+    Read and decode one data block of an OSM PBF file.
+
+    Parameters
+    ----------
+    filename : string
+        the name of a file containing OSM PBF data
+    offset : int
+        the file position of the block's blob
+    size : int
+        the length of the block's blob
+    useful_tags_node : list
+        the node tags to keep
+    useful_tags_path : list
+        the way tags to keep
+    way_filter : list
+        if not None, clauses as returned by downloader.parse_osm_filter that a
+        way's tags must pass to keep it
+    nodes : bool
+        if False, skip the block's nodes
+    ways : bool
+        if False, skip the block's ways
+
+    Returns
+    -------
+    dict
+        node_ids, node_y, and node_x arrays, node_tags list of each node's
+        useful tags dict (or None if it has none), way_ids, way_offsets, and
+        way_refs arrays, with way i's node refs at
+        way_refs[way_offsets[i]:way_offsets[i + 1]], and way_tags list
+    """
+    with open(filename, 'rb') as file:
+        file.seek(offset)
+        data = _read_blob(file.read(size))
+
+    # a PrimitiveBlock: its string table, groups, and coordinate scaling
+    strings = []
+    groups = []
+    granularity, lat_offset, lon_offset = 100, 0, 0
+    for field, value in _iter_fields(data):
+        if field == 1:
+            strings = [bytes(s) for f, s in _iter_fields(value) if f == 1]
+        elif field == 2:
+            groups.append(value)
+        elif field == 17:
+            granularity = value
+        elif field == 19:
+            lat_offset = _zigzag(value)
+        elif field == 20:
+            lon_offset = _zigzag(value)
+
+    block = _BlockDecoder(strings, useful_tags_node, useful_tags_path, way_filter)
+    for group in groups:
+        for field, value in _iter_fields(group):
+            if field == 1 and nodes:
+                block.add_node(value)
+            elif field == 2 and nodes:
+                block.add_dense_nodes(value)
+            elif field == 3 and ways:
+                block.add_way(value)
+    return block.get_arrays(granularity, lat_offset, lon_offset)
+
+
+class _BlockDecoder(object):
+    """
+    Accumulate the nodes and ways of a PrimitiveBlock's groups.
+
+    Single nodes and ways are read field by field, but their packed fields
+    are only collected, to decode all of the block's at once with numpy.
+    """
+
+    def __init__(self, strings, useful_tags_node, useful_tags_path, way_filter=None):
+        self.strings = strings
+        self.way_filter = way_filter
+        self.filter_tags_path = set(key for key, _, _ in way_filter or []) - set(useful_tags_path)
+        self.useful_node = np.array([s.decode('utf-8') in useful_tags_node for s in strings], dtype=bool)
+        self.useful_path = np.array([s.decode('utf-8') in useful_tags_path for s in strings], dtype=bool)
+        self.filter_path = np.array([s.decode('utf-8') in self.filter_tags_path for s in strings], dtype=bool)
+        self.node_ids, self.node_lats, self.node_lons, self.node_tags = [], [], [], []
+        self.way_ids, self.way_refs, self.way_keys, self.way_vals = [], [], [], []
+
+    def add_node(self, data):
+        node_id, lat, lon, keys, vals = 0, 0, 0, b'', b''
+        for field, value in _iter_fields(data):
+            if field == 1:
+                node_id = _zigzag(value)
+            elif field == 2:
+                keys = value
+            elif field == 3:
+                vals = value
+            elif field == 8:
+                lat = _zigzag(value)
+            elif field == 9:
+                lon = _zigzag(value)
+        self.node_ids.append(np.array([node_id], dtype=np.int64))
+        self.node_lats.append(np.array([lat], dtype=np.int64))
+        self.node_lons.append(np.array([lon], dtype=np.int64))
+        self.node_tags.extend(self._get_tags([keys], [vals], self.useful_node))
+
+    def add_dense_nodes(self, data):
+        ids, lats, lons, keys_vals = b'', b'', b'', b''
+        for field, value in _iter_fields(data):
+            if field == 1:
+                ids = value
+            elif field == 8:
+                lats = value
+            elif field == 9:
+                lons = value
+            elif field == 10:
+                keys_vals = value
+        ids = np.cumsum(_decode_zigzag(_decode_varints(ids)))
+        self.node_ids.append(ids)
+        self.node_lats.append(np.cumsum(_decode_zigzag(_decode_varints(lats))))
+        self.node_lons.append(np.cumsum(_decode_zigzag(_decode_varints(lons))))
+
+        # each node's keys and values alternate, then a 0 ends its tags. as
+        # string 0 is never a key or value, the nonzero entries pair up
+        tags = [None] * len(ids)
+        keys_vals = _decode_varints(keys_vals).astype(np.int64)
+        if len(keys_vals) > 0:
+            is_end = keys_vals == 0
+            node_index = np.cumsum(is_end) - is_end
+            nonzero = np.flatnonzero(~is_end)
+            keys = keys_vals[nonzero[0::2]]
+            vals = keys_vals[nonzero[1::2]]
+            useful = np.flatnonzero(self.useful_node[keys])
+            for i, key, val in zip(node_index[nonzero[0::2]][useful].tolist(),
+                                   keys[useful].tolist(), vals[useful].tolist()):
+                if tags[i] is None:
+                    tags[i] = {}
+                tags[i][self.strings[key].decode('utf-8')] = self.strings[val].decode('utf-8')
+        self.node_tags.extend(tags)
+
+    def add_way(self, data):
+        way_id, keys, vals, refs = 0, b'', b'', b''
+        for field, value in _iter_fields(data):
+            if field == 1:
+                way_id = value
+            elif field == 2:
+                keys = value
+            elif field == 3:
+                vals = value
+            elif field == 8:
+                refs = value
+        self.way_ids.append(way_id)
+        self.way_keys.append(keys)
+        self.way_vals.append(vals)
+        self.way_refs.append(refs)
+
+    def get_arrays(self, granularity, lat_offset, lon_offset):
+        # dividing the exact integer nanodegrees gives the closest floats to
+        # the coordinates, as parsing their decimal strings in OSM XML does
+        def to_degrees(values, values_offset):
+            values = np.concatenate(values) if values else np.zeros(0, dtype=np.int64)
+            return (values_offset + granularity * values) / 1e9
+
+        way_ids, way_refs = self.way_ids, self.way_refs
+        if self.way_filter is None:
+            way_tags = self._get_tags(self.way_keys, self.way_vals, self.useful_path)
+        else:
+            # get the tags the filter needs too, to drop the ways not passing
+            # it before decoding their refs, then drop those tags
+            way_tags = self._get_tags(self.way_keys, self.way_vals, self.useful_path | self.filter_path)
+            keep = [osm_filter_matches(tags or {}, self.way_filter) for tags in way_tags]
+            way_ids = [way_id for way_id, kept in zip(way_ids, keep) if kept]
+            way_refs = [refs for refs, kept in zip(way_refs, keep) if kept]
+            way_tags = [self._drop_filter_tags(tags) for tags, kept in zip(way_tags, keep) if kept]
+
+        refs, counts = _decode_packed_segments(way_refs)
+        way_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        refs = _decode_zigzag(refs)
+        # undo the delta coding of the refs within each way
+        refs = np.cumsum(refs)
+        if len(refs) > 0:
+            before = np.concatenate([[0], refs])[way_offsets[:-1]]
+            refs = refs - np.repeat(before, counts)
+
+        return {'node_ids': np.concatenate(self.node_ids) if self.node_ids else np.zeros(0, dtype=np.int64),
+                'node_y': to_degrees(self.node_lats, lat_offset),
+                'node_x': to_degrees(self.node_lons, lon_offset),
+                'node_tags': self.node_tags,
+                'way_ids': np.array(way_ids, dtype=np.uint64).view(np.int64),
+                'way_offsets': way_offsets,
+                'way_refs': refs,
+                'way_tags': way_tags}
+
+    def _drop_filter_tags(self, tags):
+        if tags and self.filter_tags_path:
+            tags = {key: value for key, value in tags.items() if key not in self.filter_tags_path}
+        return tags or None
+
+    def _get_tags(self, keys, vals, useful_strings):
+        """
+        Get the useful tags dict (or None) of each of some elements, from
+        their packed keys and values fields.
+        """
+        tags = [None] * len(keys)
+        keys, counts = _decode_packed_segments(keys)
+        vals, _ = _decode_packed_segments(vals)
+        keys = keys.astype(np.int64)
+        useful = np.flatnonzero(useful_strings[keys])
+        elements = np.repeat(np.arange(len(counts)), counts)[useful]
+        for i, key, val in zip(elements.tolist(), keys[useful].tolist(), vals[useful].astype(np.int64).tolist()):
+            if tags[i] is None:
+                tags[i] = {}
+            tags[i][self.strings[key].decode('utf-8')] = self.strings[val].decode('utf-8')
+        return tags
+
+
+def _read_blob(data):
+    """
+    Get the uncompressed data of a Blob message.
+
+    Parameters
+    ----------
+    data : bytes
+
+    Returns
+    -------
+    bytes
+    """
+    fields = dict(_iter_fields(data))
+    if 1 in fields:
+        return bytes(fields[1])
+    if 3 in fields:
+        return zlib.decompress(fields[3])
+    if 4 in fields:
+        return lzma.decompress(fields[4])
+    raise ValueError('Unsupported OSM PBF blob compression')
+
+
+def _iter_fields(data):
+    """
+    Iterate over the fields of a protobuf message.
+
+    Parameters
+    ----------
+    data : bytes or memoryview
+
+    Yields
+    ------
+    tuple
+        field number and value: an int for varint fields, a memoryview for
+        length-delimited fields, and bytes for fixed-size fields
+    """
+    data = memoryview(data)
+    pos = 0
+    end = len(data)
+    while pos < end:
+        # field keys and most lengths fit in a single byte
+        key = data[pos]
+        if key < 0x80:
+            pos += 1
+        else:
+            key, pos = _read_varint(data, pos)
+        wire_type = key & 7
+        if wire_type == _VARINT:
+            value, pos = _read_varint(data, pos)
+        elif wire_type == _LENGTH_DELIMITED:
+            length = data[pos]
+            if length < 0x80:
+                pos += 1
+            else:
+                length, pos = _read_varint(data, pos)
+            value = data[pos:pos + length]
+            pos += length
+        elif wire_type == _FIXED64:
+            value = bytes(data[pos:pos + 8])
+            pos += 8
+        elif wire_type == _FIXED32:
+            value = bytes(data[pos:pos + 4])
+            pos += 4
+        else:
+            raise ValueError('Unsupported protobuf wire type {}'.format(wire_type))
+        yield key >> 3, value
+
+
+def _read_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _zigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def _decode_varints(data):
+    """
+    Decode a packed field of varints, all at once.
+
+    Parameters
+    ----------
+    data : bytes or memoryview
+
+    Returns
+    -------
+    numpy.ndarray
+        uint64 values
+    """
+    data = np.frombuffer(data, dtype=np.uint8)
+    if len(data) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    # each varint ends at a byte without the continuation bit: find where each
+    # starts, and shift each byte's 7 bits by its position within its varint
+    is_end = data < 0x80
+    starts = np.flatnonzero(np.concatenate([[True], is_end[:-1]]))
+    varint_index = np.cumsum(is_end) - is_end
+    shifts = (np.arange(len(data)) - starts[varint_index]) * 7
+    values = (data & 0x7f).astype(np.uint64) << shifts.astype(np.uint64)
+    # the shifted bits don't overlap, so summing them ors them together
+    return np.add.reduceat(values, starts)
+
+
+def _decode_zigzag(values):
+    values = values.astype(np.uint64)
+    return (values >> np.uint64(1)).astype(np.int64) ^ -(values & np.uint64(1)).astype(np.int64)
+
+
+def _decode_packed_segments(segments):
+    """
+    Decode several packed fields of varints (e.g., one per way), all at once.
+
+    Parameters
+    ----------
+    segments : list
+        bytes or memoryview of each packed field
+
+    Returns
+    -------
+    values, counts : tuple
+        the concatenated uint64 values, and how many of them each field has
+    """
+    lengths = np.array([len(segment) for segment in segments], dtype=np.int64)
+    data = b''.join(segments)
+    values = _decode_varints(data)
+    # count the varints ending within each field's bytes
+    is_end = np.frombuffer(data, dtype=np.uint8) < 0x80
+    ends_before = np.concatenate([[0], np.cumsum(is_end)])
+    boundaries = np.concatenate([[0], np.cumsum(lengths)])
+    counts = np.diff(ends_before[boundaries])
+    return values, counts
@@ -15,6 +15,8 @@ from .core import bbox_from_point
 from .core import gdf_from_place
 from .downloader import overpass_request
 from .geo_utils import geocode
+from .geo_utils import overpass_json_from_file
+from .geo_utils import select_overpass_elements
 from .utils import log
 
 
@@ -78,6 +80,50 @@ def create_poi_query(north, south, east, west, tags,
                                                                             maxsize=maxsize)
 
 
+    tags_list = _get_poi_tags_list(tags)
+
+    # create query bounding box
+    bbox = '({s:.6f},{w:.6f},{n:.6f},{e:.6f})'.format(s=south, w=west, n=north, e=east)
+    
+    # add node/way/relation query components one at a time
+    components = []
+    for d in tags_list:
+        for key, value in d.items():
+
+            if isinstance(value, bool):
+                # if bool (ie, True) just pass the key, no value
+                tag_str = '["{key}"]{bbox};(._;>;);'.format(key=key, bbox=bbox)
+            else:
+                # otherwise, pass "key"="value"
+                tag_str = '["{key}"="{value}"]{bbox};(._;>;);'.format(key=key, value=value, bbox=bbox)
+
+            for kind in ['node', 'way', 'relation']:
+                components.append('({kind}{tag_str});'.format(kind=kind, tag_str=tag_str))
+
+    # finalize query and return
+    components = ''.join(components)
+    query = '{overpass_settings};({components});out;'
+    query = query.format(overpass_settings=overpass_settings, components=components)
+    
+    return query
+
+
+def _get_poi_tags_list(tags):
+    """
+    Convert a dict of POI tags into a list of {tag:value} dicts, one per
+    tag-value combination to query.
+
+    Parameters
+    ----------
+    tags : dict
+        Dict of tags used for finding POIs, as create_poi_query takes it.
+
+    Returns
+    -------
+    tags_list : list
+        {tag:value} dicts, where value is True to match any value of the tag
+    """
+
     # make sure every value in dict is bool, str, or list of str
     error_msg = 'tags must be a dict with values of bool, str, or list of str'    
     if not isinstance(tags, dict):
@@ -109,30 +155,7 @@ def create_poi_query(north, south, east, west, tags,
             for value_item in value:
                 tags_list.append({key: value_item})
 
-    # create query bounding box
-    bbox = '({s:.6f},{w:.6f},{n:.6f},{e:.6f})'.format(s=south, w=west, n=north, e=east)
-    
-    # add node/way/relation query components one at a time
-    components = []
-    for d in tags_list:
-        for key, value in d.items():
-
-            if isinstance(value, bool):
-                # if bool (ie, True) just pass the key, no value
-                tag_str = '["{key}"]{bbox};(._;>;);'.format(key=key, bbox=bbox)
-            else:
-                # otherwise, pass "key"="value"
-                tag_str = '["{key}"="{value}"]{bbox};(._;>;);'.format(key=key, value=value, bbox=bbox)
-
-            for kind in ['node', 'way', 'relation']:
-                components.append('({kind}{tag_str});'.format(kind=kind, tag_str=tag_str))
-
-    # finalize query and return
-    components = ''.join(components)
-    query = '{overpass_settings};({components});out;'
-    query = query.format(overpass_settings=overpass_settings, components=components)
-    
-    return query
+    return tags_list
 
 
 def osm_poi_download(tags, polygon=None,
@@ -388,7 +411,7 @@ def parse_osm_relations(relations, osm_way_df):
 
 
 def create_poi_gdf(tags, polygon=None, north=None, south=None, east=None, west=None,
-                   timeout=180, memory=None, custom_settings=None):
+                   timeout=180, memory=None, custom_settings=None, response=None):
     """
     Create GeoDataFrame from POI json returned by Overpass API
 
@@ -425,6 +448,8 @@ def create_poi_gdf(tags, polygon=None, north=None, south=None, east=None, west=N
         will use its default allocation size
     custom_settings : string
         custom settings to be used in the overpass query instead of defaults
+    response : dict
+        Overpass-like JSON of the POIs to use instead of downloading them
 
     Returns
     -------
@@ -432,9 +457,12 @@ def create_poi_gdf(tags, polygon=None, north=None, south=None, east=None, west=N
         POIs and their associated tags
     """
 
-    responses = osm_poi_download(tags, polygon=polygon,
-                                 north=north, south=south, east=east, west=west,
-                                 timeout=timeout, memory=memory, custom_settings=custom_settings)
+    if response is None:
+        responses = osm_poi_download(tags, polygon=polygon,
+                                     north=north, south=south, east=east, west=west,
+                                     timeout=timeout, memory=memory, custom_settings=custom_settings)
+    else:
+        responses = response
 
     # Parse coordinates from all the nodes in the response
     coords = parse_nodes_coords(responses)
@@ -449,7 +477,7 @@ def create_poi_gdf(tags, polygon=None, north=None, south=None, east=None, west=N
     relations = []
 
     for result in responses['elements']:
-        if result['type'] == 'node' and 'tags' in result:
+        if result['type'] == 'node' and result.get('tags'):
             poi = parse_osm_node(response=result)
             # Add element_type
             poi['element_type'] = 'node'
@@ -661,3 +689,41 @@ def pois_from_place(place, tags, which_result=1,
     polygon = city['geometry'].iloc[0]
     return create_poi_gdf(tags=tags, polygon=polygon,
                           timeout=timeout, memory=memory, custom_settings=custom_settings)
+
+
+def pois_from_file(filename, tags):
+    """
+    Get points of interests (POIs) from OSM data in an XML file, including
+    POIs made of multipolygon relations.
+
+    Parameters
+    ----------
+    filename : string
+        the name of a file containing OSM XML data (optionally bz2 compressed)
+    tags : dict
+        Dict of tags used for finding POIs in the file. Results returned are
+        the union, not intersection of each individual tag. Each result
+        matches at least one tag given. The dict keys should be OSM tags,
+        (e.g., `amenity`, `landuse`, `highway`, etc) and the dict values
+        should be either `True` to retrieve all items with the given tag, or
+        a string to get a single tag-value combination, or a list of strings
+        to get multiple values for the given tag.
+
+    Returns
+    -------
+    geopandas.GeoDataFrame
+    """
+
+    tags_list = _get_poi_tags_list(tags)
+
+    # select the nodes, ways, and relations matching any of the tags, and what
+    # they are made of, as create_poi_query's query does
+    def is_poi(element):
+        for d in tags_list:
+            for key, value in d.items():
+                if key in element['tags'] and (isinstance(value, bool) or element['tags'][key] == value):
+                    return True
+        return False
+
+    response = select_overpass_elements(overpass_json_from_file(filename), is_poi)
+    return create_poi_gdf(tags=tags, response=response)
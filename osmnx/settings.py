@@ -18,6 +18,31 @@ cache_folder = 'cache'
 # cache server responses
 use_cache = False
 
+# where to cache server responses: 'files' for one json file per response in
+# cache_folder, or 'sqlite' for a single compressed sqlite database there
+cache_backend = 'files'
+
+# cache file layout: how many levels of 2-character hash-prefix subdirectories
+# to shard the cache files into (0 for a single flat folder), and how to
+# compress them (None for plain json, or 'gzip')
+cache_shard_depth = 0
+cache_compression = None
+
+# how to serialize cache files: 'json', or 'msgpack' for a binary format that
+# stores overpass node coordinates and way node refs as typed arrays (requires
+# the optional msgpack package). files in either format are still read
+cache_format = 'json'
+
+# cache eviction: max total size of the cache folder in bytes, beyond which the
+# least recently used responses get evicted, and max seconds since a response
+# was last used before it expires. None means unbounded
+cache_max_size = None
+cache_ttl = None
+
+# max total size in bytes of the in-memory tier of recently used responses in
+# front of the cache folder. 0 disables it
+cache_memory_max_size = 0
+
 # write log to file and/or to console
 log_file = False
 log_console = False
@@ -73,5 +98,63 @@ default_accept_language = 'en'
 nominatim_endpoint = 'https://nominatim.openstreetmap.org/'
 nominatim_key = None
 
-# which API endpoint to use for overpass queries
+# client-side rate limits: max requests per second to each API host. requests
+# to hosts not listed here are not rate limited. if rate_limit_folder is not
+# None, each host's limit is shared through a lock file in that folder by all
+# processes using it (e.g., several workers behind one IP address)
+rate_limits = {'nominatim.openstreetmap.org': 1,
+               'maps.googleapis.com': 50}
+rate_limit_folder = None
+
+# which API endpoint to use for overpass queries. this can also be a list of
+# mirrors to spread queries across, the first one being the primary endpoint
+# whose URL cached responses are keyed by
 overpass_endpoint = 'http://overpass-api.de/api'
+
+# how many seconds to avoid an overpass endpoint after it fails, doubled for
+# each further consecutive failure
+overpass_endpoint_cooldown = 60
+
+# how many seconds to reuse an overpass endpoint's probed status (its free
+# slots and when its busy slots become free) before probing it again
+overpass_status_cache_duration = 5
+
+# stream overpass responses to disk as they download and parse their elements
+# incrementally from there, instead of loading whole responses into memory
+overpass_stream_responses = False
+
+# only serve overpass, nominatim, and elevation requests from the cache, and
+# raise an OfflineCacheMiss error instead of going to the network on a miss
+offline = False
+
+# how to retry requests rejected by an overloaded server (HTTP 429 or 504, or a
+# busy overpass status): max attempts in total, the cap on the pause before the
+# first retry in seconds (doubled for each further retry, with jitter), the cap
+# on any pause in seconds, and max seconds across all attempts (None for none)
+retry_max_attempts = 10
+retry_backoff_base = 5
+retry_backoff_max = 300
+retry_deadline = None
+
+# max number of overpass queries (e.g., the sub-queries of a large polygon) to
+# request concurrently. this is capped by the number of slots the server grants
+overpass_concurrent_requests = 1
+
+# if not None, osm_net_download snaps its queries onto a global grid of tiles
+# this many degrees wide and tall, and requests (and caches) each tile on its
+# own so that overlapping queries reuse each other's cached tiles
+overpass_tile_size = None
+
+# how many worker processes create_graph uses to parse multiple overpass
+# responses in parallel. 1 parses them serially in this process, None uses
+# one process per cpu
+parse_processes = 1
+
+# pooled HTTP session used for all API requests: number of per-host connection
+# pools to keep, max connections per pool (should be at least as large as
+# overpass_concurrent_requests), whether to keep connections alive between
+# requests, and how many times to retry a request on connection/read errors
+http_pool_connections = 10
+http_pool_maxsize = 10
+http_keep_alive = True
+http_max_retries = 3
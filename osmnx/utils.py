@@ -97,6 +97,13 @@ def config(data_folder=settings.data_folder,
            imgs_folder=settings.imgs_folder,
            cache_folder=settings.cache_folder,
            use_cache=settings.use_cache,
+           cache_backend=settings.cache_backend,
+           cache_shard_depth=settings.cache_shard_depth,
+           cache_compression=settings.cache_compression,
+           cache_format=settings.cache_format,
+           cache_max_size=settings.cache_max_size,
+           cache_ttl=settings.cache_ttl,
+           cache_memory_max_size=settings.cache_memory_max_size,
            log_file=settings.log_file,
            log_console=settings.log_console,
            log_level=settings.log_level,
@@ -115,7 +122,24 @@ def config(data_folder=settings.data_folder,
            default_accept_language=settings.default_accept_language,
            nominatim_endpoint=settings.nominatim_endpoint,
            nominatim_key=settings.nominatim_key,
+           rate_limits=settings.rate_limits,
+           rate_limit_folder=settings.rate_limit_folder,
            overpass_endpoint=settings.overpass_endpoint,
+           overpass_endpoint_cooldown=settings.overpass_endpoint_cooldown,
+           overpass_status_cache_duration=settings.overpass_status_cache_duration,
+           overpass_stream_responses=settings.overpass_stream_responses,
+           offline=settings.offline,
+           overpass_concurrent_requests=settings.overpass_concurrent_requests,
+           overpass_tile_size=settings.overpass_tile_size,
+           parse_processes=settings.parse_processes,
+           retry_max_attempts=settings.retry_max_attempts,
+           retry_backoff_base=settings.retry_backoff_base,
+           retry_backoff_max=settings.retry_backoff_max,
+           retry_deadline=settings.retry_deadline,
+           http_pool_connections=settings.http_pool_connections,
+           http_pool_maxsize=settings.http_pool_maxsize,
+           http_keep_alive=settings.http_keep_alive,
+           http_max_retries=settings.http_max_retries,
            all_oneway=settings.all_oneway):
     """
     Configure osmnx by setting the default global vars to desired values.
@@ -133,6 +157,26 @@ def config(data_folder=settings.data_folder,
     use_cache : bool
         if True, use a local cache to save/retrieve http responses instead of
         calling API repetitively for the same request URL
+    cache_backend : string
+        {'files', 'sqlite'}, store each cached response in its own json file,
+        or all of them in a single compressed sqlite database
+    cache_shard_depth : int
+        how many levels of hash-prefix subdirectories to shard cache files into
+    cache_compression : string
+        {None, 'gzip'}, how to compress cache files
+    cache_format : string
+        {'json', 'msgpack'}, how to serialize cache files. msgpack files store
+        overpass node coordinates and way node refs as typed arrays, which
+        load much faster than json
+    cache_max_size : int
+        max total size of the cache in bytes, beyond which the least recently
+        used responses get evicted. if None, the cache is unbounded
+    cache_ttl : int
+        max seconds since a cached response was last used before it expires.
+        if None, cached responses never expire
+    cache_memory_max_size : int
+        max total size in bytes of the in-memory tier of recently used
+        responses in front of the cache folder. if 0, it is disabled
     log_file : bool
         if true, save log output to a log file in logs_folder
     log_console : bool
@@ -159,8 +203,52 @@ def config(data_folder=settings.data_folder,
         which API endpoint to use for nominatim queries
     nominatim_key : string
         your API key, if you are using an endpoint that requires one
-    overpass_endpoint : string
-        which API endpoint to use for overpass queries
+    rate_limits : dict
+        max requests per second to each API host, keyed by host name
+    rate_limit_folder : string
+        if not None, share the rate limits with other processes through lock
+        files in this folder
+    overpass_endpoint : string or list
+        which API endpoint to use for overpass queries, or a list of mirrors to
+        spread queries across (the first one being the primary endpoint)
+    overpass_endpoint_cooldown : int
+        how many seconds to avoid an overpass endpoint after it fails, doubled
+        for each further consecutive failure
+    overpass_status_cache_duration : float
+        how many seconds to reuse an overpass endpoint's probed status before
+        probing it again
+    overpass_stream_responses : bool
+        if True, stream overpass responses to disk and parse their elements
+        incrementally, instead of loading whole responses into memory
+    offline : bool
+        if True, only serve overpass, nominatim, and elevation requests from
+        the cache, and raise an OfflineCacheMiss error on a cache miss
+    overpass_concurrent_requests : int
+        max number of overpass queries to request concurrently, capped by the
+        number of slots the server grants
+    overpass_tile_size : float
+        if not None, download networks as tiles of a global grid this many
+        degrees wide, so overlapping queries reuse cached tiles
+    parse_processes : int
+        how many worker processes to parse multiple overpass responses in
+        parallel with. if 1, parse them serially, if None, use every cpu
+    retry_max_attempts : int
+        max number of attempts for a request rejected by an overloaded server
+    retry_backoff_base : float
+        cap on the pause in seconds before the first retry, doubled (with
+        jitter) for each further retry
+    retry_backoff_max : float
+        cap on any pause in seconds between retries
+    retry_deadline : float
+        max seconds across all attempts of a request, or None for no deadline
+    http_pool_connections : int
+        number of per-host connection pools the shared HTTP session keeps
+    http_pool_maxsize : int
+        max number of connections to keep in each pool
+    http_keep_alive : bool
+        if True, reuse connections between requests
+    http_max_retries : int
+        how many times to retry a request on connection or read errors
     all_oneway : boolean
         if True, forces all paths to be loaded as oneway ways, preserving
         the original order of nodes stored in the OSM way XML.
@@ -172,6 +260,13 @@ def config(data_folder=settings.data_folder,
 
     # set each global variable to the passed-in parameter value
     settings.use_cache = use_cache
+    settings.cache_backend = cache_backend
+    settings.cache_shard_depth = cache_shard_depth
+    settings.cache_compression = cache_compression
+    settings.cache_format = cache_format
+    settings.cache_max_size = cache_max_size
+    settings.cache_ttl = cache_ttl
+    settings.cache_memory_max_size = cache_memory_max_size
     settings.cache_folder = cache_folder
     settings.data_folder = data_folder
     settings.imgs_folder = imgs_folder
@@ -196,7 +291,24 @@ def config(data_folder=settings.data_folder,
     settings.default_accept_language = default_accept_language
     settings.nominatim_endpoint = nominatim_endpoint
     settings.nominatim_key = nominatim_key
+    settings.rate_limits = rate_limits
+    settings.rate_limit_folder = rate_limit_folder
     settings.overpass_endpoint = overpass_endpoint
+    settings.overpass_endpoint_cooldown = overpass_endpoint_cooldown
+    settings.overpass_status_cache_duration = overpass_status_cache_duration
+    settings.overpass_stream_responses = overpass_stream_responses
+    settings.offline = offline
+    settings.overpass_concurrent_requests = overpass_concurrent_requests
+    settings.overpass_tile_size = overpass_tile_size
+    settings.parse_processes = parse_processes
+    settings.retry_max_attempts = retry_max_attempts
+    settings.retry_backoff_base = retry_backoff_base
+    settings.retry_backoff_max = retry_backoff_max
+    settings.retry_deadline = retry_deadline
+    settings.http_pool_connections = http_pool_connections
+    settings.http_pool_maxsize = http_pool_maxsize
+    settings.http_keep_alive = http_keep_alive
+    settings.http_max_retries = http_max_retries
     settings.all_oneway = all_oneway
 
     # if logging is turned on, log that we are configured
@@ -0,0 +1,451 @@
+################################################################################
+# Module: stub_server.py
+# Description: Local stand-in for the Overpass and Nominatim APIs, to test and
+#              benchmark the download pipeline deterministically and offline
+# License: MIT, see full license in LICENSE.txt
+# Web: https://github.com/gboeing/osmnx
+################################################################################
+
+import datetime as dt
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs
+from urllib.parse import urlsplit
+
+from osmnx.geo_utils import overpass_json_from_file
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StubServer(object):
+    """
+    Local HTTP server that stands in for the Overpass API (interpreter and
+    status) and the Nominatim API (search and lookup).
+
+    Overpass queries are answered from the elements of some OSM XML extracts
+    and/or Overpass JSON fixture files: every way with a node inside the
+    query's bounding box (or poly's bounding box) is returned along with all
+    of its nodes. Tag filters in the query are ignored. Nominatim searches are
+    answered from the places passed in, or otherwise with one place whose
+    polygon is the bounding box of all the elements. Nominatim lookups are
+    answered from the places passed in.
+
+    Like Overpass, the server grants a limited number of slots: a query taking
+    a slot holds it while running and for slot_cooldown seconds after, and a
+    query arriving while no slot is free gets a 429 response. Errors can also
+    be injected, either as a fixed sequence of status codes for the first
+    requests or at random with some probability.
+
+    Use as a context manager, or call start() and stop(), and point
+    settings.overpass_endpoint at overpass_endpoint and
+    settings.nominatim_endpoint at nominatim_endpoint.
+
+    Parameters
+    ----------
+    filenames : list
+        paths of OSM XML files (optionally .bz2) or Overpass JSON files to
+        serve the elements of
+    places : dict
+        map of Nominatim search query strings to lists of results to serve
+    latency : float
+        how many seconds each Overpass query takes to answer
+    slots : int
+        how many Overpass slots to grant, 0 for unlimited
+    slot_cooldown : float
+        how many seconds a slot stays taken after its query finishes
+    errors : list
+        status codes (e.g., 429 or 504) to answer the first requests with,
+        one request each, before answering normally
+    error_rate : float
+        probability of answering any other request with an error
+    error_codes : tuple
+        status codes to choose from for random errors
+    seed : int
+        seed for the random errors, for reproducibility
+    host : string
+        host to listen on
+    port : int
+        port to listen on, 0 to pick a free one
+    """
+
+    def __init__(self, filenames=None, places=None, latency=0, slots=2, slot_cooldown=0,
+                 errors=None, error_rate=0, error_codes=(429, 504), seed=0,
+                 host='127.0.0.1', port=0):
+        self.places = places if places is not None else {}
+        self.latency = latency
+        self.slots = slots
+        self.slot_cooldown = slot_cooldown
+        self.errors = list(errors) if errors is not None else []
+        self.error_rate = error_rate
+        self.error_codes = error_codes
+        self.random = random.Random(seed)
+        self.host = host
+        self.port = port
+
+        self.nodes, self.ways = _load_elements(filenames if filenames is not None else [])
+        self.lock = threading.Lock()
+        self.slot_free_times = [0] * slots
+        self.running = 0
+        self.in_flight = 0
+        self.stats = {'requests': Counter(), 'status_codes': Counter(), 'max_running': 0, 'max_in_flight': 0}
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(self.host, self._server.server_address[1])
+
+    @property
+    def overpass_endpoint(self):
+        return self.url + '/api'
+
+    @property
+    def nominatim_endpoint(self):
+        return self.url + '/'
+
+    def start(self):
+        stub = self
+
+        class Handler(_StubRequestHandler):
+            server_stub = stub
+
+        self._server = _ThreadingHTTPServer((self.host, self.port), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def next_error(self):
+        """
+        Pop the next injected error status code, if any.
+
+        Returns
+        -------
+        int or None
+        """
+        with self.lock:
+            if self.errors:
+                return self.errors.pop(0)
+            if self.error_rate > 0 and self.random.random() < self.error_rate:
+                return self.random.choice(self.error_codes)
+        return None
+
+    def enter_query(self):
+        # count an Overpass query the client has sent, whether or not it gets
+        # a slot, to measure how many queries the client sends at once
+        with self.lock:
+            self.in_flight += 1
+            self.stats['max_in_flight'] = max(self.stats['max_in_flight'], self.in_flight)
+
+    def leave_query(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def take_slot(self):
+        """
+        Take a free slot for a query.
+
+        Returns
+        -------
+        int or None
+            index of the slot taken (-1 if slots are unlimited), or None if no
+            slot is free
+        """
+        with self.lock:
+            if self.slots > 0:
+                now = time.time()
+                free = [i for i, free_time in enumerate(self.slot_free_times) if free_time <= now]
+                if not free:
+                    return None
+                slot = free[0]
+                self.slot_free_times[slot] = math.inf
+            else:
+                slot = -1
+            self.running += 1
+            self.stats['max_running'] = max(self.stats['max_running'], self.running)
+            return slot
+
+    def release_slot(self, slot):
+        with self.lock:
+            self.running -= 1
+            if slot >= 0:
+                self.slot_free_times[slot] = time.time() + self.slot_cooldown
+
+    def status_text(self):
+        """
+        Make the text of an Overpass status response.
+
+        Returns
+        -------
+        string
+        """
+        now = time.time()
+        with self.lock:
+            free_times = list(self.slot_free_times)
+            running = self.running
+        lines = ['Connected as: 1',
+                 'Current time: {}'.format(_format_time(now)),
+                 'Rate limit: {}'.format(self.slots)]
+        available = len([t for t in free_times if t <= now])
+        cooling = sorted(t for t in free_times if now < t < math.inf)
+        if self.slots == 0 or available > 0:
+            lines.append('{} slots available now.'.format(available if self.slots > 0 else 1))
+        for free_time in cooling:
+            lines.append('Slot available after: {}, in {} seconds.'.format(_format_time(free_time),
+                                                                           int(math.ceil(free_time - now))))
+        lines.append('Currently running queries (pid, space limit, time limit, start time):')
+        lines.extend('{}\t536870912\t180\t{}'.format(pid, _format_time(now)) for pid in range(running))
+        return '\n'.join(lines) + '\n'
+
+    def query_elements(self, query):
+        """
+        Get the elements answering an Overpass query.
+
+        Parameters
+        ----------
+        query : string
+            the Overpass QL query
+
+        Returns
+        -------
+        list
+        """
+        bbox = _query_bbox(query)
+        if bbox is None:
+            node_ids = set(self.nodes)
+        else:
+            south, west, north, east = bbox
+            node_ids = set(node_id for node_id, node in self.nodes.items()
+                           if south <= node['lat'] <= north and west <= node['lon'] <= east)
+        ways = [way for way in self.ways.values() if any(node_id in node_ids for node_id in way['nodes'])]
+        way_node_ids = set(node_id for way in ways for node_id in way['nodes'])
+        nodes = [self.nodes[node_id] for node_id in sorted(way_node_ids) if node_id in self.nodes]
+        return ways + nodes
+
+    def search(self, query):
+        """
+        Get the Nominatim search results for a query.
+
+        Parameters
+        ----------
+        query : string
+
+        Returns
+        -------
+        list
+        """
+        if query in self.places:
+            return self.places[query]
+        if not self.nodes:
+            return []
+        lats = [node['lat'] for node in self.nodes.values()]
+        lons = [node['lon'] for node in self.nodes.values()]
+        south, north, west, east = min(lats), max(lats), min(lons), max(lons)
+        return [{'place_id': 1,
+                 'osm_type': 'relation',
+                 'osm_id': 1,
+                 'boundingbox': [str(south), str(north), str(west), str(east)],
+                 'lat': str((south + north) / 2),
+                 'lon': str((west + east) / 2),
+                 'display_name': query,
+                 'class': 'boundary',
+                 'type': 'administrative',
+                 'importance': 1,
+                 'geojson': {'type': 'Polygon',
+                             'coordinates': [[[west, south], [east, south], [east, north],
+                                              [west, north], [west, south]]]}}]
+
+
+    def lookup(self, osm_ids):
+        """
+        Get the Nominatim lookup results for some OSM ids, among the results
+        of the places passed in.
+
+        Parameters
+        ----------
+        osm_ids : list
+            OSM ids prefixed by their type, e.g., 'R175905'
+
+        Returns
+        -------
+        list
+        """
+        results = {}
+        for place_results in self.places.values():
+            for result in place_results:
+                results['{}{}'.format(result['osm_type'][0].upper(), result['osm_id'])] = result
+        return [results[osm_id.upper()] for osm_id in osm_ids if osm_id.upper() in results]
+
+
+class _StubRequestHandler(BaseHTTPRequestHandler):
+
+    server_stub = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        self.handle_request(url.path, parse_qs(url.query))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length).decode('utf-8')
+        self.handle_request(urlsplit(self.path).path, parse_qs(body))
+
+    def handle_request(self, path, params):
+        stub = self.server_stub
+        path = path.rstrip('/')
+        stub.stats['requests'][path] += 1
+
+        if path == '/api/status':
+            self.respond(200, stub.status_text(), 'text/plain')
+            return
+        if path not in ('/api/interpreter', '/search', '/lookup'):
+            self.respond(404, 'Not found', 'text/plain')
+            return
+
+        if path == '/api/interpreter':
+            # the query stops counting as in flight once its response is
+            # ready, before it is sent and the client can send another
+            stub.enter_query()
+            try:
+                status_code, text = self.answer_query(params)
+            finally:
+                stub.leave_query()
+            self.respond(status_code, text, 'application/json' if status_code == 200 else 'text/plain')
+            return
+
+        error = stub.next_error()
+        if error is not None:
+            self.respond(error, 'Injected error', 'text/plain')
+            return
+
+        if path == '/search':
+            query = params.get('q', [''])[0]
+            self.respond(200, json.dumps(stub.search(query)), 'application/json')
+            return
+        if path == '/lookup':
+            osm_ids = params.get('osm_ids', [''])[0].split(',')
+            self.respond(200, json.dumps(stub.lookup(osm_ids)), 'application/json')
+            return
+
+    def answer_query(self, params):
+        """
+        Answer an Overpass query, or reject it with an injected error or a 429
+        if no slot is free.
+
+        Parameters
+        ----------
+        params : dict
+            the query's parameters
+
+        Returns
+        -------
+        status_code, text : tuple
+        """
+        stub = self.server_stub
+        error = stub.next_error()
+        if error is not None:
+            return error, 'Injected error'
+
+        slot = stub.take_slot()
+        if slot is None:
+            return 429, 'Too many requests'
+        try:
+            time.sleep(stub.latency)
+            query = params.get('data', [''])[0]
+            response_json = {'version': 0.6,
+                             'generator': 'osmnx stub server',
+                             'osm3s': {'timestamp_osm_base': _format_time(time.time())},
+                             'elements': stub.query_elements(query)}
+        finally:
+            stub.release_slot(slot)
+        return 200, json.dumps(response_json)
+
+    def respond(self, status_code, text, content_type):
+        self.server_stub.stats['status_codes'][status_code] += 1
+        body = text.encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _load_elements(filenames):
+    """
+    Load the nodes and ways of OSM XML and Overpass JSON files.
+
+    Parameters
+    ----------
+    filenames : list
+
+    Returns
+    -------
+    tuple
+        dicts of nodes and of ways, keyed by id
+    """
+    nodes = {}
+    ways = {}
+    for filename in filenames:
+        if filename.endswith('.json'):
+            with open(filename) as f:
+                elements = json.load(f)['elements']
+        else:
+            elements = overpass_json_from_file(filename)['elements']
+        for element in elements:
+            if element['type'] == 'node':
+                nodes[element['id']] = element
+            elif element['type'] == 'way':
+                ways[element['id']] = element
+    return nodes, ways
+
+
+def _query_bbox(query):
+    """
+    Get the bounding box of an Overpass query's (south,west,north,east) or
+    (poly:"lat lon ...") filter.
+
+    Parameters
+    ----------
+    query : string
+
+    Returns
+    -------
+    tuple or None
+        (south, west, north, east)
+    """
+    match = re.search(r'\(poly:"([^"]+)"\)', query)
+    if match:
+        coords = [float(x) for x in match.group(1).split()]
+        lats, lons = coords[0::2], coords[1::2]
+        return min(lats), min(lons), max(lats), max(lons)
+    match = re.search(r'\((-?[\d.]+),(-?[\d.]+),(-?[\d.]+),(-?[\d.]+)\)', query)
+    if match:
+        return tuple(float(x) for x in match.groups())
+    return None
+
+
+def _format_time(timestamp):
+    return dt.datetime.fromtimestamp(timestamp, dt.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
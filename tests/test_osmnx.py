@@ -107,6 +107,350 @@ def test_geometry_coords_rounding():
     shape2 = ox.round_shape_coords(shape1, precision)
 
 
+def test_cache():
+    # test the cache layouts, legacy fallback, and eviction
+    import time
+
+    url = 'http://example.com/api/interpreter?data=test'
+    response_json = {'elements': [{'type': 'node', 'id': 1, 'lat': 0.0, 'lon': 0.0}]}
+
+    # save flat and uncompressed, then read back after switching layouts
+    ox.save_to_cache(url, response_json)
+    legacy_filepath = ox.url_in_cache(url)
+    ox.config(use_cache=True, cache_folder='.temp/cache', cache_shard_depth=2, cache_compression='gzip')
+    assert ox.url_in_cache(url) == legacy_filepath
+    assert ox.get_from_cache(url) == response_json
+
+    # save sharded and compressed
+    ox.save_to_cache(url, response_json)
+    filepath = ox.url_in_cache(url)
+    assert filepath.endswith('.json.gz')
+    assert os.path.dirname(os.path.dirname(os.path.dirname(filepath))) == os.path.join('.temp', 'cache')
+    assert ox.get_from_cache(url) == response_json
+
+    # expire and evict
+    ox.config(use_cache=True, cache_folder='.temp/cache', cache_ttl=60)
+    old_time = time.time() - 120
+    os.utime(legacy_filepath, (old_time, old_time))
+    assert ox.url_in_cache(url) is None
+    assert ox.prune_cache() == 1
+    ox.save_to_cache(url + '2', response_json)
+    assert ox.prune_cache(max_size=1) == 2
+
+    # in-memory tier in front of the cache folder
+    ox.config(use_cache=True, cache_folder='.temp/cache', cache_memory_max_size=1000000)
+    ox.clear_memory_cache()
+    ox.save_to_cache(url, response_json)
+    ox.clear_memory_cache()
+    assert ox.get_from_cache(url) == response_json
+    assert ox.get_from_cache(url) is ox.get_from_cache(url)
+    assert ox.get_from_cache(url + '3') is None
+    stats = ox.get_cache_stats()
+    assert (stats['memory_hits'], stats['disk_hits'], stats['misses']) == (2, 1, 1)
+
+    # single-file sqlite cache backend
+    ox.config(use_cache=True, cache_folder='.temp/cache', cache_backend='sqlite', cache_ttl=60)
+    bbox_url = 'http://example.com/api/interpreter?data=%28way%2837.78%2C-122.43%2C37.79%2C-122.41%29%3B%29'
+    assert ox.get_from_cache(bbox_url) is None
+    ox.save_to_cache(bbox_url, response_json)
+    assert ox.url_in_cache(bbox_url).endswith('cache.sqlite')
+    assert ox.get_from_cache(bbox_url) == response_json
+    assert ox.prune_cache(max_size=1) == 1
+    assert ox.url_in_cache(bbox_url) is None
+
+    ox.config(log_console=True, log_file=True, use_cache=True,
+              data_folder='.temp/data', logs_folder='.temp/logs',
+              imgs_folder='.temp/imgs', cache_folder='.temp/cache')
+
+
+def test_cache_msgpack():
+    # test the binary cache format and its fallback to json cache files
+    import json
+    import pytest
+    pytest.importorskip('msgpack')
+    with open('tests/input_data/clapham_common.json') as f:
+        response_json = json.load(f)
+
+    json_url = 'http://example.com/api/interpreter?data=json'
+    ox.save_to_cache(json_url, response_json)
+    ox.config(use_cache=True, cache_folder='.temp/cache', cache_format='msgpack')
+    assert ox.get_from_cache(json_url) == response_json
+
+    msgpack_url = 'http://example.com/api/interpreter?data=msgpack'
+    ox.save_to_cache(msgpack_url, response_json)
+    assert ox.url_in_cache(msgpack_url).endswith('.msgpack')
+    cached_response_json = ox.get_from_cache(msgpack_url)
+    assert isinstance(cached_response_json['elements'], ox.ColumnarElements)
+    assert list(cached_response_json['elements']) == response_json['elements']
+
+    # elements keep their order even when nodes and ways are interleaved
+    mixed_json = {'elements': [response_json['elements'][-1]] + response_json['elements'][:-1]}
+    assert list(ox.unpack_response(ox.pack_response(mixed_json))['elements']) == mixed_json['elements']
+
+    # other payloads, like nominatim's list of results, are stored as they are
+    nominatim_json = [{'place_id': 1, 'osm_type': 'relation', 'display_name': 'Clapham Common'}]
+    assert ox.unpack_response(ox.pack_response(nominatim_json)) == nominatim_json
+    nominatim_url = 'http://example.com/search?q=clapham'
+    ox.save_to_cache(nominatim_url, nominatim_json)
+    ox.clear_memory_cache()
+    assert ox.get_from_cache(nominatim_url) == nominatim_json
+
+    ox.config(log_console=True, log_file=True, use_cache=True,
+              data_folder='.temp/data', logs_folder='.temp/logs',
+              imgs_folder='.temp/imgs', cache_folder='.temp/cache')
+
+
+def test_tile_bboxes():
+    # test snapping query areas onto the global tile grid
+    north, south, east, west = 37.79, 37.78, -122.41, -122.43
+    tiles1 = ox.get_tile_bboxes(ox.bbox_to_poly(north, south, east, west), tile_size=0.01)
+    tiles2 = ox.get_tile_bboxes(ox.bbox_to_poly(north, south + 0.001, east + 0.001, west), tile_size=0.01)
+    assert tiles1 == [(-122.43, 37.78, -122.42, 37.79), (-122.42, 37.78, -122.41, 37.79)]
+    assert set(tiles1) < set(tiles2)
+
+
+def test_streamed_elements():
+    # test parsing overpass elements incrementally, in chunks small enough to
+    # split values across them
+    import io
+    import json
+    with open('tests/input_data/clapham_common.json') as f:
+        response_json = json.load(f)
+    text_stream = io.StringIO(json.dumps(response_json))
+    elements = list(ox.iter_overpass_elements(text_stream, chunk_size=7))
+    assert elements == response_json['elements']
+
+    # a streamed body that is not json, or that fails partway through, is
+    # neither cached nor left behind in a temp file
+    import pytest
+    from osmnx import downloader
+
+    class Response(object):
+        def __init__(self, chunks):
+            self.chunks = chunks
+
+        def iter_content(self, chunk_size):
+            for chunk in self.chunks:
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+
+    ox.config(use_cache=True, cache_folder='.temp/stream_cache')
+    url = 'http://example.com/api/interpreter?data=stream'
+    for chunks, error in (([b'<html>busy</html>'], ValueError), ([b'{"elements": [', IOError('reset')], IOError)):
+        with pytest.raises(error):
+            downloader._save_streamed_response(url, Response(chunks))
+        assert ox.url_in_cache(url) is None
+        assert not any(filename.endswith('.tmp') for _, _, filenames in os.walk('.temp/stream_cache')
+                       for filename in filenames)
+
+    # streamed responses, saved or fetched from the cache, can still be
+    # iterated after the cache file is evicted
+    saved = downloader._save_streamed_response(url, Response([json.dumps(response_json).encode('utf-8')]))
+    fetched = downloader._get_streamed_from_cache(url)
+    assert ox.prune_cache(max_size=1) == 1
+    assert ox.url_in_cache(url) is None
+    assert list(saved['elements']) == response_json['elements']
+    assert list(fetched['elements']) == response_json['elements']
+
+    ox.config(log_console=True, log_file=True, use_cache=True,
+              data_folder='.temp/data', logs_folder='.temp/logs',
+              imgs_folder='.temp/imgs', cache_folder='.temp/cache')
+
+
+def test_offline():
+    # test serving requests only from the cache in offline mode
+    import pytest
+    import requests
+    from osmnx.errors import OfflineCacheMiss
+    ox.config(use_cache=True, cache_folder='.temp/offline_cache', offline=True)
+    data = {'data': '[out:json];node(1);out;'}
+    with pytest.raises(OfflineCacheMiss):
+        ox.overpass_request(data=data)
+    with pytest.raises(OfflineCacheMiss):
+        ox.nominatim_request(params={'q': 'Nowhere', 'format': 'json'})
+
+    # api keys are left out of the error message
+    from osmnx.downloader import _check_offline
+    with pytest.raises(OfflineCacheMiss) as excinfo:
+        _check_offline('https://maps.googleapis.com/maps/api/elevation/json?locations=1,2&key=SECRET')
+    assert 'SECRET' not in str(excinfo.value)
+
+    url = ox.get_overpass_endpoints()[0] + '/interpreter'
+    prepared_url = requests.Request('GET', url, params=data).prepare().url
+    ox.save_to_cache(prepared_url, {'elements': []})
+    assert ox.overpass_request(data=data) == {'elements': []}
+
+    ox.config(log_console=True, log_file=True, use_cache=True,
+              data_folder='.temp/data', logs_folder='.temp/logs',
+              imgs_folder='.temp/imgs', cache_folder='.temp/cache')
+
+
+def test_stub_server():
+    # test the download pipeline end to end against the local stand-in server,
+    # with limited slots and injected errors to retry
+    from stub_server import StubServer
+    with StubServer(['tests/input_data/West-Oakland.osm.bz2'], latency=0.05, slots=2,
+                    errors=[429, 504]) as stub:
+        ox.config(use_cache=False, overpass_endpoint=stub.overpass_endpoint,
+                  nominatim_endpoint=stub.nominatim_endpoint, retry_backoff_base=0.01,
+                  retry_backoff_max=0.1, overpass_concurrent_requests=4)
+        gdf = ox.gdf_from_place('West Oakland, California, USA')
+        west, south, east, north = gdf['geometry'].iloc[0].bounds
+        datas = []
+        for i in range(4):
+            query_str = '[out:json];(way["highway"]({:.6f},{:.6f},{:.6f},{:.6f});>;);out;'.format(
+                south, west + (east - west) * i / 4, north, west + (east - west) * (i + 1) / 4)
+            datas.append({'data': query_str})
+        response_jsons = ox.overpass_requests_parallel(datas)
+        G = ox.create_graph(response_jsons, retain_all=True)
+
+    assert len(G.nodes()) > 0
+    assert stub.stats['max_in_flight'] <= 2
+    assert stub.stats['status_codes'][429] >= 1 and stub.stats['status_codes'][504] == 1
+
+    # the retry deadline counts from when the request began, across every
+    # generator of pauses drawn from the same policy
+    import time
+    retry_policy = ox.RetryPolicy(max_attempts=10, backoff_base=0.01, deadline=1, start_time=time.time() - 2)
+    assert list(retry_policy.pauses()) == []
+    retry_policy = ox.RetryPolicy(max_attempts=10, backoff_base=0.01, backoff_max=0.01, deadline=60)
+    assert len(list(retry_policy.pauses())) == 9
+
+    ox.config(log_console=True, log_file=True, use_cache=True,
+              data_folder='.temp/data', logs_folder='.temp/logs',
+              imgs_folder='.temp/imgs', cache_folder='.temp/cache')
+
+
+def test_prewarm_cache():
+    # test prewarming the cache makes all the queries' requests in one pool
+    # capped by the server's slots
+    from stub_server import StubServer
+    with StubServer(['tests/input_data/West-Oakland.osm.bz2'], latency=0.05, slots=2) as stub:
+        ox.config(use_cache=True, cache_folder='.temp/prewarm_cache', overpass_endpoint=stub.overpass_endpoint,
+                  overpass_concurrent_requests=4)
+        bboxes = [(37.8095, 37.8035, -122.2955 - i * 0.005, -122.3035 - i * 0.005) for i in range(3)]
+        ox.prewarm_cache(bboxes, clean_periphery=False)
+        assert stub.stats['max_in_flight'] <= 2 and stub.stats['status_codes'][429] == 0
+
+        # every query can then be served from the cache
+        ox.config(use_cache=True, cache_folder='.temp/prewarm_cache', overpass_endpoint=stub.overpass_endpoint,
+                  offline=True)
+        for bbox in bboxes:
+            G = ox.graph_from_bbox(*bbox, clean_periphery=False, simplify=False, retain_all=True)
+            assert len(G.nodes()) > 0
+        assert stub.stats['requests']['/api/interpreter'] == len(bboxes)
+
+    ox.config(log_console=True, log_file=True, use_cache=True,
+              data_folder='.temp/data', logs_folder='.temp/logs',
+              imgs_folder='.temp/imgs', cache_folder='.temp/cache')
+
+
+def test_overpass_slots():
+    # test checking a slot in the cached status does not claim it, and
+    # claiming consumes the free slots
+    import time
+    from osmnx import downloader
+    endpoint = 'http://overpass.invalid/api'
+    downloader._overpass_status[endpoint] = {'rate_limit': 2, 'available_slots': 1, 'slot_times': [],
+                                             'busy': False, 'probe_time': time.time()}
+    assert downloader._check_overpass_slot(endpoint) == 0
+    assert downloader._check_overpass_slot(endpoint) == 0
+    assert downloader._claim_overpass_slot(endpoint) == 0
+    assert downloader._overpass_status[endpoint]['available_slots'] == 0
+
+    # choosing among mirrors skips a busy one without waiting on it, and
+    # claims a slot only at the chosen one
+    busy_endpoint = 'http://busy.overpass.invalid/api'
+    downloader._overpass_status[busy_endpoint] = {'rate_limit': 2, 'available_slots': 0, 'slot_times': [],
+                                                  'busy': True, 'probe_time': time.time()}
+    downloader._overpass_status[endpoint]['available_slots'] = 2
+    ox.config(overpass_endpoint=[busy_endpoint, endpoint])
+    start_time = time.time()
+    assert ox.choose_overpass_endpoint() == (endpoint, 0)
+    assert time.time() - start_time < 1
+    assert downloader._overpass_status[endpoint]['available_slots'] == 1
+    assert 'claimed' not in downloader._overpass_status[busy_endpoint]
+    for status_endpoint in (endpoint, busy_endpoint):
+        downloader._forget_overpass_status(status_endpoint)
+
+    ox.config(log_console=True, log_file=True, use_cache=True,
+              data_folder='.temp/data', logs_folder='.temp/logs',
+              imgs_folder='.temp/imgs', cache_folder='.temp/cache')
+
+
+def test_geocode_to_gdf():
+    # test batch geocoding deduplicates queries and looks up osm ids in batches
+    import pytest
+    from stub_server import StubServer
+    place = {'place_id': 2, 'osm_type': 'relation', 'osm_id': 2, 'lat': '1.5', 'lon': '1.5',
+             'boundingbox': ['1', '2', '1', '2'], 'display_name': 'Somewhere',
+             'geojson': {'type': 'Polygon', 'coordinates': [[[1, 1], [2, 1], [2, 2], [1, 1]]]}}
+    with StubServer(places={'Somewhere': [place]}) as stub:
+        ox.config(use_cache=True, cache_folder='.temp/geocode_cache',
+                  nominatim_endpoint=stub.nominatim_endpoint)
+        gdf = ox.geocode_to_gdf(['Somewhere', ' somewhere ', 'SOMEWHERE'])
+        assert len(gdf) == 3 and stub.stats['requests']['/search'] == 1
+        assert list(gdf['osm_id']) == [2, 2, 2]
+
+        # the first spelling is requested, so other functions share its cache
+        # entry, and mismatched which_results are rejected
+        assert ox.osm_polygon_download('Somewhere') == [place]
+        assert stub.stats['requests']['/search'] == 1
+        with pytest.raises(ValueError):
+            ox.geocode_to_gdf(['Somewhere', 'Elsewhere'], which_results=[1])
+
+        gdf = ox.geocode_to_gdf(['R2', 'W3'], by_osmid=True)
+        gdf = ox.geocode_to_gdf(['R2', 'W3'], by_osmid=True)
+        assert len(gdf) == 1 and stub.stats['requests']['/lookup'] == 1
+
+    ox.config(log_console=True, log_file=True, use_cache=True,
+              data_folder='.temp/data', logs_folder='.temp/logs',
+              imgs_folder='.temp/imgs', cache_folder='.temp/cache')
+
+
+def test_osm_arrays():
+    # test parsing elements into arrays, removing consecutive duplicate nodes
+    # and deduplicating elements across responses
+    response_json = {'elements': [{'type': 'node', 'id': 1, 'lat': 0.0, 'lon': 0.0, 'tags': {'highway': 'stop'}},
+                                  {'type': 'node', 'id': 2, 'lat': 1.0, 'lon': 1.0},
+                                  {'type': 'way', 'id': 3, 'nodes': [1, 1, 2], 'tags': {'name': 'A'}}]}
+    response_json_updated = {'elements': [{'type': 'node', 'id': 2, 'lat': 2.0, 'lon': 2.0},
+                                          {'type': 'way', 'id': 3, 'nodes': [2, 1], 'tags': {'name': 'B'}}]}
+    osm_arrays = ox.merge_osm_arrays([ox.parse_osm_arrays(response_json),
+                                      ox.parse_osm_arrays(response_json_updated)])
+    assert ox.get_nodes_from_arrays(osm_arrays) == [(1, {'y': 0.0, 'x': 0.0, 'osmid': 1, 'highway': 'stop'}),
+                                                    (2, {'y': 2.0, 'x': 2.0, 'osmid': 2})]
+    assert ox.get_paths_from_arrays(osm_arrays) == {3: {'osmid': 3, 'nodes': [2, 1], 'name': 'B'}}
+    assert list(ox.parse_osm_arrays(response_json)['path_nodes']) == [1, 2]
+
+    # parsing in worker processes gives the same arrays
+    osm_arrays_parallel = ox.merge_osm_arrays(ox.parse_osm_arrays_parallel([response_json, response_json_updated],
+                                                                           processes=2))
+    assert ox.get_nodes_from_arrays(osm_arrays_parallel) == ox.get_nodes_from_arrays(osm_arrays)
+    assert ox.get_paths_from_arrays(osm_arrays_parallel) == ox.get_paths_from_arrays(osm_arrays)
+
+    # no responses at all is an empty response
+    import pytest
+    from osmnx.errors import EmptyOverpassResponse
+    assert len(ox.merge_osm_arrays([])['node_ids']) == 0
+    with pytest.raises(EmptyOverpassResponse):
+        ox.create_graph([])
+
+
+def test_add_paths():
+    import networkx as nx
+    # test adding paths in bulk keeps the order and keys of adding them one at
+    # a time: each path forward, then reversed if it is not one-way
+    paths = {1: {'osmid': 1, 'nodes': [1, 2, 3], 'oneway': '-1'},
+             2: {'osmid': 2, 'nodes': [1, 2]},
+             3: {'osmid': 3, 'nodes': [4, 5, 4], 'junction': 'roundabout'}}
+    G = ox.add_paths(nx.MultiDiGraph(), paths)
+    assert list(G.edges(keys=True, data='osmid')) == [(3, 2, 0, 1), (2, 1, 0, 1), (2, 1, 1, 2), (1, 2, 0, 2),
+                                                      (4, 5, 0, 3), (5, 4, 0, 3)]
+    assert G.edges[1, 2, 0]['oneway'] is False and G.edges[3, 2, 0]['oneway'] is True
+
+
 def test_gdf_shapefiles():
     # test loading spatial boundaries, saving as shapefile, and plotting
     city = ox.gdf_from_place('Manhattan, New York City, New York, USA')
@@ -138,6 +482,7 @@ def test_stats():
 def test_graph_from_file():
     # test loading a graph from a local .osm file
     import bz2, tempfile
+    import networkx as nx
 
     node_id = 53098262
     neighbor_ids = 53092170, 53060438, 53027353, 667744075
@@ -159,6 +504,70 @@ def test_graph_from_file():
 
     os.remove(temp_filename)
 
+    # the streamed xml arrays match parsing the file into overpass-like json,
+    # with a small chunk size to split elements across chunks
+    filename = 'tests/input_data/West-Oakland.osm.bz2'
+    osm_arrays = ox.parse_osm_xml_arrays(filename, chunk_size=1000)
+    osm_arrays_json = ox.parse_osm_arrays(ox.overpass_json_from_file(filename))
+    assert ox.get_nodes_from_arrays(osm_arrays) == ox.get_nodes_from_arrays(osm_arrays_json)
+    assert ox.get_paths_from_arrays(osm_arrays) == ox.get_paths_from_arrays(osm_arrays_json)
+
+    # the same extract as pbf, in two blocks decoded in parallel, gives the
+    # same arrays and graph
+    pbf_filename = 'tests/input_data/West-Oakland.osm.pbf'
+    osm_arrays_pbf = ox.merge_osm_arrays(ox.parse_osm_pbf_arrays(pbf_filename, processes=2))
+    assert ox.get_nodes_from_arrays(osm_arrays_pbf) == ox.get_nodes_from_arrays(osm_arrays)
+    assert ox.get_paths_from_arrays(osm_arrays_pbf) == ox.get_paths_from_arrays(osm_arrays)
+    G = ox.graph_from_file(pbf_filename)
+    assert list(G.edges(keys=True, data=True)) == list(ox.graph_from_file(filename).edges(keys=True, data=True))
+
+    # filtering the ways while parsing either format keeps just the drivable
+    # ways and their nodes
+    clauses = ox.parse_osm_filter('["highway"][!"foo"]["name"="A"]["ref"!~"^b",i]')
+    assert ox.osm_filter_matches({'highway': 'service', 'name': 'A', 'ref': 'a'}, clauses)
+    assert not ox.osm_filter_matches({'highway': 'service', 'name': 'A', 'ref': 'B'}, clauses)
+    for drive_filename in (filename, pbf_filename):
+        G = ox.graph_from_file(drive_filename, network_type='drive', retain_all=True, simplify=False)
+        assert set(highway for _, _, highway in G.edges(data='highway')) == {'residential', 'secondary', 'unclassified'}
+        assert all(G.degree(node) > 0 for node in G.nodes)
+
+    # clipping to a bounding box while parsing either format gives the same
+    # graph as truncating the whole file's graph
+    bbox = {'north': 37.8095, 'south': 37.8035, 'east': -122.2955, 'west': -122.3035}
+    G = ox.graph_from_file(filename, simplify=False, retain_all=True)
+    G = ox.truncate_graph_bbox(G, retain_all=True, **bbox)
+    for clip_filename in (filename, pbf_filename):
+        G_clipped = ox.graph_from_file(clip_filename, simplify=False, retain_all=True, **bbox)
+        assert sorted(G_clipped.nodes) == sorted(G.nodes)
+        assert sorted(G_clipped.edges(keys=True, data='osmid')) == sorted(G.edges(keys=True, data='osmid'))
+
+    # a tagged node that ends a batch of clipped nodes outside the polygon
+    # does not leave its tags on the previous node
+    handle, temp_filename = tempfile.mkstemp(suffix='.osm')
+    with os.fdopen(handle, 'w') as f:
+        f.write('<osm>')
+        f.write(''.join('<node id="{}" lat="0.5" lon="0.5"/>'.format(i) for i in range(1, 65536)))
+        f.write('<node id="65536" lat="5" lon="5"><tag k="highway" v="traffic_signals"/></node></osm>')
+    osm_arrays_clipped = ox.parse_osm_xml_arrays(temp_filename, polygon=ox.bbox_to_poly(1, 0, 1, 0))
+    os.remove(temp_filename)
+    assert len(osm_arrays_clipped['node_ids']) == 65535
+    assert all(node_tags is None for node_tags in osm_arrays_clipped['node_tags'].get('highway', []))
+
+    # compact edge attributes share each way's interned tags across its
+    # edges, take up less memory, and still route, simplify, and save
+    G = ox.create_graph_from_arrays(osm_arrays)
+    G_compact = ox.create_graph_from_arrays(osm_arrays, compact=True)
+    assert list(G_compact.edges(keys=True, data=True)) == list(G.edges(keys=True, data=True))
+    assert isinstance(G_compact.edges[node_id, neighbor_ids[0], 0], ox.EdgeAttributes)
+    assert ox.get_edge_attributes_size(G_compact) < ox.get_edge_attributes_size(G)
+    route = nx.shortest_path(G_compact, node_id, neighbor_ids[0], weight='length')
+    assert route == nx.shortest_path(G, node_id, neighbor_ids[0], weight='length')
+    G_compact.edges[node_id, neighbor_ids[0], 0]['name'] = 'A'
+    assert [name for _, _, name in G_compact.edges(data='name')].count('A') == 1
+    G_compact = ox.simplify_graph(G_compact)
+    ox.save_graphml(G_compact, filename='compact.graphml')
+    ox.graph_to_gdfs(G_compact)
+
 
 def test_network_saving_loading():
 
@@ -369,6 +778,23 @@ def test_footprints():
                                    custom_settings=test_custom_settings)
 
 
+def test_footprints_from_file():
+    # multipolygon.osm contains a building relation with 1 outer and 1 inner
+    # closed way, an untagged node, a cafe node, and a service road
+    response = ox.overpass_json_from_file('tests/input_data/multipolygon.osm')
+    relation = response['elements'][-1]
+    assert relation['type'] == 'relation' and relation['tags']['building'] == 'yes'
+    assert relation['members'][1] == {'type': 'way', 'ref': 21, 'role': 'inner'}
+
+    # selecting the relation recurses down to its ways and their nodes
+    selected = ox.select_overpass_elements(response, lambda element: element['type'] == 'relation')
+    assert [element['id'] for element in selected['elements']] == [1, 2, 3, 4, 5, 6, 7, 8, 20, 21, 30]
+
+    gdf = ox.footprints_from_file('tests/input_data/multipolygon.osm')
+    assert list(gdf.index) == [30]
+    assert len(gdf.loc[30, 'geometry'].interiors) == 1
+
+
 def test_pois():
 
     tags = {'amenity' : True,
@@ -390,6 +816,9 @@ def test_pois():
                              timeout=200,
                              memory=100000)
 
+    gdf = ox.pois_from_file('tests/input_data/multipolygon.osm', tags={'amenity' : 'cafe', 'building' : True})
+    assert set(gdf['osmid']) == {9, 30}
+
 
 def test_nominatim():
     import pytest